@@ -1,6 +1,8 @@
-from market import app, db
+from market import create_app, db
 from market.models import Item
 
+app = create_app()
+
 def add_item(name, price, barcode, description):
     """
     Adds a new item to the database within the Flask app's application context.
@@ -0,0 +1,122 @@
+"""
+Memory per item and query latency of the in-memory catalogue index, against
+holding the same items as ORM objects or row tuples and against asking SQLite.
+
+For each catalogue size a temporary SQLite database is seeded with unsold items
+at random prices. Memory is measured with tracemalloc while each representation
+is built; the queries are run repeatedly and the median time is reported.
+
+Usage:
+    python benchmarks/bench_catalogue_index.py --sizes 10000,100000,1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from market import create_app, db  # noqa: E402
+from market.catalogue import CatalogueIndex  # noqa: E402
+from market.models import Item  # noqa: E402
+
+QUERIES = [
+    ('price 1000-2000, by price, page 1', {'min_price': 1000, 'max_price': 2000, 'sort': 'price', 'page': 1}),
+    ('price 1000-2000, by name, page 1', {'min_price': 1000, 'max_price': 2000, 'sort': 'name', 'page': 1}),
+    ('price 2500-2510, by name, page 1', {'min_price': 2500, 'max_price': 2510, 'sort': 'name', 'page': 1}),
+    ('all, by -price, page 100', {'sort': '-price', 'page': 100}),
+    ('price >= 100, by -name, page 20', {'min_price': 100, 'sort': '-name', 'page': 20}),
+]
+
+
+def seed(size):
+    """
+    Inserts `size` unsold items with random prices in bulk.
+    """
+    rng = random.Random(size)
+    db.session.execute(Item.__table__.insert(), [
+        {'id': i, 'name': f'Item {rng.getrandbits(40):x}', 'price': rng.randint(1, 5000), 'barcode': f'{i:012d}',
+         'description': f'Description of item number {i}', 'description_hash': Item.hash_description(str(i))}
+        for i in range(1, size + 1)])
+    db.session.commit()
+
+
+def traced(build):
+    """
+    Builds a value and returns it with the seconds taken and the bytes it holds.
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    value = build()
+    elapsed = time.perf_counter() - started
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, elapsed, held
+
+
+def median_time(run, repeat=200):
+    """
+    Returns the median seconds of `run` over `repeat` calls.
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def sql_query(min_price=None, max_price=None, sort='price', page=1, per_page=50):
+    """
+    The same query asked of the database, as ad-hoc ORM filters would.
+    """
+    query = Item.query.filter(Item.owner.is_(None))
+    if min_price is not None:
+        query = query.filter(Item.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Item.price <= max_price)
+    column = Item.price if sort.lstrip('-') == 'price' else Item.name
+    query = query.order_by(column.desc() if sort.startswith('-') else column, Item.id)
+    return query.offset((page - 1) * per_page).limit(per_page).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000', help='comma-separated catalogue sizes')
+    args = parser.parse_args()
+
+    for size in [int(size) for size in args.sizes.split(',')]:
+        directory = tempfile.mkdtemp()
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'bench.db')}"})
+        index = CatalogueIndex()
+        index.init_app(app)
+        with app.app_context():
+            db.create_all()
+            seed(size)
+            print(f'{size:,} items')
+            with app.extensions['catalogue_index']['lock']:
+                snapshot, seconds, held = traced(index.snapshot)
+            started = time.perf_counter()
+            index._build()
+            print(f'  catalogue index  {held / size:7.1f} bytes/item traced, {snapshot.nbytes() / size:5.1f} in arrays, '
+                  f'built in {time.perf_counter() - started:.2f}s')
+            rows, seconds, held = traced(lambda: db.session.execute(
+                db.select(Item.id, Item.name, Item.price, Item.barcode).where(Item.owner.is_(None))).all())
+            print(f'  row tuples       {held / size:7.1f} bytes/item')
+            del rows
+            items, seconds, held = traced(lambda: Item.query.filter(Item.owner.is_(None)).all())
+            print(f'  ORM objects      {held / size:7.1f} bytes/item')
+            del items
+            db.session.expunge_all()
+            for label, query in QUERIES:
+                indexed = median_time(lambda: index.query(**query))
+                database = median_time(lambda: sql_query(**query), repeat=20)
+                print(f'  {label:<36} index {indexed * 1e6:8.1f} us   SQLite {database * 1e6:10.1f} us')
+
+
+if __name__ == '__main__':
+    main()
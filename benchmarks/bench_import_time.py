@@ -0,0 +1,80 @@
+"""
+Import-time benchmark for worker cold starts.
+
+Runs each startup step in a fresh interpreter with `python -X importtime`, several
+times, and reports the median wall time and the modules with the largest
+cumulative import time, so regressions in cold-start latency are easy to spot.
+
+Usage:
+    python benchmarks/bench_import_time.py --runs 5 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+STEPS = {
+    'import market': 'import market',
+    'create_app()': 'from market import create_app; create_app()',
+    'first request': ('from market import create_app; app = create_app(); '
+                      'app.test_client().get("/home")'),
+}
+
+
+def parse_importtime(stderr):
+    """
+    Parses `-X importtime` output.
+
+    Returns:
+        tuple: A dictionary of module name to cumulative microseconds, and the total
+        microseconds spent importing (the sum over modules imported at the top level).
+    """
+    modules = {}
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+        if len(name) - len(name.lstrip()) == 1:
+            total += int(cumulative)
+    return modules, total
+
+
+def measure(statement):
+    """
+    Runs a statement in a fresh interpreter and returns the wall time in seconds
+    and the parsed import times.
+    """
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    return (time.perf_counter() - started,) + parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per step')
+    parser.add_argument('--top', type=int, default=15, help='slowest modules listed for `import market`')
+    args = parser.parse_args()
+
+    for label, statement in STEPS.items():
+        timings = [measure(statement) for _ in range(args.runs)]
+        wall = statistics.median(wall for wall, _, _ in timings)
+        imports = statistics.median(total for _, _, total in timings)
+        print(f'{label:<15} wall {wall * 1000:7.1f} ms, imports {imports / 1000:7.1f} ms')
+
+    _, modules, _ = measure(STEPS['import market'])
+    print('\nslowest modules imported by `import market` (cumulative ms):')
+    for name, cumulative in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f'{cumulative / 1000:8.1f}  {name}')
+    for name in ('flask_migrate', 'alembic', 'requests'):
+        print(f'{name} imported: {name in modules}')
+
+
+if __name__ == '__main__':
+    main()
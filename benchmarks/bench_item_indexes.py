@@ -0,0 +1,130 @@
+"""
+Benchmark for the item listing and ownership queries.
+
+Builds two SQLite databases with the same data, one with the schema before the
+item indexes were added and one with the current models, then prints the query
+plans and timings of the market page queries and of the inserts.
+
+Usage:
+    python benchmarks/bench_item_indexes.py --items 100000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import create_engine  # noqa: E402
+from market import db  # noqa: E402
+from market.models import Item  # noqa: E402
+
+
+LEGACY_SCHEMA = """
+CREATE TABLE user (id INTEGER NOT NULL, username VARCHAR(30) NOT NULL, email_address VARCHAR(50) NOT NULL,
+    password_hash VARCHAR(60) NOT NULL, PRIMARY KEY (id), UNIQUE (username), UNIQUE (email_address));
+CREATE TABLE item (id INTEGER NOT NULL, name VARCHAR(30) NOT NULL, price INTEGER NOT NULL,
+    barcode VARCHAR(12) NOT NULL, description VARCHAR(1024) NOT NULL, owner INTEGER, PRIMARY KEY (id),
+    UNIQUE (name), UNIQUE (barcode), UNIQUE (description), FOREIGN KEY(owner) REFERENCES user (id));
+"""
+
+QUERIES = {
+    'unsold page (deep cursor)': "SELECT id, name, price, barcode FROM item "
+                                 "WHERE owner IS NULL AND id > :after ORDER BY id LIMIT 51",
+    'owned items': "SELECT id, name, price FROM item WHERE owner = :owner",
+    'unsold count': "SELECT count(*) FROM item WHERE owner IS NULL",
+}
+
+
+def generate_rows(count, users, sold_ratio):
+    """
+    Generates item rows with long descriptions, most of them sold to random users.
+    """
+    rng = random.Random(42)
+    filler = 'x' * 400
+    for i in range(1, count + 1):
+        owner = rng.randint(1, users) if rng.random() < sold_ratio else None
+        yield (i, f'item{i}', rng.randint(1, 5000), f'{i:012d}', f'Description {i} {filler}', owner)
+
+
+def seed(connection, count, users, sold_ratio, with_hash):
+    """
+    Inserts users and items into the database and returns the insert time in seconds.
+    """
+    connection.executemany(
+            "INSERT INTO user (id, username, email_address, password_hash) VALUES (?, ?, ?, ?)",
+            [(i, f'user{i}', f'user{i}@example.com', 'x' * 60) for i in range(1, users + 1)])
+    started = time.perf_counter()
+    if with_hash:
+        connection.executemany(
+                "INSERT INTO item (id, name, price, barcode, description, owner, description_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (row + (Item.hash_description(row[4]),) for row in generate_rows(count, users, sold_ratio)))
+    else:
+        connection.executemany(
+                "INSERT INTO item (id, name, price, barcode, description, owner) VALUES (?, ?, ?, ?, ?, ?)",
+                generate_rows(count, users, sold_ratio))
+    connection.commit()
+    elapsed = time.perf_counter() - started
+    connection.execute("ANALYZE")
+    return elapsed
+
+
+def time_query(connection, sql, params, repeat):
+    """
+    Runs a query `repeat` times and returns the average time in milliseconds.
+    """
+    started = time.perf_counter()
+    for _ in range(repeat):
+        connection.execute(sql, params).fetchall()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def report(label, connection, params, repeat, insert_seconds, items):
+    """
+    Prints the query plan and timing of every benchmarked query.
+    """
+    print(f'== {label} ==')
+    print(f'  insert: {insert_seconds:.2f}s ({items / insert_seconds:,.0f} rows/s)')
+    size = connection.execute("PRAGMA page_count").fetchone()[0] * connection.execute("PRAGMA page_size").fetchone()[0]
+    print(f'  database size: {size / 1024 / 1024:.1f} MiB')
+    for name, sql in QUERIES.items():
+        plan = '; '.join(row[3] for row in connection.execute(f'EXPLAIN QUERY PLAN {sql}', params))
+        print(f'  {name}: {time_query(connection, sql, params, repeat):.3f} ms')
+        print(f'    plan: {plan}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100000, help='number of items to seed')
+    parser.add_argument('--users', type=int, default=1000, help='number of users owning sold items')
+    parser.add_argument('--sold-ratio', type=float, default=0.9, help='fraction of items that are sold')
+    parser.add_argument('--repeat', type=int, default=50, help='runs per query')
+    args = parser.parse_args()
+
+    params = {'after': int(args.items * 0.9), 'owner': 1}
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_path = os.path.join(directory, 'legacy.db')
+        legacy = sqlite3.connect(legacy_path)
+        legacy.executescript(LEGACY_SCHEMA)
+        insert_seconds = seed(legacy, args.items, args.users, args.sold_ratio, with_hash=False)
+        report('before: no owner index, unique description', legacy, params, args.repeat, insert_seconds, args.items)
+        legacy.close()
+
+        indexed_path = os.path.join(directory, 'indexed.db')
+        engine = create_engine(f'sqlite:///{indexed_path}')
+        db.metadata.create_all(engine, tables=[db.metadata.tables['user'], Item.__table__])
+        engine.dispose()
+        indexed = sqlite3.connect(indexed_path)
+        indexed.execute("DROP TABLE IF EXISTS item_search")
+        insert_seconds = seed(indexed, args.items, args.users, args.sold_ratio, with_hash=True)
+        report('after: owner and unsold indexes, description hash', indexed, params, args.repeat,
+               insert_seconds, args.items)
+        indexed.close()
+
+
+if __name__ == '__main__':
+    main()
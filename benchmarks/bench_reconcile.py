@@ -0,0 +1,71 @@
+"""
+Throughput of `flask payments reconcile` against the local fake Paystack server.
+
+A temporary SQLite database is seeded with unsold items and one errored payment
+per item, each paid at the fake server, which answers every verify call after
+`--latency` seconds. The reconciliation is then run at each concurrency.
+
+Usage:
+    python benchmarks/bench_reconcile.py --payments 2000 --latency 0.2 --concurrency 1,20,50
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fake_paystack import FakePaystack  # noqa: E402
+from market import create_app, db  # noqa: E402
+from market.models import Item, Payment, User  # noqa: E402
+from market.reconcile import reconcile_payments  # noqa: E402
+
+
+def seed(size, fake):
+    """
+    Inserts `size` unsold items, each with an errored payment that was paid at Paystack.
+    """
+    db.session.execute(User.__table__.insert(), [
+        {'id': 1, 'username': 'buyer', 'email_address': 'buyer@example.com', 'password_hash': 'x' * 60}])
+    db.session.execute(Item.__table__.insert(), [
+        {'id': i, 'name': f'Item {i}', 'price': i % 5000 + 1, 'barcode': f'{i:012d}',
+         'description': f'Description of item number {i}', 'description_hash': Item.hash_description(str(i))}
+        for i in range(1, size + 1)])
+    db.session.execute(Payment.__table__.insert(), [
+        {'reference': f'purchase_{i}_1_{i}', 'item_id': i, 'user_id': 1, 'amount': (i % 5000 + 1) * 100,
+         'status': Payment.STATUS_ERROR}
+        for i in range(1, size + 1)])
+    db.session.commit()
+    for i in range(1, size + 1):
+        fake.add_transaction(f'purchase_{i}_1_{i}', (i % 5000 + 1) * 100, 'success')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payments', type=int, default=2000, help='outstanding payments to reconcile')
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds the fake server takes per call')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of calls answered with a 502')
+    parser.add_argument('--concurrency', default='1,20,50', help='comma-separated concurrency levels')
+    args = parser.parse_args()
+
+    fake = FakePaystack(latency=args.latency, failure_rate=args.failure_rate, seed=1).start()
+    try:
+        for concurrency in [int(level) for level in args.concurrency.split(',')]:
+            # Sequential runs would take too long at high latency, so they reconcile a sample
+            size = args.payments if concurrency > 1 else min(args.payments, 50)
+            directory = tempfile.mkdtemp()
+            app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'bench.db')}",
+                              'PAYSTACK_API_URL': fake.url, 'PAYSTACK_RETRIES': 0})
+            with app.app_context():
+                db.create_all()
+                seed(size, fake)
+                stats = reconcile_payments(concurrency=concurrency)
+            print(f'concurrency {concurrency:>4}  {stats["claimed"]:>6} payments in {stats["seconds"]:7.1f}s  '
+                  f'{stats["claimed"] / stats["seconds"] * 60:>9,.0f}/min  '
+                  f'{stats.get(Payment.STATUS_SUCCESS, 0)} success, {stats.get(Payment.STATUS_ERROR, 0)} error')
+    finally:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
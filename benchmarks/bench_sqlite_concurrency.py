@@ -0,0 +1,150 @@
+"""
+Concurrent read/write benchmark for the SQLite profile.
+
+Seeds a temporary SQLite database, then for a fixed time runs reader threads
+requesting `/market` pages while writer threads complete purchases through
+signed Paystack webhooks. Each write claims a payment, transfers the item and
+bumps the catalogue version in one transaction. The fragment cache is disabled
+so every page hits the database.
+
+The benchmark runs once with plain SQLite settings (rollback journal, no
+pragmas, one pool) and once with the production profile (WAL, tuned pragmas
+and separate read connections), each in a fresh interpreter, and prints the
+`/market` latency percentiles and the purchase throughput of both.
+
+Usage:
+    python benchmarks/bench_sqlite_concurrency.py --items 20000 --readers 8 --writers 4 --seconds 10
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+PROFILES = {
+    'default': {'SQLITE_PRAGMAS': {}, 'SQLITE_READ_CONNECTIONS': False},
+    'tuned': {},
+}
+
+
+def percentile(values, fraction):
+    """
+    Returns the value at the given fraction of the sorted values.
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_profile(args):
+    """
+    Runs the benchmark for one profile in this process and prints the results as JSON.
+    """
+    sys.path.insert(0, ROOT)
+    from market import create_app, db
+    from market.models import Item, User
+
+    directory = tempfile.mkdtemp()
+    config = dict(PROFILES[args.profile], SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+                  FRAGMENT_CACHE_BACKEND='none', PAYSTACK_SECRET_KEY='sk_bench')
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [
+            {'id': i, 'username': f'user{i}', 'email_address': f'user{i}@example.com', 'password_hash': 'x' * 60}
+            for i in range(1, 101)])
+        db.session.execute(Item.__table__.insert(), [
+            {'id': i, 'name': f'item{i}', 'price': 100, 'barcode': f'{i:012d}',
+             'description': f'Item number {i}', 'description_hash': Item.hash_description(f'Item number {i}')}
+            for i in range(1, args.items + 1)])
+        db.session.commit()
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    read_latencies, read_errors = [], 0
+    purchases, write_errors = 0, 0
+    next_item = iter(range(1, args.items + 1))
+
+    def reader(seed):
+        nonlocal read_errors
+        client = app.test_client()
+        rng = random.Random(seed)
+        while not stop.is_set():
+            after = rng.randrange(0, args.items)
+            started = time.perf_counter()
+            response = client.get(f'/market?after={after}')
+            elapsed = time.perf_counter() - started
+            with lock:
+                read_latencies.append(elapsed)
+                read_errors += response.status_code != 200
+
+    def writer():
+        nonlocal purchases, write_errors
+        client = app.test_client()
+        while not stop.is_set():
+            with lock:
+                item_id = next(next_item, None)
+            if item_id is None:
+                return
+            reference = f'purchase_{item_id}_{item_id % 100 + 1}_1'
+            body = json.dumps({'event': 'charge.success', 'data': {
+                'reference': reference, 'amount': 100 * 100, 'status': 'success'}}).encode('utf-8')
+            signature = hmac.new(b'sk_bench', body, hashlib.sha512).hexdigest()
+            response = client.post('/paystack/webhook', data=body, content_type='application/json',
+                                   headers={'X-Paystack-Signature': signature})
+            with lock:
+                if response.status_code == 200:
+                    purchases += 1
+                else:
+                    write_errors += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({
+        'reads': len(read_latencies),
+        'read_errors': read_errors,
+        'p50_ms': percentile(read_latencies, 0.5) * 1000,
+        'p95_ms': percentile(read_latencies, 0.95) * 1000,
+        'p99_ms': percentile(read_latencies, 0.99) * 1000,
+        'purchases_per_s': purchases / args.seconds,
+        'write_errors': write_errors,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=20000, help='items seeded')
+    parser.add_argument('--readers', type=int, default=8, help='threads requesting /market')
+    parser.add_argument('--writers', type=int, default=4, help='threads completing purchases')
+    parser.add_argument('--seconds', type=float, default=10.0, help='duration of each run')
+    parser.add_argument('--profile', choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.profile:
+        return run_profile(args)
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.items} items, {args.seconds:.0f}s per profile')
+    for profile in PROFILES:
+        command = [sys.executable, __file__, '--profile', profile, '--items', str(args.items),
+                   '--readers', str(args.readers), '--writers', str(args.writers), '--seconds', str(args.seconds)]
+        result = json.loads(subprocess.run(command, capture_output=True, text=True, check=True).stdout)
+        print(f"{profile:<8} /market p50 {result['p50_ms']:6.1f} ms, p95 {result['p95_ms']:6.1f} ms, "
+              f"p99 {result['p99_ms']:7.1f} ms, {result['reads']} reads ({result['read_errors']} errors); "
+              f"{result['purchases_per_s']:.0f} purchases/s ({result['write_errors']} errors)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Time-to-first-byte and peak memory of the full item list, rendered in one piece
+versus streamed from a `yield_per` cursor.
+
+For each catalogue size a temporary SQLite database is seeded. The page is then
+produced twice, discarding the output as it is generated:
+- built with render_template over all the unsold items
+- streamed through `/market/all`
+Peak memory is measured with tracemalloc.
+
+Usage:
+    python benchmarks/bench_streaming.py --sizes 1000,10000,100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import render_template  # noqa: E402
+from market import create_app, db  # noqa: E402
+from market.models import Item  # noqa: E402
+
+
+def seed(size):
+    """
+    Inserts `size` unsold items in bulk.
+    """
+    db.session.execute(Item.__table__.insert(), [
+        {'id': i, 'name': f'Item {i}', 'price': i % 5000 + 1, 'barcode': f'{i:012d}',
+         'description': f'Description of item number {i}', 'description_hash': Item.hash_description(str(i))}
+        for i in range(1, size + 1)])
+    db.session.commit()
+
+
+def measure(produce):
+    """
+    Consumes the chunks of a page and returns the seconds to the first chunk, the
+    total seconds and the peak of traced memory in bytes.
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    first = None
+    for _ in produce():
+        if first is None:
+            first = time.perf_counter() - started
+    total = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, total, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated catalogue sizes')
+    args = parser.parse_args()
+
+    for size in [int(size) for size in args.sizes.split(',')]:
+        directory = tempfile.mkdtemp()
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'bench.db')}",
+                          'CONDITIONAL_PAGES': False})
+        client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            seed(size)
+
+        def rendered():
+            with app.test_request_context('/market/all'):
+                yield render_template('all_items.html', items=Item.query.filter(Item.owner.is_(None)).all())
+
+        def streamed():
+            response = client.get('/market/all', buffered=False)
+            yield from response.response
+            response.close()
+
+        for name, produce in (('rendered', rendered), ('streamed', streamed)):
+            first, total, peak = measure(produce)
+            print(f'{size:>8} items  {name:<9} first byte {first * 1000:8.1f} ms  '
+                  f'total {total * 1000:8.1f} ms  peak memory {peak / 2 ** 20:7.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
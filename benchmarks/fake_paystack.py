@@ -0,0 +1,180 @@
+"""
+Local fake of the Paystack transaction API, for offline load tests.
+
+Implements the two endpoints the app uses, with optional injected latency and failures:
+
+    POST /transaction/initialize      records the reference and amount
+    GET  /transaction/verify/<ref>    reports the recorded transaction as paid
+
+It can also deliver signed `charge.success` webhooks to the app.
+
+Usage:
+    python benchmarks/fake_paystack.py --port 8099 --latency 0.2 --failure-rate 0.05
+    PAYSTACK_API_URL=http://127.0.0.1:8099/ python run.py
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakePaystack:
+    """
+    An in-process HTTP server mimicking the Paystack transaction API.
+
+    Attributes:
+        latency (float): Seconds to sleep before answering each request.
+        failure_rate (float): Fraction of requests answered with a 502 and a non-JSON body.
+        decline_rate (float): Fraction of transactions reported as failed payments.
+        verify_calls (int): The number of verify requests received.
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, decline_rate=0.0,
+                 secret_key='sk_test_fake', seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self.secret_key = secret_key
+        self.transactions = {}
+        self.verify_calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        The base URL of the fake API, in the form expected by PAYSTACK_API_URL.
+        """
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        """
+        Serves requests on a background thread.
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the server.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_transaction(self, reference, amount, status=None):
+        """
+        Records a transaction as if it had been initialized and paid.
+
+        Args:
+            reference (str): The transaction reference.
+            amount (int): The amount paid, in kobo.
+            status (str): The Paystack status to report, e.g. 'abandoned'. By default
+                the payment succeeds or, at `decline_rate`, fails.
+        """
+        with self._lock:
+            if status is None:
+                status = 'failed' if self._random.random() < self.decline_rate else 'success'
+            self.transactions[reference] = {'reference': reference, 'amount': amount, 'status': status}
+
+    def send_webhook(self, url, reference):
+        """
+        Delivers a signed `charge.success` webhook for a recorded transaction.
+
+        Args:
+            url (str): The webhook URL of the app.
+            reference (str): The transaction reference.
+
+        Returns:
+            int: The HTTP status returned by the app.
+        """
+        body = json.dumps({'event': 'charge.success', 'data': self.transactions[reference]}).encode('utf-8')
+        signature = hmac.new(self.secret_key.encode('utf-8'), body, hashlib.sha512).hexdigest()
+        request = urllib.request.Request(url, data=body, method='POST', headers={
+            'Content-Type': 'application/json', 'X-Paystack-Signature': signature})
+        with urllib.request.urlopen(request) as response:
+            return response.status
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _delay_or_fail(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if fake._should_fail():
+                    self._reply(502, b'<html>Bad Gateway</html>')
+                    return True
+                return False
+
+            def do_GET(self):
+                if not self.path.startswith('/transaction/verify/'):
+                    return self._reply(404, {'status': False, 'message': 'Not found'})
+                with fake._lock:
+                    fake.verify_calls += 1
+                if self._delay_or_fail():
+                    return
+                reference = self.path.rsplit('/', 1)[-1].split('?')[0]
+                transaction = fake.transactions.get(reference)
+                if transaction is None:
+                    return self._reply(400, {'status': False, 'message': 'Transaction reference not found'})
+                self._reply(200, {'status': True, 'message': 'Verification successful', 'data': transaction})
+
+            def do_POST(self):
+                if self.path.rstrip('/') != '/transaction/initialize':
+                    return self._reply(404, {'status': False, 'message': 'Not found'})
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if self._delay_or_fail():
+                    return
+                reference = payload.get('reference') or f'fake_{time.time_ns()}'
+                fake.add_transaction(reference, int(payload.get('amount', 0)))
+                self._reply(200, {'status': True, 'message': 'Authorization URL created', 'data': {
+                    'authorization_url': f'{fake.url}pay/{reference}',
+                    'access_code': reference,
+                    'reference': reference}})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with a 502')
+    parser.add_argument('--decline-rate', type=float, default=0.0, help='fraction of payments reported as failed')
+    args = parser.parse_args()
+    fake = FakePaystack(args.host, args.port, args.latency, args.failure_rate, args.decline_rate)
+    print(f'Fake Paystack listening on {fake.url}')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
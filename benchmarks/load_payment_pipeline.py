@@ -0,0 +1,104 @@
+"""
+Load test for the payment pipeline against the local fake Paystack.
+
+Seeds users and items in a temporary SQLite database, fires concurrent
+payment callbacks through the Flask test client and reports how long the
+callbacks took and how long the background worker needed to settle them.
+
+Usage:
+    python benchmarks/load_payment_pipeline.py --payments 500 --latency 0.2 --failure-rate 0.1
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_paystack import FakePaystack  # noqa: E402
+
+
+def percentile(values, fraction):
+    """
+    Returns the value at the given fraction of the sorted values.
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payments', type=int, default=200, help='number of purchases')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent callback clients')
+    parser.add_argument('--latency', type=float, default=0.1, help='fake Paystack latency in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of fake Paystack 502s')
+    parser.add_argument('--workers', type=int, default=4, help='background verification threads')
+    args = parser.parse_args()
+
+    fake = FakePaystack(latency=args.latency, failure_rate=args.failure_rate, seed=1).start()
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'load.db')}"
+    os.environ['PAYSTACK_API_URL'] = fake.url
+
+    from market import create_app, db
+    from market.models import Item, Payment, User
+    from market.payments import verification_worker
+
+    app = create_app()
+    verification_worker.workers = args.workers
+    verification_worker.backoff = 0.05
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([User(id=i, username=f'user{i}', email_address=f'user{i}@example.com',
+                                 password_hash='x' * 60) for i in range(1, args.payments + 1)])
+        db.session.add_all([Item(id=i, name=f'item{i}', price=100, barcode=f'{i:012d}',
+                                 description=f'Item number {i}') for i in range(1, args.payments + 1)])
+        db.session.commit()
+    references = [f'purchase_{i}_{i}_1' for i in range(1, args.payments + 1)]
+    for reference in references:
+        fake.add_transaction(reference, 100 * 100)
+
+    latencies = []
+    lock = threading.Lock()
+
+    def client(numbers):
+        for number in numbers:
+            test_client = app.test_client()
+            with test_client.session_transaction() as session:
+                session['_user_id'] = str(number)
+            started = time.perf_counter()
+            test_client.get(f'/payment-callback/{number}?reference={references[number - 1]}')
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    numbers = list(range(1, args.payments + 1))
+    threads = [threading.Thread(target=client, args=(numbers[i::args.concurrency],)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    callbacks_done = time.perf_counter() - started
+    verification_worker.wait_idle()
+    settled = time.perf_counter() - started
+
+    with app.app_context():
+        statuses = dict(db.session.query(Payment.status, db.func.count()).group_by(Payment.status).all())
+    fake.stop()
+
+    print(f'payments: {args.payments}, fake latency: {args.latency}s, failure rate: {args.failure_rate}')
+    print(f'callbacks: {callbacks_done:.2f}s total, {args.payments / callbacks_done:.0f}/s')
+    print(f'callback latency ms: p50 {percentile(latencies, 0.5) * 1000:.1f}, '
+          f'p95 {percentile(latencies, 0.95) * 1000:.1f}, p99 {percentile(latencies, 0.99) * 1000:.1f}, '
+          f'mean {statistics.mean(latencies) * 1000:.1f}')
+    print(f'all payments settled after {settled:.2f}s; verify calls: {fake.verify_calls}')
+    print(f'ledger: {statuses}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""
+Benchmark and load-test suite for the marketplace flows.
+
+Seeds a temporary SQLite database with N users and N items, starts the local
+fake Paystack, and drives each scenario with concurrent clients, either through
+the Flask test client (`--driver testclient`) or over HTTP against a threaded
+WSGI server (`--driver wsgi`). Results are written as JSON so runs on two
+commits can be diffed, and `--compare` prints the change against an earlier run.
+
+Scenarios:
+    market     GET /market at random keyset cursors
+    search     GET /market/search for random catalogue words
+    login      POST /login with a correct password
+    register   POST /register with new usernames
+    payment    initialize, callback, then poll the status API until the purchase settles
+
+Usage:
+    python benchmarks/suite.py --size 10000 --driver wsgi --output bench.json
+    python benchmarks/suite.py --size 10000 --driver wsgi --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_paystack import FakePaystack  # noqa: E402
+
+SCENARIOS = ('market', 'search', 'login', 'register', 'payment')
+PASSWORD = 'benchmark-password'
+WORDS = ('wireless', 'gaming', 'mouse', 'keyboard', 'laptop', 'monitor', 'cable', 'charger', 'speaker',
+         'headset', 'camera', 'router', 'tablet', 'phone', 'drive', 'memory', 'adapter', 'stand')
+SEED_CHUNK = 20000
+
+
+def letters(number):
+    """
+    Spells a number with letters only, since usernames must be alphabetic.
+    """
+    name = ''
+    while True:
+        number, digit = divmod(number, 26)
+        name = chr(ord('a') + digit) + name
+        if number == 0:
+            return name
+
+
+def percentile(values, fraction):
+    """
+    Returns the value at the given fraction of the sorted values.
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class TestClientDriver:
+    """
+    Sends requests through the Flask test client, without a network or server in between.
+    """
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_data()
+
+    def post(self, path, data=None):
+        response = self.client.post(path, data=data)
+        return response.status_code, response.get_data()
+
+
+class WsgiDriver:
+    """
+    Sends requests over HTTP with a keep-alive session, like a browser would.
+    """
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def get(self, path):
+        response = self.session.get(self.base_url + path, allow_redirects=False)
+        return response.status_code, response.content
+
+    def post(self, path, data=None):
+        response = self.session.post(self.base_url + path, data=data, allow_redirects=False)
+        return response.status_code, response.content
+
+
+def seed(app, size):
+    """
+    Inserts `size` users sharing one password and `size` unsold items in bulk.
+    """
+    from market import db, hashing_pool
+    from market.models import Item, User
+    from market.search import rebuild_index
+
+    rng = random.Random(1)
+    with app.app_context():
+        db.create_all()
+        password_hash = hashing_pool.generate_password_hash(PASSWORD)
+        connection = db.session.connection()
+        for start in range(1, size + 1, SEED_CHUNK):
+            numbers = range(start, min(start + SEED_CHUNK, size + 1))
+            connection.execute(User.__table__.insert(), [
+                {'id': i, 'username': f'user{letters(i)}', 'email_address': f'user{i}@example.com',
+                 'password_hash': password_hash} for i in numbers])
+            rows = []
+            for i in numbers:
+                description = f'{" ".join(rng.sample(WORDS, 4))} item number {i}'
+                rows.append({'id': i, 'name': f'{rng.choice(WORDS).title()} {i}', 'price': rng.randint(1, 5000),
+                             'barcode': f'{i:012d}', 'description': description,
+                             'description_hash': Item.hash_description(description)})
+            connection.execute(Item.__table__.insert(), rows)
+        rebuild_index(connection)
+        db.session.commit()
+
+
+def login(driver, number):
+    """
+    Logs a driver in as the seeded user with the given number.
+    """
+    status, _ = driver.post('/login', {'username': f'user{letters(number)}', 'password': PASSWORD})
+    if status != 302:
+        raise RuntimeError(f'login failed with HTTP {status}')
+
+
+def make_scenarios(size):
+    """
+    Returns the request function of every scenario. Each takes a driver, the index
+    of the client thread and a random generator, and returns whether it succeeded.
+    """
+    register_numbers = iter(range(size + 1, 10 ** 9))
+    unsold_items = iter(range(1, size + 1))
+    lock = threading.Lock()
+
+    def market(driver, client, rng):
+        return driver.get(f'/market?after={rng.randrange(0, size)}')[0] == 200
+
+    def search(driver, client, rng):
+        return driver.get(f'/market/search?q={rng.choice(WORDS)[:rng.randint(3, 6)]}')[0] == 200
+
+    def login_request(driver, client, rng):
+        number = rng.randint(1, size)
+        return driver.post('/login', {'username': f'user{letters(number)}', 'password': PASSWORD})[0] == 302
+
+    def register(driver, client, rng):
+        with lock:
+            number = next(register_numbers)
+        return driver.post('/register', {'username': f'new{letters(number)}',
+                                         'email_address': f'new{number}@example.com',
+                                         'password1': PASSWORD, 'password2': PASSWORD})[0] == 302
+
+    def payment(driver, client, rng):
+        with lock:
+            item_id = next(unsold_items)
+        status, body = driver.post(f'/initialize-payment/{item_id}')
+        if status != 200:
+            return False
+        reference = json.loads(body)['authorization_url'].rsplit('/', 1)[-1]
+        status, _ = driver.get(f'/payment-callback/{item_id}?reference={reference}')
+        if status != 302:
+            return False
+        deadline = time.perf_counter() + 30
+        while time.perf_counter() < deadline:
+            status, body = driver.get(f'/api/payment-status/{reference}')
+            if status == 200 and json.loads(body)['settled']:
+                return json.loads(body)['status'] == 'success'
+            time.sleep(0.005)
+        return False
+
+    return {'market': market, 'search': search, 'login': login_request, 'register': register, 'payment': payment}
+
+
+def run_scenario(name, request, drivers, requests_per_scenario):
+    """
+    Runs one scenario with one thread per driver and returns its throughput and latencies.
+    """
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    per_client = [requests_per_scenario // len(drivers) + (i < requests_per_scenario % len(drivers))
+                  for i in range(len(drivers))]
+
+    def client(index):
+        nonlocal errors
+        rng = random.Random(f'{name}-{index}')
+        for _ in range(per_client[index]):
+            started = time.perf_counter()
+            try:
+                ok = request(drivers[index], index, rng)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(len(drivers))]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+    }
+
+
+def git_commit():
+    """
+    Returns the commit being benchmarked, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, result):
+    """
+    Prints the change of every scenario's throughput and latency percentiles against a baseline run.
+    """
+    print(f"\nchange against {baseline['meta'].get('commit')} (negative latency change is better):")
+    for name, current in result['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            change = (current[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            changes.append(f'{key} {before[key]} -> {current[key]} ({change:+.1f}%)')
+        print(f'{name:<9} ' + ', '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1000, help='users and items seeded (1000 to 1000000)')
+    parser.add_argument('--driver', choices=('testclient', 'wsgi'), default='testclient')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated scenarios to run')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--bcrypt-rounds', type=int, default=12, help='bcrypt cost for login and register')
+    parser.add_argument('--paystack-latency', type=float, default=0.0, help='fake Paystack latency in seconds')
+    parser.add_argument('--output', help='write the JSON result to this file instead of stdout')
+    parser.add_argument('--compare', help='a JSON result of an earlier run to compare against')
+    args = parser.parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if not 1000 <= args.size <= 1000000:
+        parser.error('--size must be between 1000 and 1000000')
+
+    fake = FakePaystack(latency=args.paystack_latency, seed=1).start()
+    directory = tempfile.mkdtemp()
+    from market import create_app
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'bench.db')}",
+        'PAYSTACK_API_URL': fake.url,
+        'BCRYPT_LOG_ROUNDS': args.bcrypt_rounds,
+        'WTF_CSRF_ENABLED': False,  # The clients post the forms directly
+        'RATELIMIT_ENABLED': False,  # Every client logs in and registers from the same address
+        })
+    started = time.perf_counter()
+    seed(app, args.size)
+    seed_seconds = time.perf_counter() - started
+
+    server = None
+    if args.driver == 'wsgi':
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        make_driver = lambda: WsgiDriver(f'http://127.0.0.1:{server.server_port}')  # noqa: E731
+    else:
+        make_driver = lambda: TestClientDriver(app)  # noqa: E731
+
+    requests_by_scenario = make_scenarios(args.size)
+    results = {}
+    for name in scenarios:
+        drivers = [make_driver() for _ in range(args.concurrency)]
+        if name == 'payment':
+            for index, driver in enumerate(drivers):
+                login(driver, index + 1)
+        results[name] = run_scenario(name, requests_by_scenario[name], drivers, args.requests)
+        print(f"{name:<9} {results[name]['throughput_rps']:8.1f} req/s  p50 {results[name]['p50_ms']:8.2f} ms  "
+              f"p95 {results[name]['p95_ms']:8.2f} ms  p99 {results[name]['p99_ms']:8.2f} ms  "
+              f"errors {results[name]['errors']}", file=sys.stderr)
+
+    if server is not None:
+        server.shutdown()
+    fake.stop()
+
+    result = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'size': args.size,
+            'driver': args.driver,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'bcrypt_rounds': args.bcrypt_rounds,
+            'paystack_latency': args.paystack_latency,
+            'seed_seconds': round(seed_seconds, 2),
+        },
+        'scenarios': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), result)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,104 @@
+from collections.abc import Mapping
+import click
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
-from flask_migrate import Migrate  # Add this import to handle database migrations
+from market.hashing import HashingPool
+from market.gateway import PaystackClient
+from market.cache import FragmentCache
+from market.database import RoutingSession, init_database
+from market.metrics import Instrumentation
+from market.assets import Assets
+from market.ratelimit import RateLimiter
+from market.images import ImagePipeline
 
 
-app = Flask(__name__)
+# Extensions are created unbound and attached to an app by create_app
+db = SQLAlchemy(session_options={'class_': RoutingSession}) # Database instance using SQLAlchemy
+bcrypt = Bcrypt() # Bcrypt for hashing passwords
+hashing_pool = HashingPool(bcrypt) # Bounded thread pool running the bcrypt work
+gateway = PaystackClient() # Pooled HTTP client for all Paystack calls, connecting on first use
+fragment_cache = FragmentCache() # Cache of rendered page fragments
+instrumentation = Instrumentation() # Request, SQL, bcrypt and Paystack timings served on /metrics
+limiter = RateLimiter() # Token buckets throttling login and registration attempts
+assets = Assets() # Fingerprinted, precompressed static files from `flask assets build`
+images = ImagePipeline() # Item images, thumbnailed in worker processes started on first upload
+login_manager = LoginManager() # Manages user sessions and login
+login_manager.login_view = "main.login_page" # Specifies the view for login
+login_manager.login_message_category = "info" # Sets the category for login messages
 
 
-# Configuring the SQLite database for the Flask app
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///market.db' # Database instance using SQLAlchemy
-app.config['SECRET_KEY'] = 'ec9439cfc6c796ae2029594d' # Enables database migrations using Flask-Migrate
+def create_app(config=None):
+    """
+    Creates and configures an application.
 
+    The defaults come from `market.config.Config` and are overridden by `config`.
+    The thread and process pools and the Paystack session are only started on first use, so
+    building the app in a pre-fork master is cheap and safe. Flask-Migrate, which
+    pulls in Alembic, is only set up when the app is loaded by the `flask` command.
 
-# Initializing extensions
-db = SQLAlchemy(app) # Database instance using SQLAlchemy
-migrate = Migrate(app, db)  # Enables database migrations using Flask-Migrate
-bcrypt = Bcrypt(app) # Bcrypt for hashing passwords
-login_manager = LoginManager(app) # Manages user sessions and login
-login_manager.login_view = "login_page" # Specifies the view for login
-login_manager.login_message_category = "info" # Sets the category for login messages
+    Args:
+        config (dict or object, optional): Settings overriding the defaults, as a
+            mapping or as an object with upper-case attributes.
+
+    Returns:
+        Flask: The application.
+    """
+    from market.config import Config
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if isinstance(config, Mapping):
+        app.config.from_mapping(config)
+    elif config is not None:
+        app.config.from_object(config)
+
+    init_database(app, db)
+    bcrypt.init_app(app)
+    hashing_pool.init_app(app)
+    gateway.init_app(app)
+    fragment_cache.init_app(app)
+    limiter.init_app(app)
+    login_manager.init_app(app)
+    instrumentation.init_app(app)
+    assets.init_app(app)
+    images.init_app(app)
+
+    from market import models
+    models.user_cache.maxsize = app.config['USER_CACHE_SIZE']
+    models.user_cache.ttl = app.config['USER_CACHE_TTL']
+    models.username_cache.maxsize = app.config['USERNAME_CACHE_SIZE']
+    models.username_cache.ttl = app.config['USERNAME_CACHE_TTL']
+
+    from market.payments import verification_worker
+    verification_worker.init_app(app)
+
+    from market.catalogue import catalogue_index
+    catalogue_index.init_app(app)
+
+    from market.routes import main
+    app.register_blueprint(main)
+
+    from market.cli import assets_cli, export_cli, items_cli, payments_cli
+    app.cli.add_command(items_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(export_cli)
+    app.cli.add_command(payments_cli)
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db) # Registers the `flask db` commands
+
+    return app
 
 
-from market import routes  # Import routes after app and extensions are initialized
+def __getattr__(name):
+    """
+    Creates the default application on first access to `market.app`, for scripts
+    and tests that use a single app configured from the environment.
+    """
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,394 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from flask import Response, current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError: # Brotli variants are only written when the package is installed
+    brotli = None
+
+
+# Files served together, in order, under one `bundles/` name
+BUNDLES = {
+    'bundles/site.css': ['css/base.css', 'css/styles.css', 'css/home.css', 'css/login.css', 'css/register.css',
+                         'css/payment.css', 'css/market.css', 'css/items_modals.css'],
+    'bundles/base.js': ['js/base.js', 'js/toggle.js'],
+    'bundles/market.js': ['js/market.js', 'js/items_modals.js'],
+    'bundles/payment.js': ['js/initiate_payment.js'],
+}
+
+# Folder of the built files inside the static folder
+DIST = 'dist'
+
+# Types worth precompressing; images are already compressed
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt')
+
+_CSS_SPACE = re.compile(r'\s*([{};,>])\s*')
+
+# Characters after which a '/' in a script starts a regular expression rather than a division
+_REGEX_PRECEDERS = frozenset('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = frozenset(('return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw',
+                             'case', 'do', 'else', 'yield', 'await'))
+
+
+def _string_end(source, start):
+    """
+    Returns the index just past the quoted string starting at `start`, skipping escapes.
+    An unterminated string ends at the line break.
+    """
+    quote = source[start]
+    index = start + 1
+    while index < len(source):
+        char = source[index]
+        if char == '\\':
+            index += 2
+        elif char == quote:
+            return index + 1
+        elif char == '\n':
+            return index
+        else:
+            index += 1
+    return len(source)
+
+
+def _regex_end(source, start):
+    """
+    Returns the index just past the regular expression literal starting at `start`,
+    including its flags. A '/' inside a character class does not end it.
+    """
+    index = start + 1
+    in_class = False
+    while index < len(source):
+        char = source[index]
+        if char == '\\':
+            index += 2
+            continue
+        if char == '\n':
+            return index
+        if in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '/':
+            index += 1
+            break
+        index += 1
+    while index < len(source) and (source[index].isalnum() or source[index] == '_'):
+        index += 1
+    return index
+
+
+def _squeeze_css(code):
+    """
+    Collapses whitespace around punctuation in a stretch of stylesheet outside strings.
+    """
+    code = _CSS_SPACE.sub(r'\1', re.sub(r'\s+', ' ', code))
+    return code.replace(';}', '}').replace(': ', ':')
+
+
+def minify_css(source):
+    """
+    Removes comments and the whitespace that does not change the meaning of a stylesheet.
+    Quoted strings, e.g. in `content` or `url()`, are copied unchanged.
+    """
+    parts = []
+    code = []
+    index = 0
+    while index < len(source):
+        char = source[index]
+        if char in '\'"':
+            end = _string_end(source, index)
+            parts.append(_squeeze_css(''.join(code)))
+            parts.append(source[index:end])
+            code = []
+            index = end
+        elif source.startswith('/*', index):
+            end = source.find('*/', index + 2)
+            index = len(source) if end < 0 else end + 2
+            code.append(' ')
+        else:
+            code.append(char)
+            index += 1
+    parts.append(_squeeze_css(''.join(code)))
+    return ''.join(parts).strip()
+
+
+def minify_js(source):
+    """
+    Removes comments, indentation, repeated spaces and blank lines from a script.
+
+    The script is scanned token by token, so string, template and regular expression
+    literals are copied unchanged, even when they hold `//` or `/*`. Line breaks
+    are kept, so automatic semicolon insertion works as in the source.
+    """
+    lines = []
+    line = []
+    braces = []   # '{' for blocks, '`' for the substitutions of template literals
+    last = ''     # The last punctuation character or word, to tell regular expressions from divisions
+    in_template = False
+    index = 0
+
+    def end_line():
+        text = ''.join(line).rstrip()
+        if text:
+            lines.append(text)
+        line.clear()
+
+    while index < len(source):
+        char = source[index]
+        if in_template:
+            if char == '\\':
+                line.append(source[index:index + 2])
+                index += 2
+            elif char == '`':
+                line.append(char)
+                in_template, last = False, '`'
+                index += 1
+            elif source.startswith('${', index):
+                line.append('${')
+                braces.append('`')
+                in_template, last = False, '{'
+                index += 2
+            else:
+                line.append(char)
+                index += 1
+        elif char == '\n':
+            end_line()
+            index += 1
+        elif char.isspace():
+            if line and line[-1] != ' ':
+                line.append(' ')
+            index += 1
+        elif char in '\'"':
+            end = _string_end(source, index)
+            line.append(source[index:end])
+            last = char
+            index = end
+        elif char == '`':
+            line.append(char)
+            in_template = True
+            index += 1
+        elif source.startswith('//', index):
+            end = source.find('\n', index)
+            index = len(source) if end < 0 else end
+        elif source.startswith('/*', index):
+            end = source.find('*/', index + 2)
+            end = len(source) if end < 0 else end + 2
+            if '\n' in source[index:end]:
+                end_line()
+            elif line and line[-1] != ' ':
+                line.append(' ')
+            index = end
+        elif char == '/' and (not last or last in _REGEX_PRECEDERS or last in _REGEX_KEYWORDS):
+            end = _regex_end(source, index)
+            line.append(source[index:end])
+            last = '/'
+            index = end
+        elif char.isalnum() or char in '_$':
+            end = index
+            while end < len(source) and (source[end].isalnum() or source[end] in '_$'):
+                end += 1
+            last = source[index:end]
+            line.append(last)
+            index = end
+        else:
+            if char == '{':
+                braces.append('{')
+            elif char == '}' and braces and braces.pop() == '`':
+                in_template = True
+            line.append(char)
+            last = char
+            index += 1
+    end_line()
+    return '\n'.join(lines)
+
+
+def minify(name, source):
+    """
+    Minifies a stylesheet or a script, leaving other text unchanged.
+    """
+    if name.endswith('.css'):
+        return minify_css(source)
+    if name.endswith('.js'):
+        return minify_js(source)
+    return source
+
+
+def read_bundle(static_folder, name, minified=False):
+    """
+    Concatenates the files of a bundle.
+
+    Args:
+        static_folder (str): The static folder holding the sources.
+        name (str): The bundle name, a key of BUNDLES.
+        minified (bool): Minify each file before joining them.
+
+    Returns:
+        str: The bundle contents.
+    """
+    parts = []
+    for source in BUNDLES[name]:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as file:
+            text = file.read()
+        parts.append(minify(source, text) if minified else text)
+    # Scripts are separated by a semicolon in case one does not end its last statement
+    return (';\n' if name.endswith('.js') else '\n').join(parts) + '\n'
+
+
+def fingerprinted(name, content):
+    """
+    Returns the path of a built file, with a hash of its content before the extension.
+    """
+    root, extension = os.path.splitext(name)
+    if root.startswith('bundles/'):
+        root = root[len('bundles/'):]
+    return f'{DIST}/{root}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
+
+
+def write_variants(path, content):
+    """
+    Writes a file with its gzip and, when available, brotli variants next to it.
+    A variant is skipped when it would not be smaller.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(content)
+    if not path.endswith(COMPRESSIBLE):
+        return
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(content):
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+
+
+def build_assets(static_folder):
+    """
+    Builds the static assets for production.
+
+    Every static file and every bundle is minified, written under `dist/` with a
+    content hash in its name, and precompressed. The manifest maps each original
+    name to its built file, so `url_for('static', ...)` can link to it. Previous
+    builds are removed.
+
+    Args:
+        static_folder (str): The static folder of the app.
+
+    Returns:
+        dict: The manifest.
+    """
+    output = os.path.join(static_folder, DIST)
+    shutil.rmtree(output, ignore_errors=True)
+    sources = []
+    for directory, folders, files in os.walk(static_folder):
+        folders[:] = sorted(folder for folder in folders if not folder.startswith('.'))
+        for file_name in sorted(files):
+            if not file_name.startswith('.'):
+                sources.append(os.path.relpath(os.path.join(directory, file_name), static_folder).replace(os.sep, '/'))
+
+    manifest = {}
+    for name in sources:
+        with open(os.path.join(static_folder, name), 'rb') as file:
+            content = file.read()
+        if name.endswith(('.css', '.js')):
+            content = minify(name, content.decode('utf-8')).encode('utf-8')
+        manifest[name] = fingerprinted(name, content)
+        write_variants(os.path.join(static_folder, manifest[name]), content)
+    for name in BUNDLES:
+        content = read_bundle(static_folder, name, minified=True).encode('utf-8')
+        manifest[name] = fingerprinted(name, content)
+        write_variants(os.path.join(static_folder, manifest[name]), content)
+
+    with open(os.path.join(output, 'manifest.json'), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest
+
+
+class Assets:
+    """
+    Links `url_for('static', ...)` to the fingerprinted files of `flask assets build`
+    and serves them precompressed with far-future immutable caching.
+
+    Without a build, the original files are served as they are and bundles are
+    concatenated on request, so development needs no build step.
+
+    Configuration:
+        ASSETS_MANIFEST (str): Path of the manifest, relative to the static folder.
+        ASSETS_MAX_AGE (int): Seconds browsers may cache fingerprinted files.
+    """
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Loads the manifest and replaces the static view.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        app.config.setdefault('ASSETS_MANIFEST', f'{DIST}/manifest.json')
+        app.config.setdefault('ASSETS_MAX_AGE', 31536000)
+        self.load_manifest(app)
+        app.url_defaults(self._fingerprint)
+        app.view_functions['static'] = self.static_view
+
+    @staticmethod
+    def load_manifest(app):
+        """
+        Reads the manifest of the last build, if there is one.
+
+        Args:
+            app (Flask): The Flask application.
+
+        Returns:
+            dict: The manifest, empty without a build.
+        """
+        path = os.path.join(app.static_folder, app.config['ASSETS_MANIFEST'])
+        try:
+            with open(path, encoding='utf-8') as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            manifest = {}
+        app.extensions['assets'] = manifest
+        return manifest
+
+    @staticmethod
+    def _fingerprint(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            built = current_app.extensions['assets'].get(values['filename'])
+            if built is not None:
+                values['filename'] = built
+
+    @staticmethod
+    def static_view(filename):
+        """
+        Serves a static file. Built files are sent in the best encoding the client
+        accepts and marked immutable, since their name changes with their content.
+        """
+        if filename.startswith(f'{DIST}/'):
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            max_age = current_app.config['ASSETS_MAX_AGE']
+            for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+                if (request.accept_encodings.quality(encoding) > 0
+                        and os.path.isfile(os.path.join(current_app.static_folder, filename + suffix))):
+                    response = send_from_directory(current_app.static_folder, filename + suffix,
+                                                   mimetype=mimetype, max_age=max_age)
+                    response.headers['Content-Encoding'] = encoding
+                    break
+            else:
+                response = send_from_directory(current_app.static_folder, filename, mimetype=mimetype, max_age=max_age)
+            response.headers['Cache-Control'] = f'public, max-age={max_age}, immutable'
+            response.vary.add('Accept-Encoding')
+            return response
+        if filename in BUNDLES:
+            mimetype = 'text/css' if filename.endswith('.css') else 'text/javascript'
+            return Response(read_bundle(current_app.static_folder, filename), mimetype=mimetype)
+        return current_app.send_static_file(filename)
@@ -0,0 +1,215 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    A small thread-safe in-memory cache with a size limit and a time-to-live.
+
+    The least recently used entry is evicted when the cache is full, and entries
+    older than `ttl` seconds are treated as missing. Each worker process has its
+    own cache, so the TTL also bounds how long another worker can serve stale data.
+    """
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for a key, or `default` if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Stores a value, evicting the least recently used entry if the cache is full.
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Removes a key from the cache if present.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemoryBackend:
+    """
+    Fragment cache backend keeping entries in the memory of each worker process.
+    """
+    def __init__(self, maxsize=256, ttl=300):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class FileSystemBackend:
+    """
+    Fragment cache backend storing one file per entry, shared by all workers on a host.
+    Files are written to a temporary name and renamed, so readers never see partial entries.
+    """
+    def __init__(self, directory, ttl=300):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, encoding='utf-8') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                file.write(value)
+            os.replace(temporary_path, path)
+        except OSError:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class RedisBackend:
+    """
+    Fragment cache backend for a Redis-compatible server, shared by all workers and hosts.
+    Requires the optional `redis` package.
+    """
+    def __init__(self, url, ttl=300, prefix='techieseller:fragment:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis fragment cache backend.")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value.encode('utf-8'), ex=self.ttl)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+
+class FragmentCache:
+    """
+    Caches rendered HTML fragments in a pluggable backend.
+
+    Callers include a version counter in the key, so stale fragments are never
+    served after a change; they simply stop being requested and expire.
+
+    Configuration:
+        FRAGMENT_CACHE_BACKEND (str): 'memory', 'filesystem', 'redis' or 'none'.
+        FRAGMENT_CACHE_TTL (int): Seconds an entry is kept.
+        FRAGMENT_CACHE_SIZE (int): Entries kept per process by the memory backend.
+        FRAGMENT_CACHE_DIR (str): The directory of the filesystem backend.
+        FRAGMENT_CACHE_URL (str): The server URL of the redis backend.
+    """
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Creates the backend selected in the app configuration.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        name = app.config.setdefault('FRAGMENT_CACHE_BACKEND', 'memory')
+        ttl = app.config.setdefault('FRAGMENT_CACHE_TTL', 300)
+        if name == 'memory':
+            self.backend = MemoryBackend(app.config.setdefault('FRAGMENT_CACHE_SIZE', 256), ttl)
+        elif name == 'filesystem':
+            directory = app.config.setdefault('FRAGMENT_CACHE_DIR', os.path.join(app.instance_path, 'fragments'))
+            self.backend = FileSystemBackend(directory, ttl)
+        elif name == 'redis':
+            self.backend = RedisBackend(app.config.setdefault('FRAGMENT_CACHE_URL', 'redis://localhost:6379/0'), ttl)
+        elif name == 'none':
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown fragment cache backend: {name}")
+
+    def get_or_render(self, key, render):
+        """
+        Returns the cached fragment for a key, rendering and storing it on a miss.
+
+        Args:
+            key (str): The cache key, including any version counters.
+            render (callable): Called without arguments to render the fragment.
+
+        Returns:
+            str: The HTML fragment.
+        """
+        if self.backend is None:
+            return render()
+        fragment = self.backend.get(key)
+        if fragment is None:
+            fragment = render()
+            self.backend.set(key, fragment)
+        return fragment
+
+    def clear(self):
+        """
+        Removes every cached fragment.
+        """
+        if self.backend is not None:
+            self.backend.clear()
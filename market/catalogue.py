@@ -0,0 +1,325 @@
+import bisect
+import heapq
+import threading
+import time
+from array import array
+from flask import current_app
+from market import db
+
+
+# Orders the market can be sorted in; a leading '-' sorts in descending order
+SORTS = ('price', '-price', 'name', '-name')
+
+# Barcodes are stored in fixed-width slots, padded with NUL bytes
+BARCODE_WIDTH = 12
+
+# Rough cost of building a name key (decoding and case-folding), in price comparisons
+NAME_KEY_COST = 8
+
+
+def parse_filters(args):
+    """
+    Reads the price range and sort order of a market query from request arguments.
+
+    Args:
+        args (MultiDict): The query arguments, with optional `min_price`, `max_price` and `sort`.
+
+    Returns:
+        dict: The valid filters given, empty if there are none.
+    """
+    filters = {}
+    for name in ('min_price', 'max_price'):
+        value = args.get(name, type=int)
+        if value is not None:
+            filters[name] = value
+    if args.get('sort') in SORTS:
+        filters['sort'] = args['sort']
+    return filters
+
+
+class CatalogueSnapshot:
+    """
+    The unsold items of the catalogue in compact, array-backed columns.
+
+    Every item takes a slot in the parallel columns `ids`, `prices`, `name_starts`,
+    `name_lengths` and the fixed-width `barcodes`; the names are UTF-8 bytes in one
+    buffer. Three arrays of slots keep the items sorted by id, by case-folded name
+    and by price, so a price range is two binary searches and a page of it in
+    either order is a slice. Items are added and removed with a binary search and
+    an array insert or delete, without rebuilding; removed slots are reclaimed by
+    `compacted`.
+
+    Attributes:
+        version (int): The catalogue version the snapshot is up to date with.
+        dead (int): The number of slots no longer in use.
+    """
+    def __init__(self, version=0):
+        self.version = version
+        self.ids = array('q')
+        self.prices = array('q')
+        self.name_starts = array('I')
+        self.name_lengths = array('B')
+        self.names = bytearray()
+        self.barcodes = bytearray()
+        self.by_id = array('i')
+        self.by_name = array('i')
+        self.by_price = array('i')
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.by_id)
+
+    @classmethod
+    def build(cls, rows, version):
+        """
+        Builds a snapshot from the unsold items.
+
+        Args:
+            rows (iterable): Tuples of the id, name, price and barcode of each item, in id order.
+            version (int): The catalogue version read before the rows.
+
+        Returns:
+            CatalogueSnapshot: The snapshot.
+        """
+        snapshot = cls(version)
+        for row in rows:
+            snapshot._append(*row[:4])
+        slots = range(len(snapshot.ids))
+        snapshot.by_id = array('i', slots)
+        snapshot.by_name = array('i', sorted(slots, key=snapshot.name_key))
+        snapshot.by_price = array('i', sorted(slots, key=snapshot.price_key))
+        return snapshot
+
+    def _append(self, item_id, name, price, barcode):
+        """
+        Stores an item in a new slot, without indexing it.
+        """
+        encoded = name.encode('utf-8')[:255]
+        self.ids.append(item_id)
+        self.prices.append(price)
+        self.name_starts.append(len(self.names))
+        self.name_lengths.append(len(encoded))
+        self.names += encoded
+        self.barcodes += (barcode or '').encode('utf-8')[:BARCODE_WIDTH].ljust(BARCODE_WIDTH, b'\0')
+        return len(self.ids) - 1
+
+    def name(self, slot):
+        start = self.name_starts[slot]
+        return self.names[start:start + self.name_lengths[slot]].decode('utf-8', 'ignore')
+
+    def barcode(self, slot):
+        start = slot * BARCODE_WIDTH
+        return self.barcodes[start:start + BARCODE_WIDTH].rstrip(b'\0').decode('utf-8', 'ignore')
+
+    def name_key(self, slot):
+        return self.name(slot).casefold(), self.ids[slot]
+
+    def price_key(self, slot):
+        return self.prices[slot], self.ids[slot]
+
+    def row(self, slot):
+        """
+        Returns the id, name, price and barcode of the item in a slot.
+        """
+        return self.ids[slot], self.name(slot), self.prices[slot], self.barcode(slot)
+
+    def find(self, item_id):
+        """
+        Returns the slot of an item, or None if it is not in the snapshot.
+        """
+        position = bisect.bisect_left(self.by_id, item_id, key=self.ids.__getitem__)
+        if position < len(self.by_id) and self.ids[self.by_id[position]] == item_id:
+            return self.by_id[position]
+        return None
+
+    def add(self, item_id, name, price, barcode):
+        """
+        Adds an unsold item.
+        """
+        slot = self._append(item_id, name, price, barcode)
+        bisect.insort(self.by_id, slot, key=self.ids.__getitem__)
+        bisect.insort(self.by_name, slot, key=self.name_key)
+        bisect.insort(self.by_price, slot, key=self.price_key)
+
+    def remove(self, item_id):
+        """
+        Removes an item, e.g. because it was sold. Unknown ids are ignored.
+        """
+        slot = self.find(item_id)
+        if slot is None:
+            return
+        for order, key in ((self.by_id, None), (self.by_name, self.name_key), (self.by_price, self.price_key)):
+            if key is None:
+                del order[bisect.bisect_left(order, item_id, key=self.ids.__getitem__)]
+            else:
+                del order[bisect.bisect_left(order, key(slot), key=key)]
+        self.dead += 1
+
+    def apply(self, rows, version):
+        """
+        Applies changed items to the snapshot: sold items are removed, and unsold
+        ones are added or replaced.
+
+        Args:
+            rows (iterable): Tuples of the id, name, price, barcode and owner of each changed item.
+            version (int): The catalogue version the changes bring the snapshot to.
+        """
+        for item_id, name, price, barcode, owner in rows:
+            self.remove(item_id)
+            if owner is None:
+                self.add(item_id, name, price, barcode)
+        self.version = version
+
+    def compacted(self):
+        """
+        Returns a copy of the snapshot without the slots of removed items.
+        """
+        return CatalogueSnapshot.build((self.row(slot) for slot in self.by_id), self.version)
+
+    def price_range(self, min_price=None, max_price=None):
+        """
+        Returns the positions in `by_price` of the first item at or above `min_price`
+        and just past the last item at or below `max_price`.
+        """
+        low = 0 if min_price is None else bisect.bisect_left(self.by_price, min_price, key=self.prices.__getitem__)
+        high = (len(self.by_price) if max_price is None
+                else bisect.bisect_right(self.by_price, max_price, key=self.prices.__getitem__))
+        return low, max(low, high)
+
+    def query(self, min_price=None, max_price=None, sort='price', offset=0, limit=50):
+        """
+        Returns one page of the unsold items within a price range.
+
+        Sorted by price, the page is a slice of the price order. Sorted by name, a
+        range holding most of the catalogue is scanned in name order until the page
+        is full; a narrow one is sorted by name instead.
+
+        Args:
+            min_price (int): The lowest price, or None.
+            max_price (int): The highest price, or None.
+            sort (str): One of SORTS.
+            offset (int): The number of matching items to skip.
+            limit (int): The most items to return.
+
+        Returns:
+            tuple: The number of matching items and the rows of the page, as tuples of
+            the id, name, price and barcode.
+        """
+        low, high = self.price_range(min_price, max_price)
+        total = high - low
+        descending = sort.startswith('-')
+        if offset >= total or limit <= 0:
+            return total, []
+        if sort.lstrip('-') == 'price' or total == len(self.by_name):
+            order = self.by_price if sort.lstrip('-') == 'price' else self.by_name
+            if descending:
+                end = high - offset
+                slots = reversed(order[max(low, end - limit):end])
+            else:
+                slots = order[low + offset:min(high, low + offset + limit)]
+        elif (offset + limit) * len(self.by_name) / total <= NAME_KEY_COST * total:
+            # Expected slots scanned to fill the page, against name keys built by a sort
+            lowest, highest = self.prices[self.by_price[low]], self.prices[self.by_price[high - 1]]
+            matches = (slot for slot in (reversed(self.by_name) if descending else self.by_name)
+                       if lowest <= self.prices[slot] <= highest)
+            slots = [slot for _, slot in zip(range(offset + limit), matches)][offset:]
+        else:
+            select = heapq.nlargest if descending else heapq.nsmallest
+            slots = select(offset + limit, self.by_price[low:high], key=self.name_key)[offset:]
+        return total, [self.row(slot) for slot in slots]
+
+    def nbytes(self):
+        """
+        Returns the bytes held by the columns and orders, excluding object headers.
+        """
+        arrays = (self.ids, self.prices, self.name_starts, self.name_lengths, self.by_id, self.by_name, self.by_price)
+        return sum(len(column) * column.itemsize for column in arrays) + len(self.names) + len(self.barcodes)
+
+
+class CatalogueIndex:
+    """
+    Answers price-filtered and sorted market queries from a snapshot of the unsold
+    items kept in the memory of each worker process, so typing in the price filter
+    does not query the database for every keystroke.
+
+    The snapshot is built once, then kept up to date from the items stamped with a
+    newer catalogue version (see `CatalogueVersion.bump`): at most every
+    CATALOGUE_INDEX_CHECK_INTERVAL seconds the version is read, and if it moved only
+    the changed items are loaded and applied. Items deleted from the database are
+    dropped at the next full rebuild.
+
+    Configuration:
+        CATALOGUE_INDEX_CHECK_INTERVAL (float): Seconds between checks of the catalogue version.
+        CATALOGUE_INDEX_REBUILD_INTERVAL (float): Seconds between full rebuilds.
+    """
+    def init_app(self, app):
+        """
+        Reads the index settings and gives the app an empty index.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        app.config.setdefault('CATALOGUE_INDEX_CHECK_INTERVAL', 1.0)
+        app.config.setdefault('CATALOGUE_INDEX_REBUILD_INTERVAL', 3600.0)
+        app.extensions['catalogue_index'] = {'snapshot': None, 'built': 0.0, 'checked': 0.0,
+                                             'lock': threading.Lock()}
+
+    @staticmethod
+    def _build():
+        from market.models import CatalogueVersion, Item
+        version = CatalogueVersion.current()
+        rows = db.session.execute(db.select(Item.id, Item.name, Item.price, Item.barcode)
+                                  .where(Item.owner.is_(None)).order_by(Item.id)
+                                  .execution_options(yield_per=current_app.config['STREAM_YIELD_PER']))
+        return CatalogueSnapshot.build(rows, version)
+
+    def _refresh(self, snapshot):
+        from market.models import CatalogueVersion, Item
+        version = CatalogueVersion.current()
+        if version == snapshot.version:
+            return snapshot
+        if version < snapshot.version:
+            return self._build()  # The database was recreated
+        rows = db.session.execute(db.select(Item.id, Item.name, Item.price, Item.barcode, Item.owner)
+                                  .where(Item.revision > snapshot.version))
+        snapshot.apply(rows, version)
+        if snapshot.dead > max(1024, len(snapshot)):
+            snapshot = snapshot.compacted()
+        return snapshot
+
+    def snapshot(self):
+        """
+        Returns the snapshot of the current app, building or refreshing it when due.
+        Must be called with the index lock held.
+        """
+        state = current_app.extensions['catalogue_index']
+        now = time.monotonic()
+        if state['snapshot'] is None or now - state['built'] >= current_app.config['CATALOGUE_INDEX_REBUILD_INTERVAL']:
+            state['snapshot'] = self._build()
+            state['built'] = state['checked'] = now
+        elif now - state['checked'] >= current_app.config['CATALOGUE_INDEX_CHECK_INTERVAL']:
+            state['snapshot'] = self._refresh(state['snapshot'])
+            state['checked'] = now
+        return state['snapshot']
+
+    def query(self, min_price=None, max_price=None, sort='price', page=1, per_page=50):
+        """
+        Returns one page of the unsold items within a price range.
+
+        Args:
+            min_price (int): The lowest price, or None.
+            max_price (int): The highest price, or None.
+            sort (str): One of SORTS.
+            page (int): The page, from 1.
+            per_page (int): The items per page.
+
+        Returns:
+            tuple: The number of matching items and the rows of the page, as tuples of
+            the id, name, price and barcode.
+        """
+        with current_app.extensions['catalogue_index']['lock']:
+            return self.snapshot().query(min_price, max_price, sort, (max(1, page) - 1) * per_page, per_page)
+
+
+# Per-worker index of the unsold items, bound to the app by create_app
+catalogue_index = CatalogueIndex()
@@ -0,0 +1,322 @@
+import csv
+import json
+import os
+import time
+from datetime import timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from market import assets, db, images
+from market.assets import build_assets
+from market.export import FORMATS, export
+from market.models import Item, CatalogueVersion
+from market.reconcile import reconcile_payments
+from market.search import index_items
+
+
+items_cli = AppGroup('items', help='Manage the item catalogue.')
+assets_cli = AppGroup('assets', help='Build the static assets.')
+export_cli = AppGroup('export', help='Export the catalogue and sales for reconciliation.')
+payments_cli = AppGroup('payments', help='Reconcile Paystack payments.')
+
+
+def read_rows(path, file_format):
+    """
+    Streams item rows from a CSV file (with a header row) or a JSON Lines file.
+
+    Args:
+        path (str): The file to read.
+        file_format (str): 'csv' or 'jsonl'.
+
+    Yields:
+        tuple: The line number and the row as a dictionary.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            for line_number, row in enumerate(csv.DictReader(file), start=2):
+                yield line_number, row
+        else:
+            for line_number, line in enumerate(file, start=1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except ValueError:
+                        yield line_number, None
+
+
+def store_image_file(path):
+    """
+    Stores an image file as the original of an item image.
+
+    Args:
+        path (str): The image file.
+
+    Returns:
+        str: The key of the image.
+
+    Raises:
+        ValueError: If the file cannot be read, is too large or is not an image.
+    """
+    try:
+        with open(path, 'rb') as file:
+            data = file.read(images.max_bytes + 1)
+    except OSError as e:
+        raise ValueError(f"cannot read image {path!r}: {e.strerror}")
+    return images.store(data)
+
+
+def clean_row(row, image_folder='.'):
+    """
+    Validates a raw row and converts it to the values of an item.
+    The optional `image` field is the path of an image file, relative to `image_folder`;
+    the file is stored and replaced by the key of the image.
+
+    Args:
+        row (dict): The row read from the file.
+        image_folder (str): The folder image paths are relative to.
+
+    Returns:
+        dict: The item values, with the image key under 'image' if the row has an image.
+
+    Raises:
+        ValueError: If a field is missing, the price is not a whole number or the image is unusable.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("not a JSON object")
+    values = {}
+    for field in ('name', 'barcode', 'description'):
+        value = str(row.get(field) or '').strip()
+        if not value:
+            raise ValueError(f"missing {field}")
+        values[field] = value
+    try:
+        values['price'] = int(row.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid price {row.get('price')!r}")
+    values['description_hash'] = Item.hash_description(values['description'])
+    image = str(row.get('image') or '').strip()
+    if image:
+        values['image'] = store_image_file(os.path.join(image_folder, image))
+    return values
+
+
+def existing_values(column, values):
+    """
+    Returns which of the given values are already stored in an item column.
+    """
+    if not values:
+        return set()
+    return set(db.session.scalars(db.select(column).where(column.in_(values))))
+
+
+def import_batch(batch, report):
+    """
+    Inserts a batch of rows in one transaction, skipping rows whose name, barcode or
+    description is already used in the database or earlier in the batch. The new
+    items are added to the search index in the same transaction, and the thumbnails
+    of their images are scheduled once it is committed.
+
+    Args:
+        batch (list): Tuples of the line number and the cleaned item values.
+        report (callable): Called with the line number and reason of every skipped row.
+
+    Returns:
+        int: The number of items inserted.
+    """
+    taken = {
+        'name': existing_values(Item.name, [values['name'] for _, values in batch]),
+        'barcode': existing_values(Item.barcode, [values['barcode'] for _, values in batch]),
+        'description_hash': existing_values(Item.description_hash,
+                                            [values['description_hash'] for _, values in batch]),
+    }
+    rows = []
+    image_keys = {}
+    for line_number, values in batch:
+        duplicate = next((field for field in taken if values[field] in taken[field]), None)
+        if duplicate:
+            label = 'description' if duplicate == 'description_hash' else duplicate
+            report(line_number, f"duplicate {label} {values[label]!r}")
+            continue
+        for field in taken:
+            taken[field].add(values[field])
+        image = values.pop('image', None)
+        if image:
+            image_keys[values['name']] = image
+        rows.append(values)
+    item_ids = {}
+    if rows:
+        connection = db.session.connection()
+        connection.execute(Item.__table__.insert(), rows)
+        names = Item.name.in_([values['name'] for values in rows])
+        index_items(connection, names)
+        CatalogueVersion.bump(connection, names)
+        if image_keys:
+            item_ids = dict(connection.execute(db.select(Item.name, Item.id).where(Item.name.in_(image_keys))).all())
+    db.session.commit()
+    for name, item_id in item_ids.items():
+        images.submit(item_id, image_keys[name])
+    return len(rows)
+
+
+@items_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+              help='File format; guessed from the file extension by default.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows inserted per transaction.')
+def import_items(path, file_format, batch_size):
+    """
+    Imports items from a CSV or JSON Lines file.
+
+    Every row needs a name, price, barcode and description, and may have an image:
+    the path of a JPEG, PNG, GIF or WebP file relative to the imported file. Rows that
+    are invalid or duplicate an existing name, barcode or description are reported and skipped.
+    """
+    file_format = file_format or ('jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson') else 'csv')
+    imported = skipped = 0
+    started = time.perf_counter()
+
+    def report(line_number, reason):
+        nonlocal skipped
+        skipped += 1
+        click.echo(f"line {line_number}: skipped, {reason}", err=True)
+
+    def flush(batch):
+        nonlocal imported
+        imported += import_batch(batch, report)
+        elapsed = time.perf_counter() - started
+        click.echo(f"{imported} imported, {skipped} skipped, {imported / elapsed:,.0f} rows/s")
+
+    batch = []
+    for line_number, row in read_rows(path, file_format):
+        try:
+            batch.append((line_number, clean_row(row, os.path.dirname(os.path.abspath(path)))))
+        except ValueError as e:
+            report(line_number, str(e))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    images.wait_idle()
+    elapsed = time.perf_counter() - started
+    click.echo(f"Done: {imported} imported, {skipped} skipped in {elapsed:.1f}s")
+
+
+@items_cli.command('image')
+@click.argument('item_id', type=int)
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def set_item_image(item_id, path):
+    """
+    Sets the image of an item and waits for its thumbnails.
+    """
+    if db.session.get(Item, item_id) is None:
+        raise click.ClickException(f"No item with id {item_id}")
+    try:
+        key = store_image_file(path)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    try:
+        written = images.submit(item_id, key).result()
+    except Exception as e:
+        raise click.ClickException(f"Could not make the thumbnails: {e}")
+    images.wait_idle()
+    click.echo(f"Item {item_id} now shows image {key} ({written} new thumbnails)")
+
+
+@assets_cli.command('build')
+def build():
+    """
+    Minifies, bundles, fingerprints and precompresses the static files.
+
+    Run it on every deploy; the app links to the built files once it is restarted.
+    """
+    started = time.perf_counter()
+    manifest = build_assets(current_app.static_folder)
+    assets.load_manifest(current_app)
+    elapsed = time.perf_counter() - started
+    click.echo(f"Built {len(manifest)} assets into {os.path.join(current_app.static_folder, 'dist')} in {elapsed:.1f}s")
+
+
+def write_export(name, file_format, compress, output):
+    """
+    Writes an export to a file or stdout, chunk by chunk.
+
+    Args:
+        name (str): 'items' or 'sales'.
+        file_format (str): 'csv' or 'jsonl'.
+        compress (bool): Gzip the output; implied by an output file ending in .gz.
+        output (str): The file to write, or None for stdout.
+    """
+    compress = compress or bool(output and output.endswith('.gz'))
+    started = time.perf_counter()
+    written = 0
+    stream = open(output, 'wb') if output else click.get_binary_stream('stdout')
+    try:
+        for chunk in export(name, file_format, compress, batch_size=current_app.config['STREAM_YIELD_PER'],
+                            chunk_size=current_app.config['EXPORT_CHUNK_SIZE']):
+            stream.write(chunk)
+            written += len(chunk)
+    finally:
+        if output:
+            stream.close()
+    click.echo(f"Exported {name}: {written:,} bytes in {time.perf_counter() - started:.1f}s", err=True)
+
+
+export_options = [
+    click.option('--format', 'file_format', type=click.Choice(FORMATS), default='csv', show_default=True),
+    click.option('--gzip', 'compress', is_flag=True, help='Gzip the output; implied by a .gz output file.'),
+    click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True),
+                 help='File to write; stdout by default.'),
+]
+
+
+def with_export_options(command):
+    """
+    Adds the options shared by the export commands.
+    """
+    for option in reversed(export_options):
+        command = option(command)
+    return command
+
+
+@export_cli.command('items')
+@with_export_options
+def export_items(file_format, compress, output):
+    """
+    Exports every item with its owner, like /export/items.
+    """
+    write_export('items', file_format, compress, output)
+
+
+@export_cli.command('sales')
+@with_export_options
+def export_sales(file_format, compress, output):
+    """
+    Exports the sold items with their owner and payment, like /export/sales.
+    """
+    write_export('sales', file_format, compress, output)
+
+
+@payments_cli.command('reconcile')
+@click.option('--concurrency', default=20, show_default=True, help='Verify calls to Paystack in flight.')
+@click.option('--batch-size', default=200, show_default=True, help='Payments settled per transaction.')
+@click.option('--limit', type=int, help='Most payments to reconcile, oldest first; all by default.')
+@click.option('--grace', default=30, show_default=True,
+              help='Minutes a buyer has to come back from Paystack before the payment is checked.')
+@click.option('--stale-after', default=10, show_default=True,
+              help='Minutes after which a pending verification is taken over.')
+@click.option('--expire-after', default=24 * 60, show_default=True,
+              help='Minutes after which a payment still open at Paystack is marked failed.')
+def reconcile(concurrency, batch_size, limit, grace, stale_after, expire_after):
+    """
+    Verifies the payments no callback or webhook settled, and hands over the paid items.
+
+    Run it every few minutes, e.g. from cron; concurrent runs skip each other's payments.
+    """
+    stats = reconcile_payments(concurrency=concurrency, batch_size=batch_size, limit=limit,
+                               grace=timedelta(minutes=grace), stale_after=timedelta(minutes=stale_after),
+                               expire_after=timedelta(minutes=expire_after))
+    seconds = stats.pop('seconds')
+    summary = ', '.join(f"{count} {status}" for status, count in stats.items())
+    rate = stats['claimed'] / seconds * 60 if seconds else 0
+    click.echo(f"Reconciled in {seconds:.1f}s ({rate:,.0f}/min): {summary}")
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from werkzeug.http import is_resource_modified
+
+
+def release(app):
+    """
+    Fingerprints what every page depends on besides the data: the templates and
+    the static asset manifest. Both only change with a deploy, so the result is
+    computed once per process.
+
+    Args:
+        app (Flask): The Flask application.
+
+    Returns:
+        tuple: A digest of the files and the time the newest of them was modified.
+    """
+    cached = app.extensions.get('page_release')
+    if cached is None:
+        paths = []
+        for directory, folders, files in os.walk(os.path.join(app.root_path, app.template_folder)):
+            folders.sort()
+            paths.extend(os.path.join(directory, name) for name in sorted(files))
+        manifest = os.path.join(app.static_folder, app.config.get('ASSETS_MANIFEST', 'dist/manifest.json'))
+        if os.path.isfile(manifest):
+            paths.append(manifest)
+        digest = hashlib.sha256()
+        modified = 0
+        for path in paths:
+            with open(path, 'rb') as file:
+                digest.update(path.encode('utf-8') + b'\0' + file.read())
+            modified = max(modified, int(os.path.getmtime(path)))
+        cached = app.extensions['page_release'] = (digest.hexdigest()[:16],
+                                                   datetime.fromtimestamp(modified, timezone.utc))
+    return cached
+
+
+def conditional(validators):
+    """
+    Adds an ETag and a Last-Modified date to a page and answers revalidations that
+    still match with 304 Not Modified, without running the view.
+
+    The ETag covers the validators returned for the request, the signed-in user and
+    the release, since pages greet the user by name and link to fingerprinted
+    assets. Pages of signed-in users also carry a CSRF token, so their ETag covers
+    the token of the session and changes every half token lifetime, before a
+    revalidated token expires. Responses vary on the cookie and must be revalidated
+    before reuse; the pages of signed-in users are private to the browser. Requests with pending
+    flash messages are always rendered, so the messages are shown and consumed.
+
+    Configuration:
+        CONDITIONAL_PAGES (bool): Answer conditional requests for decorated pages.
+
+    Args:
+        validators (callable): Called with the view arguments. Returns a tuple of the
+            values the page depends on and the naive UTC time they last changed, or
+            None if unknown.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if (request.method not in ('GET', 'HEAD') or not current_app.config.get('CONDITIONAL_PAGES', True)
+                    or '_flashes' in session):
+                return view(*args, **kwargs)
+            values, changed_at = validators(*args, **kwargs)
+            digest, released = release(current_app)
+            user_id = current_user.get_id() if current_user.is_authenticated else None
+            token = None
+            if user_id is not None:
+                generate_csrf() # Puts the raw token in a new session before it is fingerprinted
+                time_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+                token = (session.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')),
+                         int(time.time() // (time_limit / 2)) if time_limit else None)
+            etag = hashlib.sha256(repr((digest, user_id, token, values)).encode('utf-8')).hexdigest()[:24]
+            last_modified = released
+            if changed_at is not None:
+                # HTTP dates have a resolution of one second
+                last_modified = max(last_modified, changed_at.replace(tzinfo=timezone.utc, microsecond=0))
+
+            if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            else:
+                response = current_app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            if user_id is not None:
+                response.cache_control.private = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,72 @@
+import os
+
+
+class Config:
+    """
+    Default settings of the application, loaded by `create_app` before any overrides.
+    Settings that differ between deployments are read from the environment.
+    """
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///market.db') # Database instance using SQLAlchemy
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'ec9439cfc6c796ae2029594d') # Signs session cookies and CSRF tokens
+    SQLITE_PRAGMAS = { # Applied to every SQLite connection
+        'journal_mode': 'wal', # Readers no longer wait for the writer
+        'synchronous': 'normal', # Safe with WAL; fsync on checkpoints instead of every commit
+        'busy_timeout': 5000, # Milliseconds to wait for the write lock before failing
+        'cache_size': -20000, # Page cache per connection, in KiB
+        'mmap_size': 268435456, # Bytes of the database file read through memory mapping
+        'temp_store': 'memory', # Keep sort and index temporaries off disk
+    }
+    SQLITE_READ_CONNECTIONS = True # Without a replica, serve read-only pages from query-only connections to the same file
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL') # Read replica for read-only pages, if any
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 10)) # Connections kept open per pool
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 20)) # Extra connections opened under load
+    DATABASE_POOL_TIMEOUT = 10 # Seconds to wait for a free connection before failing
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800)) # Seconds before a pooled connection is replaced
+    ITEMS_PER_PAGE = 50 # Number of unsold items shown per market page
+    API_MAX_PAGE_SIZE = 500 # Upper bound for the `limit` argument of the JSON catalogue API
+    CATALOGUE_INDEX_CHECK_INTERVAL = 1.0 # Seconds the in-memory catalogue index may lag changes made by other workers
+    CATALOGUE_INDEX_REBUILD_INTERVAL = 3600.0 # Seconds between full rebuilds of the catalogue index, which drop deleted items
+    CART_MAX_ITEMS = 50 # Items a shopping cart may hold, and so paid for by one checkout
+    SEARCH_RESULTS_LIMIT = 50 # Maximum number of items returned by a search
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12)) # bcrypt cost factor for new password hashes
+    HASHING_POOL_WORKERS = int(os.environ.get('HASHING_POOL_WORKERS', os.cpu_count() or 1)) # Threads hashing passwords
+    RATELIMIT_ENABLED = True # Throttle login and registration attempts before any bcrypt work
+    RATELIMIT_BACKEND = os.environ.get('RATELIMIT_BACKEND', 'memory') # 'memory' per worker, 'sqlite' per host or 'redis' shared
+    RATELIMIT_URL = os.environ.get('RATELIMIT_URL', 'redis://localhost:6379/0') # Server of the redis rate limit backend
+    RATELIMIT_LOGIN_IP = (20, 60) # Login attempts per client IP: burst size and seconds to refill
+    RATELIMIT_LOGIN_USERNAME = (5, 300) # Login attempts per username: burst size and seconds to refill
+    RATELIMIT_REGISTER_IP = (5, 600) # Registrations per client IP: burst size and seconds to refill
+    HASHING_POOL_MAX_QUEUE = int(os.environ.get('HASHING_POOL_MAX_QUEUE', 16)) # Queued hashing jobs before returning 503
+    USER_CACHE_SIZE = 10000 # Number of logged-in users cached by the session user loader
+    USER_CACHE_TTL = 60 # Seconds a cached session user may be served before reloading
+    USERNAME_CACHE_SIZE = 10000 # Number of free usernames remembered by /api/check-username
+    USERNAME_CACHE_TTL = 10 # Seconds a username may be reported free without checking again
+    EMAIL_CHECK_DELIVERABILITY = False # Look up the mail server of every new address (a DNS query per signup)
+    PAYSTACK_SECRET_KEY = os.environ.get('PAYSTACK_SECRET_KEY', 'sk_test_0c662741e291677d7fc0d2d0a3ca797295bf07ad')
+    PAYSTACK_PUBLIC_KEY = os.environ.get('PAYSTACK_PUBLIC_KEY', 'pk_test_dc9b923da300329f265acef77ffe8adcebbb76d0')
+    PAYSTACK_API_URL = os.environ.get('PAYSTACK_API_URL', 'https://api.paystack.co/') # Base URL of the Paystack API
+    PAYSTACK_POOL_SIZE = 10 # Keep-alive connections to Paystack per worker process
+    PAYSTACK_CONNECT_TIMEOUT = 3.05 # Seconds to wait for a connection to Paystack
+    PAYSTACK_READ_TIMEOUT = 10.0 # Seconds to wait for a Paystack response
+    PAYSTACK_RETRIES = 2 # Retries for connection errors and 5xx responses on idempotent calls
+    PAYSTACK_BREAKER_THRESHOLD = 5 # Consecutive Paystack failures before failing fast
+    PAYSTACK_BREAKER_RESET = 30.0 # Seconds to fail fast before trying Paystack again
+    FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND', 'memory') # memory, filesystem, redis or none
+    FRAGMENT_CACHE_TTL = 300 # Seconds a rendered fragment is kept
+    ASSETS_MANIFEST = 'dist/manifest.json' # Manifest written by `flask assets build`, relative to the static folder
+    ASSETS_MAX_AGE = 31536000 # Seconds browsers cache fingerprinted static files
+    IMAGES_FOLDER = os.environ.get('IMAGES_FOLDER') # Item image originals and thumbnails; instance/images if unset
+    IMAGES_SIZES = (64, 128, 320) # Edges of the square thumbnails made of every item image, in pixels
+    IMAGES_QUALITY = 80 # WebP and JPEG quality of the thumbnails
+    IMAGES_WORKERS = int(os.environ.get('IMAGES_WORKERS', 2)) # Processes making thumbnails, per worker process
+    IMAGES_MAX_BYTES = 10 * 2 ** 20 # Largest item image accepted
+    IMAGES_MAX_AGE = 31536000 # Seconds browsers cache a thumbnail, whose URL changes with its content
+    CATALOGUE_TOKEN = os.environ.get('CATALOGUE_TOKEN') # Bearer token of the item image upload API, disabled without one
+    STREAM_CHUNK_SIZE = 16384 # Characters buffered before a chunk of a streamed page is sent
+    STREAM_YIELD_PER = 1000 # Rows fetched per round trip when streaming the full item list and exports
+    EXPORT_TOKEN = os.environ.get('EXPORT_TOKEN') # Bearer token of the /export endpoints, which are disabled without one
+    EXPORT_CHUNK_SIZE = 65536 # Characters encoded before a chunk of an export is sent
+    CONDITIONAL_PAGES = True # Send ETag and Last-Modified on the home, market and payment pages and answer revalidations with 304
+    METRICS_ENABLED = True # Record request, SQL, bcrypt and Paystack timings and serve them on /metrics
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') # Bearer token of /metrics; without one only local clients may read it
+    SLOW_REQUEST_SECONDS = float(os.environ['SLOW_REQUEST_SECONDS']) if os.environ.get('SLOW_REQUEST_SECONDS') else None # Log slower requests with their SQL
@@ -0,0 +1,142 @@
+from functools import wraps
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+
+
+# Bind key of the engine serving read-only views
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """
+    Session sending the SELECTs of read-only views to the replica engine.
+
+    Everything else uses the primary engine: writes, queries outside a read-only
+    view, and every query of a session that has already flushed changes, so a
+    request always reads its own writes.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and REPLICA_BIND in self._db.engines and not self._flushing
+                and not self.info.get('wrote') and isinstance(clause, Select)
+                and has_app_context() and g.get('read_only')):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _stick_to_primary(session, flush_context):
+    """
+    Keeps a session on the primary engine once it has written anything.
+    """
+    session.info['wrote'] = True
+
+
+def read_only(view):
+    """
+    Marks a view as read-only, so its queries may use the replica engine. Views
+    without it, and any write, use the primary.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def is_sqlite_file(url):
+    """
+    Returns whether a database URL points to an SQLite file rather than an in-memory database.
+    """
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def set_sqlite_pragmas(engine, pragmas):
+    """
+    Runs the given PRAGMA statements on every new connection of an engine.
+
+    Args:
+        engine (Engine): The SQLite engine.
+        pragmas (dict): PRAGMA names and values, applied in order.
+    """
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def engine_options(app, url):
+    """
+    Builds the pool settings of an engine from the app configuration.
+
+    Args:
+        app (Flask): The Flask application.
+        url (str): The database URL of the engine.
+
+    Returns:
+        dict: Engine options for SQLAlchemy. In-memory SQLite gets none, since it
+        must keep a single connection.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and not is_sqlite_file(url):
+        return {}
+    options = {
+        'pool_size': app.config.setdefault('DATABASE_POOL_SIZE', 10),
+        'max_overflow': app.config.setdefault('DATABASE_MAX_OVERFLOW', 20),
+        'pool_timeout': app.config.setdefault('DATABASE_POOL_TIMEOUT', 10),
+        'pool_recycle': app.config.setdefault('DATABASE_POOL_RECYCLE', 1800),
+    }
+    if url.get_backend_name() != 'sqlite':
+        # Server connections can be dropped by the server or a proxy while idle in the pool
+        options['pool_pre_ping'] = True
+    return options
+
+
+def init_database(app, db):
+    """
+    Binds the database to an app, with a connection pool sized from the config and
+    an optional read replica.
+
+    Read-only views use the `replica` bind: DATABASE_REPLICA_URL when it is set, or
+    otherwise, for an SQLite file, a separate pool of query-only connections to the
+    same file. In WAL mode these readers never wait for the writer.
+
+    SQLite files also get the SQLITE_PRAGMAS on every connection (WAL journal,
+    relaxed fsync, memory-mapped reads, a larger page cache and a busy timeout).
+
+    Configuration:
+        SQLALCHEMY_DATABASE_URI (str): The primary database, used for all writes.
+        DATABASE_REPLICA_URL (str): A read replica for read-only views, or None.
+        SQLITE_PRAGMAS (dict): PRAGMA names and values applied to every SQLite connection.
+        SQLITE_READ_CONNECTIONS (bool): Without a replica, serve read-only views from a
+            separate pool of query-only connections to the SQLite file.
+        DATABASE_POOL_SIZE (int): Connections kept open per pool.
+        DATABASE_MAX_OVERFLOW (int): Extra connections opened under load.
+        DATABASE_POOL_TIMEOUT (float): Seconds to wait for a free connection.
+        DATABASE_POOL_RECYCLE (int): Seconds after which a pooled connection is replaced.
+
+    Args:
+        app (Flask): The Flask application.
+        db (SQLAlchemy): The database extension.
+    """
+    pragmas = app.config.setdefault('SQLITE_PRAGMAS', {})
+    primary_url = app.config['SQLALCHEMY_DATABASE_URI']
+    replica_url = app.config.setdefault('DATABASE_REPLICA_URL', None)
+    if replica_url is None and is_sqlite_file(primary_url) and app.config.setdefault('SQLITE_READ_CONNECTIONS', True):
+        replica_url = primary_url
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for name, value in engine_options(app, primary_url).items():
+        options.setdefault(name, value)
+    if replica_url:
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(REPLICA_BIND, dict(engine_options(app, replica_url), url=replica_url))
+    db.init_app(app)
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if is_sqlite_file(engine.url):
+                set_sqlite_pragmas(engine, dict(pragmas, query_only=1) if key == REPLICA_BIND else pragmas)
@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from market import db
+from market.models import Item, Payment, PaymentItem, User
+
+
+FORMATS = ('csv', 'jsonl')
+
+
+def items_query():
+    """
+    Every item with the id, username and email address of its owner, empty for unsold items.
+
+    Returns:
+        Select: The query, in item id order.
+    """
+    return (db.select(Item.id.label('item_id'), Item.name, Item.price, Item.barcode, Item.description,
+                      Item.owner.label('owner_id'), User.username.label('owner_username'),
+                      User.email_address.label('owner_email'))
+            .outerjoin(User, User.id == Item.owner)
+            .order_by(Item.id))
+
+
+def sales_query():
+    """
+    Every sold item with its owner and, when it was bought through Paystack, the
+    reference, amount (in kobo) and settlement time of the successful payment.
+    An item bought in a cart checkout carries the checkout reference and its own
+    share of the amount.
+
+    Returns:
+        Select: The query, in item id order.
+    """
+    payments = db.union_all(
+            db.select(Payment.item_id, Payment.user_id, Payment.reference, Payment.amount, Payment.updated_at)
+            .where(Payment.item_id.is_not(None), Payment.status == Payment.STATUS_SUCCESS),
+            db.select(PaymentItem.item_id, Payment.user_id, Payment.reference, (PaymentItem.price * 100).label('amount'),
+                      Payment.updated_at)
+            .join(Payment, Payment.reference == PaymentItem.reference)
+            .where(PaymentItem.status == Payment.STATUS_SUCCESS)
+            ).subquery()
+    return (db.select(Item.id.label('item_id'), Item.name, Item.price, Item.barcode,
+                      User.id.label('owner_id'), User.username.label('owner_username'),
+                      User.email_address.label('owner_email'), payments.c.reference, payments.c.amount,
+                      payments.c.updated_at.label('paid_at'))
+            .join(User, User.id == Item.owner)
+            .outerjoin(payments, (payments.c.item_id == Item.id) & (payments.c.user_id == User.id))
+            .order_by(Item.id))
+
+
+EXPORTS = {
+    'items': items_query,
+    'sales': sales_query,
+}
+
+
+def _json_value(value):
+    """
+    Converts values json cannot encode, i.e. datetimes, to strings.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def export_rows(name, batch_size=1000):
+    """
+    Runs an export query and iterates over its rows with `yield_per`.
+
+    The rows are plain tuples read in batches through a server-side cursor where
+    the driver supports it, so no ORM objects are built and memory use does not
+    grow with the number of rows.
+
+    Args:
+        name (str): The export, a key of EXPORTS.
+        batch_size (int): The number of rows fetched per round trip.
+
+    Returns:
+        tuple: The column names and an iterator of rows.
+    """
+    result = db.session.execute(EXPORTS[name]().execution_options(yield_per=batch_size))
+    return list(result.keys()), iter(result)
+
+
+def format_rows(columns, rows, file_format, chunk_size=65536):
+    """
+    Encodes rows as CSV with a header line, or as JSON Lines.
+
+    Args:
+        columns (list): The column names.
+        rows (iterable): The rows, as sequences in column order.
+        file_format (str): 'csv' or 'jsonl'.
+        chunk_size (int): Characters collected before a chunk is yielded.
+
+    Yields:
+        bytes: UTF-8 encoded chunks of the file.
+    """
+    buffer = io.StringIO()
+    if file_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        write = writer.writerow
+    else:
+        encoder = json.JSONEncoder(default=_json_value, ensure_ascii=False)
+
+        def write(row):
+            buffer.write(encoder.encode(dict(zip(columns, row))))
+            buffer.write('\n')
+    for row in rows:
+        write(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Compresses a stream of chunks into a gzip file as they are produced.
+
+    Args:
+        chunks (iterable): The chunks to compress, as bytes.
+        level (int): The zlib compression level.
+
+    Yields:
+        bytes: Chunks of the gzip file.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export(name, file_format='csv', compress=False, batch_size=1000, chunk_size=65536):
+    """
+    Streams an export as CSV or JSON Lines, optionally gzipped on the fly.
+
+    Args:
+        name (str): The export, a key of EXPORTS.
+        file_format (str): 'csv' or 'jsonl'.
+        compress (bool): Gzip the output.
+        batch_size (int): The number of rows fetched per round trip.
+        chunk_size (int): Characters encoded before a chunk is yielded.
+
+    Returns:
+        Iterator of bytes: The chunks of the file.
+
+    Raises:
+        ValueError: If the export or the format is unknown.
+    """
+    if name not in EXPORTS:
+        raise ValueError(f"unknown export {name!r}")
+    if file_format not in FORMATS:
+        raise ValueError(f"unknown format {file_format!r}")
+    columns, rows = export_rows(name, batch_size)
+    chunks = format_rows(columns, rows, file_format, chunk_size)
+    return gzip_chunks(chunks) if compress else chunks
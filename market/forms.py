@@ -1,54 +1,75 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField
-from wtforms.validators import Length, EqualTo, Email, DataRequired, ValidationError
+from wtforms import StringField, PasswordField, SubmitField, IntegerField
+from wtforms.widgets import HiddenInput
+from flask import current_app
+from wtforms.validators import Length, EqualTo, DataRequired, ValidationError
+from sqlalchemy.exc import SQLAlchemyError
 from market.models import User
 from email_validator import validate_email, EmailNotValidError
 
 class RegisterForm(FlaskForm):
     """
     Form for registering a new user. Includes custom validation for username and email.
+
+    The field validators only check the format. Whether the username or email address
+    is taken is then checked for both fields in a single query by `validate`.
     """
     def validate_username(self, username_to_check):
         """
-        Validates the username to ensure it is not already in use and contains only alphabets.
+        Validates the username to ensure it contains only alphabets.
 
         Parameters:
             username_to_check (StringField): The username to be validated.
 
         Raises:
-            ValidationError: If the username is already taken or contains non-alphabet characters.
+            ValidationError: If the username contains non-alphabet characters.
         """
-        try:
-            user = User.query.filter_by(username=username_to_check.data).first()
-            if user:
-                if not username_to_check.data.isalpha():
-                    raise ValidationError('Username must contain only alphabets.')
-                except Exception as e:
-                    raise ValidationError(f"An error occurred during username validation: {str(e)}")
+        if not username_to_check.data.isalpha():
+            raise ValidationError('Username must contain only alphabets.')
+
     def validate_email_address(self, email_address_to_check):
         """
-        Validates the email address to ensure it is properly formatted and not already in use.
+        Validates the email address to ensure it is properly formatted, and normalizes it.
 
         Parameters:
             email_address_to_check (StringField): The email address to be validated.
-        
+
         Raises:
-            ValidationError: If the email is invalid or already in use.
+            ValidationError: If the email is invalid.
         """
         try:
-            valid = validate_email(email_address_to_check.data)
-            email_address_to_check.data = valid.email
-            
-            email_address = User.query.filter_by(email_address=email_address_to_check.data).first()
-            if email_address:
-                raise ValidationError('Email Address already exists! Please try a different email address.')
+            valid = validate_email(email_address_to_check.data,
+                                   check_deliverability=current_app.config.get('EMAIL_CHECK_DELIVERABILITY', False))
+            email_address_to_check.data = valid.normalized
         except EmailNotValidError as e:
             raise ValidationError(f'Invalid email address: {str(e)}')
-        except Exception as e:
-            raise ValidationError(f"An error occurred during email validation: {str(e)}")
+
+    def validate(self, extra_validators=None):
+        """
+        Validates the form, then checks the well-formed username and email address
+        against the registered users in one query.
+
+        Returns:
+            bool: True if the form is valid and neither value is taken.
+        """
+        valid = super().validate(extra_validators)
+        username = None if self.username.errors else self.username.data
+        email_address = None if self.email_address.errors else self.email_address.data
+        if username is None and email_address is None:
+            return valid
+        try:
+            username_taken, email_taken = User.find_taken(username, email_address)
+        except SQLAlchemyError as e:
+            self.username.errors.append(f"An error occurred during validation: {str(e)}")
+            return False
+        if username_taken:
+            self.username.errors.append('Username already exists! Please try a different username.')
+        if email_taken:
+            self.email_address.errors.append('Email Address already exists! Please try a different email address.')
+        return valid and not (username_taken or email_taken)
 
     username = StringField(label='User Name:', validators=[Length(min=2, max=30), DataRequired()])
-    email_address = StringField(label='Email Address:', validators=[Email(), DataRequired()])
+    email_address = StringField(label='Email Address:', validators=[DataRequired()])
     password1 = PasswordField(label='Password:', validators=[Length(min=6), DataRequired()])
     password2 = PasswordField(label='Confirm Password:', validators=[EqualTo('password1'), DataRequired()])
     submit = SubmitField(label='Create Account')
@@ -69,3 +90,18 @@ class PurchaseItemForm(FlaskForm):
     """
     submit = SubmitField(label='Purchase Item!')
 
+
+class RemoveFromCartForm(FlaskForm):
+    """
+    Form for removing an item from the shopping cart.
+    """
+    submit = SubmitField(label='Remove')
+
+
+class CheckoutForm(FlaskForm):
+    """
+    Form for paying for the items in the shopping cart.
+    Carries the total shown to the buyer, so a cart changed meanwhile is shown again before charging.
+    """
+    total = IntegerField(widget=HiddenInput(), validators=[DataRequired()])
+    submit = SubmitField(label='Checkout')
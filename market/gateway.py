@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from market.metrics import PAYSTACK_SECONDS, record_time
+
+
+class GatewayError(Exception):
+    """
+    Raised when the payment gateway cannot be reached or returns an unusable response.
+    """
+
+
+class CircuitOpenError(GatewayError):
+    """
+    Raised without contacting the gateway while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while instead of tying up workers on it.
+
+    After `failure_threshold` consecutive failures the breaker opens and every call
+    fails fast for `reset_timeout` seconds. Then a single trial call is let through:
+    if it succeeds the breaker closes, otherwise it opens again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Checks whether a call may go ahead.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with a trial call already running.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError("The payment gateway is unavailable. Please try again shortly.")
+
+    def record_success(self):
+        """
+        Closes the breaker after a successful call.
+        """
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """
+        Counts a failed call and opens the breaker once the threshold is reached.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class PaystackClient:
+    """
+    Client for the Paystack transaction API used by every route that talks to Paystack.
+
+    Each worker process keeps one `requests.Session` with a bounded pool of
+    keep-alive connections, so calls reuse TLS connections instead of opening a
+    new one each time. Calls beyond the pool size get a connection that is closed
+    afterwards rather than queueing for a pooled one. Every call has connect and read timeouts, idempotent calls
+    are retried with backoff, and a circuit breaker fails fast while Paystack is down.
+
+    Configuration:
+        PAYSTACK_SECRET_KEY (str): The secret key sent as the bearer token.
+        PAYSTACK_API_URL (str): The base URL of the Paystack API.
+        PAYSTACK_POOL_SIZE (int): Keep-alive connections kept per process.
+        PAYSTACK_CONNECT_TIMEOUT (float): Seconds to wait for a connection.
+        PAYSTACK_READ_TIMEOUT (float): Seconds to wait for a response.
+        PAYSTACK_RETRIES (int): Retries for connection errors and 502/503/504 on GET requests.
+        PAYSTACK_BREAKER_THRESHOLD (int): Consecutive failures that open the circuit breaker.
+        PAYSTACK_BREAKER_RESET (float): Seconds the breaker stays open before a trial call.
+    """
+    def __init__(self, app=None):
+        self.secret_key = ''
+        self.base_url = 'https://api.paystack.co/'
+        self.pool_size = 10
+        self.timeout = (3.05, 10.0)
+        self.retries = 2
+        self.breaker = CircuitBreaker()
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the client settings from the app configuration.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        self.secret_key = app.config.setdefault('PAYSTACK_SECRET_KEY', '')
+        self.base_url = app.config.setdefault('PAYSTACK_API_URL', 'https://api.paystack.co/').rstrip('/') + '/'
+        self.pool_size = app.config.setdefault('PAYSTACK_POOL_SIZE', 10)
+        self.timeout = (app.config.setdefault('PAYSTACK_CONNECT_TIMEOUT', 3.05),
+                        app.config.setdefault('PAYSTACK_READ_TIMEOUT', 10.0))
+        self.retries = app.config.setdefault('PAYSTACK_RETRIES', 2)
+        self.breaker = CircuitBreaker(app.config.setdefault('PAYSTACK_BREAKER_THRESHOLD', 5),
+                                      app.config.setdefault('PAYSTACK_BREAKER_RESET', 30.0))
+        self._session = None
+
+    @property
+    def session(self):
+        """
+        The HTTP session of the current process, created on first use so that
+        pre-forked workers never share sockets opened by the parent.
+        """
+        if self._session is None or self._session_pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    # Imported here so that processes which never call Paystack skip loading requests
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    from urllib3.util.retry import Retry
+                    retry = Retry(total=self.retries, connect=self.retries, read=self.retries,
+                                  status=self.retries, backoff_factor=0.3,
+                                  status_forcelist=(502, 503, 504), allowed_methods=frozenset({'GET'}),
+                                  raise_on_status=False)
+                    # A full pool opens an extra connection instead of waiting, without a bound, for a free one
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                                          max_retries=retry, pool_block=False)
+                    session = requests.Session()
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers.update({'Authorization': f'Bearer {self.secret_key}',
+                                            'Content-Type': 'application/json'})
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def _request(self, operation, method, path, **kwargs):
+        """
+        Sends a request to Paystack through the circuit breaker, timing it under
+        `operation` in the Paystack latency metrics.
+
+        Returns:
+            dict: The decoded JSON body. Paystack reports request errors (4xx) in the
+            body with `status` set to False, so those are returned rather than raised.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+            GatewayError: On connection errors, timeouts, 5xx responses or a non-JSON body.
+        """
+        import requests
+        self.breaker.before_call()
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            if response.status_code >= 500:
+                raise GatewayError(f"Paystack returned HTTP {response.status_code}")
+            body = response.json()
+        except (requests.RequestException, ValueError, GatewayError) as e:
+            record_time(PAYSTACK_SECONDS, (operation, 'error'), time.perf_counter() - started, 'paystack_seconds')
+            self.breaker.record_failure()
+            if isinstance(e, GatewayError):
+                raise
+            raise GatewayError(f"Paystack request failed: {e}") from e
+        except BaseException:
+            # Any other error still ends a half-open trial, which would otherwise never close or reopen
+            record_time(PAYSTACK_SECONDS, (operation, 'error'), time.perf_counter() - started, 'paystack_seconds')
+            self.breaker.record_failure()
+            raise
+        record_time(PAYSTACK_SECONDS, (operation, 'ok'), time.perf_counter() - started, 'paystack_seconds')
+        self.breaker.record_success()
+        return body
+
+    def initialize_transaction(self, reference, amount, email, callback_url):
+        """
+        Starts a transaction and returns the authorization URL to send the buyer to.
+
+        Args:
+            reference (str): A unique transaction reference.
+            amount (int): The amount to charge, in kobo.
+            email (str): The email address of the buyer.
+            callback_url (str): Where Paystack redirects the buyer afterwards.
+
+        Returns:
+            dict: The Paystack initialize response.
+        """
+        return self._request('initialize', 'POST', 'transaction/initialize', json={
+            'reference': reference,
+            'amount': amount,
+            'email': email,
+            'callback_url': callback_url
+            })
+
+    def verify_transaction(self, reference):
+        """
+        Fetches the outcome of a transaction.
+
+        Args:
+            reference (str): The transaction reference.
+
+        Returns:
+            dict: The Paystack verify response.
+        """
+        return self._request('verify', 'GET', f'transaction/verify/{reference}')
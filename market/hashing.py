@@ -0,0 +1,135 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from market.metrics import BCRYPT_SECONDS, timed
+
+
+class HashingPoolFull(Exception):
+    """
+    Raised when too many password hashing jobs are already queued.
+    The request should be rejected with a 503 instead of waiting for a slot.
+    """
+
+
+class HashingPool:
+    """
+    Runs bcrypt hashing and verification on a bounded pool of worker threads.
+
+    bcrypt releases the GIL while hashing, so a thread pool spreads the work over
+    all cores while the number of jobs that can be running or queued at once stays
+    bounded. When the pool is full, new jobs are rejected with `HashingPoolFull`
+    instead of piling up behind a login burst.
+
+    Configuration:
+        BCRYPT_LOG_ROUNDS (int): The bcrypt cost factor used for new hashes.
+        HASHING_POOL_WORKERS (int): The number of hashing threads.
+        HASHING_POOL_MAX_QUEUE (int): The number of jobs that may wait for a free thread.
+    """
+    def __init__(self, bcrypt, app=None):
+        self.bcrypt = bcrypt
+        self.workers = os.cpu_count() or 1
+        self.max_queue = self.workers * 4
+        self.log_rounds = 12
+        self._executor = None
+        self._executor_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the pool settings from the app configuration.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        self.log_rounds = app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        self.workers = app.config.setdefault('HASHING_POOL_WORKERS', os.cpu_count() or 1)
+        self.max_queue = app.config.setdefault('HASHING_POOL_MAX_QUEUE', self.workers * 4)
+        self.shutdown()
+
+    def _get_executor(self):
+        """
+        Returns the executor, creating it on first use in every process so that
+        pre-forked workers do not share threads created in the parent.
+        """
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='bcrypt')
+                    self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def shutdown(self):
+        """
+        Stops the worker threads. A new pool is created on the next job.
+        """
+        with self._lock:
+            if self._executor is not None and self._executor_pid == os.getpid():
+                self._executor.shutdown(wait=False)
+            self._executor = None
+            self._executor_pid = None
+
+    def run(self, function, *args):
+        """
+        Runs a function on the pool and waits for its result.
+
+        Raises:
+            HashingPoolFull: If all workers are busy and the queue is full.
+        """
+        executor = self._get_executor()
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HashingPoolFull("Too many password hashing requests are in progress.")
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future.result()
+
+    def generate_password_hash(self, password):
+        """
+        Hashes a password with the configured cost factor.
+
+        Args:
+            password (str): The plain text password.
+
+        Returns:
+            str: The bcrypt hash.
+        """
+        with timed(BCRYPT_SECONDS, ('hash',), 'bcrypt_seconds'):
+            return self.run(self.bcrypt.generate_password_hash, password, self.log_rounds).decode('utf-8')
+
+    def check_password_hash(self, password_hash, password):
+        """
+        Checks a password against a bcrypt hash.
+
+        Args:
+            password_hash (str): The stored bcrypt hash.
+            password (str): The plain text password to check.
+
+        Returns:
+            bool: True if the password matches the hash.
+        """
+        with timed(BCRYPT_SECONDS, ('check',), 'bcrypt_seconds'):
+            return self.run(self.bcrypt.check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """
+        Checks whether a hash was made with a different cost factor than the configured one.
+
+        Args:
+            password_hash (str): The stored bcrypt hash, e.g. `$2b$12$...`.
+
+        Returns:
+            bool: True if the password should be hashed again.
+        """
+        try:
+            return int(password_hash.split('$')[2]) != self.log_rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
@@ -0,0 +1,302 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import abort, current_app, has_app_context, send_from_directory, url_for
+
+
+logger = logging.getLogger(__name__)
+
+# Formats a thumbnail is written in, by URL extension
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+
+# Leading bytes of the image files accepted as originals
+SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a')
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_image(data):
+    """
+    Checks the leading bytes of an upload against the JPEG, PNG, GIF and WebP
+    signatures, without decoding it.
+
+    Args:
+        data (bytes): The uploaded file.
+
+    Returns:
+        bool: True if the data starts like a supported image file.
+    """
+    return data.startswith(SIGNATURES) or (data[:4] == b'RIFF' and data[8:12] == b'WEBP')
+
+
+def shard(folder, key):
+    """
+    The directory holding the files of an image, split by the first two characters
+    of its key so no directory grows too large.
+    """
+    return os.path.join(folder, key[:2])
+
+
+def thumbnail_name(key, size, extension):
+    """
+    The file name of a thumbnail, e.g. '<key>-128.webp'.
+    """
+    return f'{key}-{size}.{extension}'
+
+
+def write_atomically(path, write):
+    """
+    Writes a file under a temporary name and renames it into place, so readers
+    never see a partial file.
+
+    Args:
+        path (str): The file to write.
+        write (callable): Called with the open binary file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            write(file)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def make_thumbnails(original, folder, key, sizes, quality):
+    """
+    Writes the square thumbnails of an original in every size and format.
+    Runs in a worker process; thumbnails already on disk are kept.
+
+    Args:
+        original (str): The path of the original image.
+        folder (str): The image folder.
+        key (str): The content hash of the original.
+        sizes (tuple): The thumbnail edges, in pixels.
+        quality (int): The WebP and JPEG quality.
+
+    Returns:
+        int: The number of thumbnails written.
+
+    Raises:
+        RuntimeError: If Pillow is not installed.
+        OSError: If the original cannot be decoded.
+    """
+    try:
+        import warnings
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise RuntimeError("The Pillow package is required to make item thumbnails.")
+    written = 0
+    with warnings.catch_warnings():
+        # Refuse images large enough to be decompression bombs
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        with Image.open(original) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            for size in sizes:
+                thumbnail = None
+                for extension, image_format in FORMATS.items():
+                    path = os.path.join(shard(folder, key), thumbnail_name(key, size, extension))
+                    if os.path.exists(path):
+                        continue
+                    if thumbnail is None:
+                        thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                    write_atomically(path, lambda file: thumbnail.save(
+                            file, image_format, quality=quality, **({'method': 4} if image_format == 'WEBP'
+                                                                    else {'optimize': True, 'progressive': True})))
+                    written += 1
+    return written
+
+
+class ImagePipeline:
+    """
+    Stores item images and makes their thumbnails in a pool of worker processes.
+
+    Originals are stored under the SHA-256 of their content, so the same picture
+    uploaded twice is kept and processed once. Their square thumbnails are written
+    in WebP and JPEG in every configured size next to them, and the item is only
+    pointed at the image once they are all on disk. Decoding and resizing never run
+    on a request thread; requests only check the file signature and write the original.
+
+    Thumbnails are served from `/images/<key>-<size>.<webp|jpg>`; their content never
+    changes under a URL, so browsers may cache them for good.
+
+    Configuration:
+        IMAGES_FOLDER (str): Where originals and thumbnails are stored; instance/images by default.
+        IMAGES_SIZES (tuple): The thumbnail edges, in pixels, smallest first.
+        IMAGES_QUALITY (int): The WebP and JPEG quality.
+        IMAGES_WORKERS (int): The number of worker processes.
+        IMAGES_MAX_BYTES (int): The largest original accepted.
+        IMAGES_MAX_AGE (int): Seconds browsers cache a thumbnail.
+    """
+    def __init__(self, app=None):
+        self.app = None
+        self.folder = None
+        self.sizes = (64, 128, 320)
+        self.quality = 80
+        self.workers = 2
+        self.max_bytes = 10 * 2 ** 20
+        self._executor = None
+        self._executor_pid = None
+        self._pending = 0
+        self._condition = threading.Condition()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the pipeline settings from the app configuration and registers the thumbnail route.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        self.app = app
+        self.folder = app.config.get('IMAGES_FOLDER') or os.path.join(app.instance_path, 'images')
+        self.sizes = tuple(app.config.setdefault('IMAGES_SIZES', (64, 128, 320)))
+        self.quality = app.config.setdefault('IMAGES_QUALITY', 80)
+        self.workers = app.config.setdefault('IMAGES_WORKERS', 2)
+        self.max_bytes = app.config.setdefault('IMAGES_MAX_BYTES', 10 * 2 ** 20)
+        app.config.setdefault('IMAGES_MAX_AGE', 31536000)
+        app.add_url_rule('/images/<key>-<int:size>.<any(webp, jpg):extension>', 'item_image', self.thumbnail_view)
+        app.jinja_env.globals['item_image_url'] = self.url
+        app.jinja_env.globals['item_image_srcset'] = self.srcset
+
+    def _pool(self):
+        """
+        The worker processes of the current process, started on first use so that
+        pre-forked workers never share a pool created by the parent.
+        """
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._condition:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    # Spawned rather than forked, so no lock held by another thread is copied
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+                    self._executor_pid = os.getpid()
+                    self._pending = 0
+        return self._executor
+
+    def store(self, data):
+        """
+        Stores an original image under the hash of its content.
+
+        Args:
+            data (bytes): The image file.
+
+        Returns:
+            str: The key of the image.
+
+        Raises:
+            ValueError: If the data is too large or not a JPEG, PNG, GIF or WebP file.
+        """
+        if len(data) > self.max_bytes:
+            raise ValueError(f"Images may be at most {self.max_bytes // 2 ** 20} MiB.")
+        if not is_image(data):
+            raise ValueError("Images must be JPEG, PNG, GIF or WebP files.")
+        key = hashlib.sha256(data).hexdigest()
+        path = self.original_path(key)
+        if not os.path.exists(path):
+            write_atomically(path, lambda file: file.write(data))
+        return key
+
+    def original_path(self, key):
+        """
+        The path of the original of an image.
+        """
+        return os.path.join(shard(os.path.join(self.folder, 'originals'), key), key)
+
+    def submit(self, item_id, key):
+        """
+        Schedules the thumbnails of an image; once they are written, the item is given the image.
+
+        Args:
+            item_id (int): The item shown in the image.
+            key (str): The key returned by `store`.
+
+        Returns:
+            Future: The thumbnail job, resolving to the number of thumbnails written.
+        """
+        app = current_app._get_current_object() if has_app_context() else self.app
+        pool = self._pool()
+        with self._condition:
+            self._pending += 1
+        future = pool.submit(make_thumbnails, self.original_path(key), self.folder, key, self.sizes, self.quality)
+        future.add_done_callback(lambda done: self._finish(app, item_id, key, done))
+        return future
+
+    def _finish(self, app, item_id, key, future):
+        """
+        Points the item at its image once the thumbnails are on disk.
+        """
+        from market.models import Item
+        try:
+            if future.exception() is not None:
+                logger.error("Thumbnails of image %s for item %s failed: %s", key, item_id, future.exception())
+                return
+            with app.app_context():
+                Item.set_image(item_id, key)
+        except Exception:
+            logger.exception("Could not set image %s on item %s", key, item_id)
+        finally:
+            with self._condition:
+                self._pending -= 1
+                self._condition.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """
+        Waits until every submitted image has been processed.
+
+        Args:
+            timeout (float): The most seconds to wait.
+
+        Returns:
+            bool: True if no job is left.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending == 0, timeout)
+
+    def url(self, key, size, extension='webp'):
+        """
+        The URL of a thumbnail, for templates as `item_image_url`.
+
+        Args:
+            key (str): The key of the image.
+            size (int): One of the configured sizes.
+            extension (str): 'webp' or 'jpg'.
+        """
+        return url_for('item_image', key=key, size=size, extension=extension)
+
+    def srcset(self, key, edge, extension='webp'):
+        """
+        The `srcset` of an image shown `edge` pixels wide, for templates as `item_image_srcset`:
+        the smallest thumbnail covering 1x and 2x displays.
+
+        Args:
+            key (str): The key of the image.
+            edge (int): The displayed width and height, in CSS pixels.
+            extension (str): 'webp' or 'jpg'.
+        """
+        candidates = []
+        for density in (1, 2):
+            size = next((size for size in self.sizes if size >= edge * density), self.sizes[-1])
+            if not candidates or candidates[-1][0] != size:
+                candidates.append((size, density))
+        return ', '.join(f'{self.url(key, size, extension)} {density}x' for size, density in candidates)
+
+    def thumbnail_view(self, key, size, extension):
+        """
+        Serves a thumbnail with headers letting browsers keep it for a year without revalidating.
+        """
+        if not KEY_PATTERN.match(key) or size not in self.sizes:
+            abort(404)
+        response = send_from_directory(shard(self.folder, key), thumbnail_name(key, size, extension),
+                                       max_age=current_app.config['IMAGES_MAX_AGE'])
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
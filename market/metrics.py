@@ -0,0 +1,300 @@
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, abort, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Endpoint label of work done outside a request, such as background payment verification
+BACKGROUND = '<background>'
+
+# Client addresses allowed to read /metrics when no METRICS_TOKEN is set
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+# Method labels of requests; any other method is counted as 'other'
+METHODS = frozenset({'GET', 'POST', 'HEAD', 'PUT', 'DELETE', 'PATCH', 'OPTIONS'})
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def escape_label(value):
+    """
+    Escapes a label value for the Prometheus text format.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """
+    A monotonically increasing value per combination of label values.
+    """
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {value}'
+
+
+class Histogram:
+    """
+    Counts observations in cumulative buckets per combination of label values,
+    together with their sum and count.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, labels=()):
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, [("le", bound)])} {bucket_count}'
+            yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, [("le", "+Inf")])} {count}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {total}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}'
+
+
+REQUEST_SECONDS = Histogram('techieseller_request_duration_seconds',
+                            'Time spent handling requests, by endpoint.', ('endpoint', 'method'))
+REQUESTS = Counter('techieseller_requests_total', 'Requests handled, by endpoint and status.',
+                   ('endpoint', 'method', 'status'))
+SQL_QUERIES = Counter('techieseller_sql_queries_total', 'SQL statements executed, by endpoint.', ('endpoint',))
+SQL_SECONDS = Counter('techieseller_sql_seconds_total', 'Time spent in SQL statements, by endpoint.', ('endpoint',))
+BCRYPT_SECONDS = Histogram('techieseller_bcrypt_duration_seconds',
+                           'Time requests waited for bcrypt, including queueing for the hashing pool.',
+                           ('operation',), buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+PAYSTACK_SECONDS = Histogram('techieseller_paystack_request_duration_seconds',
+                             'Time spent in outbound Paystack calls, by operation and outcome.',
+                             ('operation', 'outcome'))
+RATELIMIT_DECISIONS = Counter('techieseller_ratelimit_decisions_total',
+                              'Rate-limited attempts served or throttled, by action.', ('action', 'outcome'))
+
+METRICS = (REQUEST_SECONDS, REQUESTS, SQL_QUERIES, SQL_SECONDS, BCRYPT_SECONDS, PAYSTACK_SECONDS, RATELIMIT_DECISIONS)
+
+
+def render_metrics():
+    """
+    Renders every metric in the Prometheus text exposition format.
+
+    Returns:
+        str: The metrics page.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+def current_endpoint():
+    """
+    Returns the endpoint label of the current request, or BACKGROUND outside requests.
+    """
+    if not has_request_context():
+        return BACKGROUND
+    return request.endpoint or '<unmatched>'
+
+
+def current_method():
+    """
+    Returns the method label of the current request, with methods outside
+    METHODS counted as 'other' so clients cannot add label values at will.
+    """
+    return request.method if request.method in METHODS else 'other'
+
+
+def record_time(histogram, labels, seconds, request_total=None):
+    """
+    Records a duration in a histogram, and adds it to the current request's total
+    under `request_total` for the slow-request log.
+    """
+    histogram.observe(labels, seconds)
+    if request_total and has_request_context() and 'metrics' in g:
+        g.metrics[request_total] = g.metrics.get(request_total, 0.0) + seconds
+
+
+@contextmanager
+def timed(histogram, labels, request_total=None):
+    """
+    Times a block with `record_time`.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(histogram, labels, time.perf_counter() - started, request_total)
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, which is discarded with it if the statement fails
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+    else:
+        connection.info['metrics_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        started = getattr(context, '_metrics_started', None)
+    else:
+        started = connection.info.pop('metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    endpoint = current_endpoint()
+    SQL_QUERIES.inc((endpoint,))
+    SQL_SECONDS.inc((endpoint,), elapsed)
+    if endpoint != BACKGROUND and 'metrics' in g:
+        g.metrics['sql_count'] += 1
+        g.metrics['sql_seconds'] += elapsed
+        queries = g.metrics.get('queries')
+        if queries is not None and len(queries) < g.metrics['max_queries']:
+            queries.append((elapsed, statement))
+
+
+class Instrumentation:
+    """
+    Records request latency, SQL statements, bcrypt time, Paystack call time and
+    rate limiting decisions, and serves them on a Prometheus-text `/metrics` endpoint.
+
+    Every worker process keeps its own figures, so each worker is scraped
+    separately (or all report through one process, e.g. with a single worker).
+
+    `/metrics` is served to requests bearing METRICS_TOKEN, or, without a token,
+    only to clients on this host, so deployments scraped through a proxy or from
+    another host must set a token.
+
+    Configuration:
+        METRICS_ENABLED (bool): Record metrics and serve `/metrics`.
+        METRICS_TOKEN (str): Bearer token required to read `/metrics`; None allows local clients only.
+        SLOW_REQUEST_SECONDS (float): Log requests slower than this, with their SQL
+            statements, as warnings; None disables the slow-request log.
+        SLOW_REQUEST_MAX_QUERIES (int): Statements kept per request for the slow-request log.
+    """
+    _sql_listeners = False
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Registers the request hooks, the SQL event listeners and the `/metrics` endpoint.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        if not app.config.setdefault('METRICS_ENABLED', True):
+            return
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('SLOW_REQUEST_SECONDS', None)
+        app.config.setdefault('SLOW_REQUEST_MAX_QUERIES', 100)
+        app.before_request(self._start_request)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        if not Instrumentation._sql_listeners:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            Instrumentation._sql_listeners = True
+
+    @staticmethod
+    def metrics_view():
+        """
+        Serves the metrics of this worker process in the Prometheus text format,
+        to clients bearing METRICS_TOKEN or, without one, to local clients.
+        """
+        token = current_app.config['METRICS_TOKEN']
+        if token:
+            if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                                       f'Bearer {token}'.encode('utf-8')):
+                return Response('Invalid token\n', 401, {'WWW-Authenticate': 'Bearer'}, mimetype='text/plain')
+        elif request.remote_addr not in LOCAL_ADDRESSES:
+            abort(403)
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    @staticmethod
+    def _start_request():
+        slow_log = current_app.config['SLOW_REQUEST_SECONDS'] is not None
+        g.metrics = {
+            'started': time.perf_counter(),
+            'sql_count': 0,
+            'sql_seconds': 0.0,
+            'queries': [] if slow_log else None,
+            'max_queries': current_app.config['SLOW_REQUEST_MAX_QUERIES'],
+        }
+
+    @staticmethod
+    def _record_status(response):
+        if 'metrics' in g:
+            g.metrics['status'] = response.status_code
+        return response
+
+    @staticmethod
+    def _finish_request(exception):
+        metrics = g.pop('metrics', None)
+        if metrics is None:
+            return
+        elapsed = time.perf_counter() - metrics['started']
+        endpoint = current_endpoint()
+        status = metrics.get('status', 500)
+        method = current_method()
+        REQUEST_SECONDS.observe((endpoint, method), elapsed)
+        REQUESTS.inc((endpoint, method, str(status)))
+        threshold = current_app.config['SLOW_REQUEST_SECONDS']
+        if threshold is not None and elapsed >= threshold:
+            queries = '\n'.join(f'    {seconds * 1000:8.2f} ms  {" ".join(statement.split())}'
+                                for seconds, statement in metrics['queries'])
+            current_app.logger.warning(
+                'Slow request: %s %s (%s) %d in %.1f ms; %d SQL statements in %.1f ms, '
+                'bcrypt %.1f ms, Paystack %.1f ms\n%s',
+                request.method, request.path, endpoint, status, elapsed * 1000,
+                metrics['sql_count'], metrics['sql_seconds'] * 1000,
+                metrics.get('bcrypt_seconds', 0.0) * 1000, metrics.get('paystack_seconds', 0.0) * 1000, queries)
@@ -1,24 +1,61 @@
+import hashlib
+from datetime import datetime, timezone
 from market import db, login_manager
-from market import bcrypt
+from market import hashing_pool
+from market.cache import TTLCache
 from flask_login import UserMixin
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy import DDL, event, or_
+from sqlalchemy.orm import validates
 from werkzeug.security import check_password_hash
 
+# Caches the few user fields the templates need, keyed by user id; sized from the config by create_app
+user_cache = TTLCache()
+
+# Usernames recently found to be free, so as-you-type availability checks rarely query; sized by create_app
+username_cache = TTLCache()
+
+
+class SessionUser(UserMixin):
+    """
+    Lightweight stand-in for User used as `current_user` on authenticated requests.
+    Holds only the fields the templates and routes read, so it can be cached between requests.
+
+    Attributes:
+        id (int): The ID of the user.
+        username (str): The username of the user.
+        email_address (str): The email address of the user.
+    """
+    def __init__(self, id, username, email_address):
+        self.id = id
+        self.username = username
+        self.email_address = email_address
+
+
 @login_manager.user_loader
 def load_user(user_id):
     """
     Loads the user by user_id for session management.
+    Users are served from `user_cache` when possible, which saves a SELECT per request.
 
     Args:
         user_id (int): The ID of the user to load.
 
     Returns:
-        User object if found, otherwise None.
+        SessionUser object if found, otherwise None.
     """
     try:
-        return User.query.get(int(user_id))
+        user_id = int(user_id)
     except (ValueError, TypeError) as e:
         return None
+    session_user = user_cache.get(user_id)
+    if session_user is None:
+        row = db.session.query(User.id, User.username, User.email_address).filter_by(id=user_id).first()
+        if row is None:
+            return None
+        session_user = SessionUser(row.id, row.username, row.email_address)
+        user_cache.set(user_id, session_user)
+    return session_user
 
 class User(db.Model, UserMixin):
     """
@@ -60,11 +97,13 @@ class User(db.Model, UserMixin):
         """
         if not plain_text_password or len(plain_text_password) < 6:
             raise ValueError("Password must be at least 6 characters long.")
-        self.password_hash = bcrypt.generate_password_hash(plain_text_password).decode('utf-8')
+        self.password_hash = hashing_pool.generate_password_hash(plain_text_password)
 
     def check_password_correction(self, attempted_password):
         """
         Checks if the provided password matches the stored password hash.
+        If it matches but the hash was made with a different cost factor than the
+        configured one, the password is hashed again and the user is saved.
 
         Args:
             attempted_password (str): The password to check.
@@ -77,11 +116,61 @@ class User(db.Model, UserMixin):
         """
         if not attempted_password:
             raise ValueError("Attempted password cannot be empty.")
-         return bcrypt.check_password_hash(self.password_hash, attempted_password)
+        if not hashing_pool.check_password_hash(self.password_hash, attempted_password):
+            return False
+        if hashing_pool.needs_rehash(self.password_hash):
+            self.password = attempted_password
+            if db.inspect(self).persistent:
+                try:
+                    self.save()
+                except (ValueError, RuntimeError):
+                    pass  # The old hash still works, so a failed rehash must not block the login
+        return True
+
+    @classmethod
+    def find_taken(cls, username, email_address):
+        """
+        Checks in one query whether a username or an email address is already registered.
+        Both columns have unique indexes, so this is two index lookups. The unique
+        constraints, enforced by `save`, remain the authority against races.
+
+        Args:
+            username (str): The username to check, or None.
+            email_address (str): The email address to check, or None.
+
+        Returns:
+            tuple: Whether the username is taken and whether the email address is taken.
+        """
+        rows = db.session.execute(db.select(cls.username, cls.email_address)
+                                  .where(or_(cls.username == username, cls.email_address == email_address))
+                                  .limit(2)).all()
+        return (any(row.username == username for row in rows),
+                any(row.email_address == email_address for row in rows))
+
+    @classmethod
+    def is_username_available(cls, username):
+        """
+        Checks whether a username is free, answering from the cache of recently free
+        usernames when possible. Registered usernames are removed from that cache by
+        `save`; other workers may report a just-taken name as free for up to the
+        cache TTL, which only affects the hint shown while typing.
+
+        Args:
+            username (str): The username to check.
+
+        Returns:
+            bool: True if no user has the username.
+        """
+        if username_cache.get(username):
+            return True
+        available = db.session.scalar(db.select(cls.id).where(cls.username == username).limit(1)) is None
+        if available:
+            username_cache.set(username, True)
+        return available
 
     def save(self):
         """
-        Saves the user to the database.
+        Saves the user to the database and drops any cached copy of it.
 
         Raises:
             ValueError: If the username or email address is already taken.
@@ -90,6 +179,8 @@ class User(db.Model, UserMixin):
         try:
             db.session.add(self)
             db.session.commit()
+            user_cache.delete(self.id)
+            username_cache.delete(self.username)
         except IntegrityError:
             db.session.rollback()
             raise ValueError("User with this username or email already exists.")
@@ -107,14 +198,28 @@ class Item(db.Model):
         price (int): The price of the item.
         barcode (str): The barcode of the item (unique).
         description (str): The description of the item.
-        owner (int): The ID of the user who owns the item (foreign key)
+        description_hash (str): SHA-256 of the description, used to keep descriptions unique (unique).
+        owner (int): The ID of the user who owns the item (foreign key, indexed)
+        image (str): The key of the item's image in the image pipeline, or None (see market/images.py).
+        revision (int): The catalogue version that last changed the item (indexed), so
+            per-worker catalogue indexes can load only what changed.
     """
+    __table_args__ = (
+        # Partial index covering only unsold items, used by the market listing.
+        db.Index('ix_item_unsold', 'id',
+                 sqlite_where=db.text('owner IS NULL'),
+                 postgresql_where=db.text('owner IS NULL')),
+    )
+
     id = db.Column(db.Integer(), primary_key=True)
     name = db.Column(db.String(length=30), nullable=False, unique=True)
     price = db.Column(db.Integer(), nullable=False)
     barcode = db.Column(db.String(length=12), nullable=False, unique=True)
-    description = db.Column(db.String(length=1024), nullable=False, unique=True)
-    owner = db.Column(db.Integer(), db.ForeignKey('user.id'))
+    description = db.Column(db.String(length=1024), nullable=False)
+    description_hash = db.Column(db.String(length=64), nullable=False, unique=True)
+    owner = db.Column(db.Integer(), db.ForeignKey('user.id'), index=True)
+    image = db.Column(db.String(length=64), nullable=True)
+    revision = db.Column(db.Integer(), nullable=False, default=0, server_default='0', index=True)
 
     def __repr__(self):
         """
@@ -125,12 +230,141 @@ class Item(db.Model):
         """
         return f'Item {self.name}'
 
+    @staticmethod
+    def hash_description(description):
+        """
+        Hashes an item description for the uniqueness check.
+
+        Args:
+            description (str): The description of the item.
+
+        Returns:
+            str: The hex SHA-256 digest of the description.
+        """
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    @validates('description')
+    def validate_description(self, key, description):
+        """
+        Keeps the description hash in step with the description.
+        """
+        if description is not None:
+            self.description_hash = self.hash_description(description)
+        return description
+
+    @classmethod
+    def unsold_page(cls, after=None, limit=50, columns=None):
+        """
+        Fetches one page of unsold items using keyset pagination on the item id.
+
+        Instead of an OFFSET, the page starts right after the last id of the previous
+        page, so fetching any page costs the same no matter how large the catalogue is.
+
+        Args:
+            after (int): The id of the last item of the previous page, or None for the first page.
+            limit (int): The maximum number of items to return.
+            columns (list): Optional columns to select instead of full Item objects.
+
+        Returns:
+            tuple: The list of items (or rows) on the page and the cursor for the next page,
+            which is None when there are no more items.
+        """
+        query = cls.query.filter(cls.owner.is_(None))
+        if columns:
+            query = query.with_entities(*columns)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        rows = query.order_by(cls.id).limit(limit + 1).all()
+        next_cursor = rows[limit - 1].id if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    @classmethod
+    def iter_unsold(cls, columns=None, batch_size=1000):
+        """
+        Iterates over every unsold item in id order without loading them all at once.
+
+        The rows are fetched `batch_size` at a time with `yield_per`, which also makes
+        drivers that support it (such as psycopg2) use a server-side cursor, so memory
+        use does not grow with the size of the catalogue.
+
+        Args:
+            columns (list): The columns to select; defaults to the ones shown in the item table.
+            batch_size (int): The number of rows fetched per round trip.
+
+        Returns:
+            Iterator of rows with the selected columns.
+        """
+        columns = columns or [cls.id, cls.name, cls.price, cls.barcode, cls.description, cls.image]
+        query = db.select(*columns).where(cls.owner.is_(None)).order_by(cls.id)
+        return iter(db.session.execute(query.execution_options(yield_per=batch_size)))
+
+    @classmethod
+    def transfer_ownership(cls, item_id, user_id):
+        """
+        Assigns an unsold item to a user with a single conditional UPDATE.
+        The change is not committed, so it can share a transaction with the payment record.
+
+        Args:
+            item_id (int): The ID of the item being bought.
+            user_id (int): The ID of the buyer.
+
+        Returns:
+            bool: True if the item was unsold and now belongs to the user, False if it was already sold.
+        """
+        result = db.session.execute(
+                db.update(cls).where(cls.id == item_id, cls.owner.is_(None)).values(owner=user_id)
+                )
+        if result.rowcount != 1:
+            return False
+        CatalogueVersion.bump(db.session.connection(), cls.id == item_id)
+        return True
+
+    @classmethod
+    def transfer_many(cls, item_ids, user_id):
+        """
+        Assigns the unsold items among `item_ids` to a user with a single conditional UPDATE,
+        e.g. the items of a checkout. Items sold to someone else first are left alone.
+        The change is not committed, so it can share a transaction with the payment record.
+
+        Args:
+            item_ids (list): The IDs of the items being bought.
+            user_id (int): The ID of the buyer.
+
+        Returns:
+            set: The IDs of the items that were unsold and now belong to the user.
+        """
+        if not item_ids:
+            return set()
+        result = db.session.execute(
+                db.update(cls).where(cls.id.in_(item_ids), cls.owner.is_(None)).values(owner=user_id)
+                .returning(cls.id),
+                execution_options={'synchronize_session': False}
+                )
+        transferred = set(result.scalars())
+        if transferred:
+            CatalogueVersion.bump(db.session.connection(), cls.id.in_(transferred))
+        return transferred
+
+    @classmethod
+    def set_image(cls, item_id, key):
+        """
+        Points an item at an image whose thumbnails are ready and commits.
+
+        Args:
+            item_id (int): The ID of the item.
+            key (str): The key of the image, or None to remove it.
+        """
+        result = db.session.execute(db.update(cls).where(cls.id == item_id).values(image=key))
+        if result.rowcount == 1:
+            CatalogueVersion.bump(db.session.connection(), cls.id == item_id)
+        db.session.commit()
+
     def save(self):
         """
         Saves the item to the database.
 
         Raises:
-            ValueError: If the item name or barcode is already taken.
+            ValueError: If the item name, barcode or description is already taken.
             RuntimeError: If any other SQLAlchemy error occur.
         """
         try:
@@ -138,9 +372,233 @@ class Item(db.Model):
             db.session.commit()
         except IntegrityError:
             db.session.rollback()
-            raise ValueError("Item with this name or barcode already exists.")
+            raise ValueError("Item with this name, barcode or description already exists.")
         except SQLAlchemyError as e:
             db.session.rollback()
             raise RuntimeError(f"An error occurred while saving the item: {str(e)}")
 
 
+class CatalogueVersion(db.Model):
+    """
+    Single-row counter bumped in the same transaction as every change to the items.
+    Caches of catalogue pages are keyed on it, so any change makes them miss.
+
+    Attributes:
+        id (int): Always 1.
+        version (int): The number of catalogue changes so far.
+        updated_at (datetime): When the catalogue last changed, or None before the first change.
+    """
+    __tablename__ = 'catalogue_version'
+
+    id = db.Column(db.Integer(), primary_key=True)
+    version = db.Column(db.Integer(), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(), nullable=True)
+
+    @classmethod
+    def current(cls):
+        """
+        Returns the current catalogue version.
+
+        Returns:
+            int: The version, or 0 if the counter row is missing.
+        """
+        return db.session.scalar(db.select(cls.version).where(cls.id == 1)) or 0
+
+    @classmethod
+    def state(cls):
+        """
+        Returns the current catalogue version and the time of the last change.
+
+        Returns:
+            tuple: The version and the naive UTC datetime, or (0, None) if the counter row is missing.
+        """
+        row = db.session.execute(db.select(cls.version, cls.updated_at).where(cls.id == 1)).first()
+        return tuple(row) if row else (0, None)
+
+    @classmethod
+    def bump(cls, connection, items=None):
+        """
+        Increments the catalogue version inside the transaction of the given connection
+        and stamps the changed items with it.
+
+        The counter row stays locked until the transaction ends, so revisions are
+        handed out in commit order.
+
+        Args:
+            connection: The SQLAlchemy connection that is writing the item changes.
+            items: A SQLAlchemy condition selecting the changed items, if any.
+        """
+        table = cls.__table__
+        connection.execute(table.update().where(table.c.id == 1)
+                           .values(version=table.c.version + 1, updated_at=utcnow()))
+        if items is not None:
+            version = db.select(table.c.version).where(table.c.id == 1).scalar_subquery()
+            connection.execute(Item.__table__.update().where(items).values(revision=version))
+
+
+# The counter row is created together with its table.
+event.listen(CatalogueVersion.__table__, 'after_create',
+             DDL("INSERT INTO catalogue_version (id, version) VALUES (1, 0)"))
+
+
+@event.listens_for(Item, 'after_insert')
+@event.listens_for(Item, 'after_update')
+def _bump_catalogue_version(mapper, connection, target):
+    """
+    Bumps the catalogue version whenever an item is written through the ORM,
+    e.g. by `Item.save()` or `add_item`, and stamps the item with it.
+    """
+    CatalogueVersion.bump(connection, Item.__table__.c.id == target.id)
+
+
+@event.listens_for(Item, 'after_delete')
+def _bump_catalogue_version_on_delete(mapper, connection, target):
+    """
+    Bumps the catalogue version whenever an item is deleted through the ORM.
+    """
+    CatalogueVersion.bump(connection)
+
+
+def utcnow():
+    """
+    Returns the current UTC time as a naive datetime, as stored in the database.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class Payment(db.Model):
+    """
+    Ledger of Paystack payments, keyed by the transaction reference.
+    A payment is verified and its item handed over at most once; replays of the
+    same reference are answered from the ledger.
+
+    A purchase pays for one item. A checkout pays for the items of a cart in one
+    transaction; it has no `item_id`, and its items are its `lines`.
+
+    Attributes:
+        reference (str): The Paystack transaction reference (primary key).
+        item_id (int): The ID of the item being bought (foreign key), or None for a checkout.
+        user_id (int): The ID of the buyer (foreign key).
+        amount (int): The amount charged, in kobo.
+        status (str): One of the STATUS_* values below (indexed).
+        created_at (datetime): When the payment was first seen.
+        updated_at (datetime): When the status last changed.
+    """
+    STATUS_INITIALIZED = 'initialized'  # Sent to Paystack; the buyer has not come back yet
+    STATUS_PENDING = 'pending'      # Claimed and being verified
+    STATUS_ERROR = 'error'          # Verification could not complete and may be retried
+    STATUS_SUCCESS = 'success'      # Paid and the item (or at least one item of a checkout) now belongs to the buyer
+    STATUS_FAILED = 'failed'        # Paystack reported the payment as unsuccessful
+    STATUS_SOLD_OUT = 'sold_out'    # Paid, but the item (or every item of a checkout) was sold to someone else first
+    FINAL_STATUSES = (STATUS_SUCCESS, STATUS_FAILED, STATUS_SOLD_OUT)
+    CLAIMABLE_STATUSES = (STATUS_INITIALIZED, STATUS_ERROR)  # Waiting for a callback, webhook or reconciliation
+
+    reference = db.Column(db.String(length=100), primary_key=True)
+    item_id = db.Column(db.Integer(), db.ForeignKey('item.id'), nullable=True)
+    user_id = db.Column(db.Integer(), db.ForeignKey('user.id'), nullable=False)
+    amount = db.Column(db.Integer(), nullable=False)
+    status = db.Column(db.String(length=20), nullable=False, default=STATUS_PENDING, index=True)
+    created_at = db.Column(db.DateTime(), nullable=False, default=utcnow)
+    updated_at = db.Column(db.DateTime(), nullable=False, default=utcnow, onupdate=utcnow)
+    item = db.relationship('Item')
+    lines = db.relationship('PaymentItem', order_by='PaymentItem.item_id', cascade='all, delete-orphan')
+
+    @property
+    def is_checkout(self):
+        """
+        True if the payment is for the items of a cart rather than a single item.
+        """
+        return self.item_id is None
+
+    def __repr__(self):
+        """
+        Represents the payment as a string.
+
+        Returns:
+            str: The string representation of the payment.
+        """
+        return f'Payment {self.reference} ({self.status})'
+
+
+class PaymentItem(db.Model):
+    """
+    An item paid for by a checkout, at the price it was charged.
+
+    Attributes:
+        reference (str): The reference of the checkout payment (primary key, foreign key).
+        item_id (int): The ID of the item (primary key, foreign key).
+        price (int): The price charged for the item, in Naira.
+        status (str): Payment.STATUS_SUCCESS once the item belongs to the buyer, Payment.STATUS_SOLD_OUT
+            if it was sold to someone else first, or None until the payment is settled.
+    """
+    reference = db.Column(db.String(length=100), db.ForeignKey('payment.reference'), primary_key=True)
+    item_id = db.Column(db.Integer(), db.ForeignKey('item.id'), primary_key=True)
+    price = db.Column(db.Integer(), nullable=False)
+    status = db.Column(db.String(length=20), nullable=True)
+    item = db.relationship('Item')
+
+
+class CartItem(db.Model):
+    """
+    An item in a user's shopping cart. Carts are kept on the server, so they follow
+    the user between devices; items sold meanwhile stay listed until checkout.
+
+    Attributes:
+        user_id (int): The ID of the user (primary key, foreign key).
+        item_id (int): The ID of the item (primary key, foreign key).
+        added_at (datetime): When the item was added.
+    """
+    user_id = db.Column(db.Integer(), db.ForeignKey('user.id'), primary_key=True)
+    item_id = db.Column(db.Integer(), db.ForeignKey('item.id'), primary_key=True)
+    added_at = db.Column(db.DateTime(), nullable=False, default=utcnow)
+    item = db.relationship('Item')
+
+    @classmethod
+    def items_of(cls, user_id):
+        """
+        Returns the items in a user's cart, in the order they were added.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            list: The items.
+        """
+        return db.session.scalars(db.select(Item).join(cls, cls.item_id == Item.id)
+                                  .where(cls.user_id == user_id).order_by(cls.added_at, cls.item_id)).all()
+
+    @classmethod
+    def add(cls, user_id, item_id, max_items):
+        """
+        Adds an item to a user's cart and commits. Adding an item twice keeps one.
+
+        Args:
+            user_id (int): The ID of the user.
+            item_id (int): The ID of the item.
+            max_items (int): The most items the cart may hold.
+
+        Returns:
+            bool: True if the item is in the cart, False if the cart is full.
+        """
+        if db.session.get(cls, (user_id, item_id)) is not None:
+            return True
+        if db.session.scalar(db.select(db.func.count()).select_from(cls).where(cls.user_id == user_id)) >= max_items:
+            return False
+        try:
+            db.session.add(cls(user_id=user_id, item_id=item_id))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # Added by a concurrent request
+        return True
+
+    @classmethod
+    def remove(cls, user_id, item_ids):
+        """
+        Removes items from a user's cart, without committing.
+
+        Args:
+            user_id (int): The ID of the user.
+            item_ids (list): The IDs of the items.
+        """
+        db.session.execute(db.delete(cls).where(cls.user_id == user_id, cls.item_id.in_(item_ids)),
+                           execution_options={'synchronize_session': False})
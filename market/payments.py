@@ -0,0 +1,388 @@
+import hashlib
+import hmac
+import re
+from sqlalchemy.exc import IntegrityError
+from market import db, gateway
+from market.models import CartItem, Item, Payment, PaymentItem
+from market.verification import VerificationWorker
+
+
+# References are generated by the initialize_payment route as purchase_<item id>_<user id>_<random number>
+REFERENCE_PATTERN = re.compile(r'^purchase_(\d+)_(\d+)_\d+$')
+
+# References of cart checkouts are generated by the checkout route as checkout_<user id>_<random number>
+CHECKOUT_REFERENCE_PATTERN = re.compile(r'^checkout_(\d+)_\d+$')
+
+
+def parse_reference(reference):
+    """
+    Extracts the item and user IDs from a purchase reference.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+
+    Returns:
+        tuple: The item ID and user ID, or None if the reference is not a purchase reference.
+    """
+    match = REFERENCE_PATTERN.match(reference or '')
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def parse_checkout_reference(reference):
+    """
+    Extracts the user ID from a checkout reference.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+
+    Returns:
+        int: The user ID, or None if the reference is not a checkout reference.
+    """
+    match = CHECKOUT_REFERENCE_PATTERN.match(reference or '')
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+def is_payment_reference(reference):
+    """
+    Checks whether a reference was made by this application, for a purchase or a checkout.
+    """
+    return parse_reference(reference) is not None or parse_checkout_reference(reference) is not None
+
+
+def record_initialized_payment(reference, item, user_id):
+    """
+    Records a transaction about to be sent to Paystack, so it can be reconciled
+    even if the buyer never returns to the callback.
+
+    Args:
+        reference (str): The new transaction reference.
+        item (Item): The item being bought.
+        user_id (int): The ID of the buyer.
+    """
+    db.session.add(Payment(reference=reference, item_id=item.id, user_id=user_id,
+                           amount=item.price * 100, status=Payment.STATUS_INITIALIZED))
+    db.session.commit()
+
+
+def record_checkout(reference, user_id, items):
+    """
+    Records the checkout of a cart about to be sent to Paystack: one payment for the
+    summed price of the items, and a line per item with the price charged for it.
+
+    Args:
+        reference (str): The new transaction reference.
+        user_id (int): The ID of the buyer.
+        items (list): The items being bought.
+
+    Returns:
+        Payment: The initialized payment.
+    """
+    payment = Payment(reference=reference, item_id=None, user_id=user_id,
+                      amount=sum(item.price for item in items) * 100, status=Payment.STATUS_INITIALIZED,
+                      lines=[PaymentItem(item_id=item.id, price=item.price) for item in items])
+    db.session.add(payment)
+    db.session.commit()
+    return payment
+
+
+def claim_payment(reference, item, user_id):
+    """
+    Records a payment as pending so that only one caller verifies it.
+
+    A new reference is inserted into the ledger; an initialized reference, or one
+    whose earlier verification ended in an error, is moved to pending with a conditional
+    UPDATE. Concurrent callers lose the race on the primary key or the UPDATE.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+        item (Item): The item being bought.
+        user_id (int): The ID of the buyer.
+
+    Returns:
+        bool: True if this caller now owns the verification of the payment.
+    """
+    payment = db.session.get(Payment, reference)
+    if payment is None:
+        try:
+            db.session.add(Payment(reference=reference, item_id=item.id, user_id=user_id,
+                                   amount=item.price * 100, status=Payment.STATUS_PENDING))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+    if payment.status not in Payment.CLAIMABLE_STATUSES:
+        return False
+    return claim_recorded_payment(reference)
+
+
+def claim_recorded_payment(reference):
+    """
+    Moves a payment already in the ledger to pending with a conditional UPDATE,
+    if it is initialized or its earlier verification ended in an error.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+
+    Returns:
+        bool: True if this caller now owns the verification of the payment.
+    """
+    result = db.session.execute(
+            db.update(Payment)
+            .where(Payment.reference == reference, Payment.status.in_(Payment.CLAIMABLE_STATUSES))
+            .values(status=Payment.STATUS_PENDING)
+            )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def apply_verification(payment, response):
+    """
+    Applies a Paystack verification response to a claimed payment.
+    A successful payment for the full amount transfers the item to the buyer in
+    the same transaction that records the outcome.
+
+    Args:
+        payment (Payment): The pending payment.
+        response (dict): The body returned by the Paystack verify endpoint.
+    """
+    settle_payment(payment, response)
+    db.session.commit()
+
+
+def settle_payment(payment, response):
+    """
+    Sets the outcome of a Paystack verification response on a claimed payment and,
+    on success, transfers the item, or the items of a checkout, without committing.
+
+    Args:
+        payment (Payment): The pending payment.
+        response (dict): The body returned by the Paystack verify endpoint.
+    """
+    data = response.get('data') or {}
+    if not (response.get('status') and data.get('status') == 'success' and data.get('amount') == payment.amount):
+        payment.status = Payment.STATUS_FAILED
+    elif payment.is_checkout:
+        settle_checkout(payment)
+    elif Item.transfer_ownership(payment.item_id, payment.user_id):
+        payment.status = Payment.STATUS_SUCCESS
+    else:
+        payment.status = Payment.STATUS_SOLD_OUT
+
+
+def settle_checkout(payment):
+    """
+    Transfers the items of a paid checkout with one conditional UPDATE, records which
+    were sold to someone else first, and empties them from the buyer's cart, without
+    committing. The payment succeeds if at least one item was transferred.
+
+    Args:
+        payment (Payment): The pending checkout payment.
+    """
+    item_ids = [line.item_id for line in payment.lines]
+    transferred = Item.transfer_many(item_ids, payment.user_id)
+    for line in payment.lines:
+        line.status = Payment.STATUS_SUCCESS if line.item_id in transferred else Payment.STATUS_SOLD_OUT
+    payment.status = Payment.STATUS_SUCCESS if transferred else Payment.STATUS_SOLD_OUT
+    CartItem.remove(payment.user_id, item_ids)
+
+
+def start_payment(reference, item_id, user_id):
+    """
+    Records a purchase callback in the ledger without waiting for Paystack.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+        item_id (int): The ID of the item being bought.
+        user_id (int): The ID of the buyer.
+
+    Returns:
+        tuple: The ledger entry for the reference (None if the reference does not belong
+        to this item and user) and whether this caller claimed it and must have it verified.
+    """
+    if parse_reference(reference) != (item_id, user_id):
+        return None, False
+    payment = db.session.get(Payment, reference)
+    claimed = False
+    if payment is None or payment.status in Payment.CLAIMABLE_STATUSES:
+        item = db.get_or_404(Item, item_id)
+        claimed = claim_payment(reference, item, user_id)
+        payment = db.session.get(Payment, reference)
+    return payment, claimed
+
+
+def start_checkout(reference, user_id):
+    """
+    Records a checkout callback in the ledger without waiting for Paystack.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+        user_id (int): The ID of the buyer.
+
+    Returns:
+        tuple: The ledger entry for the reference (None if there is no checkout with this
+        reference for this user) and whether this caller claimed it and must have it verified.
+    """
+    if parse_checkout_reference(reference) != user_id:
+        return None, False
+    payment = db.session.get(Payment, reference)
+    if payment is None or payment.user_id != user_id or not payment.is_checkout:
+        return None, False
+    claimed = False
+    if payment.status in Payment.CLAIMABLE_STATUSES:
+        claimed = claim_recorded_payment(reference)
+        db.session.refresh(payment)
+    return payment, claimed
+
+
+def verify_payment(reference, verify):
+    """
+    Verifies a pending payment and applies the result. Settled payments are left alone.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+        verify (callable): Called with the reference; returns the Paystack verify response.
+
+    Returns:
+        Payment: The ledger entry for the reference, or None if there is none.
+    """
+    payment = db.session.get(Payment, reference)
+    if payment is not None and payment.status == Payment.STATUS_PENDING:
+        apply_verification(payment, verify(reference))
+    return payment
+
+
+def mark_payment_error(reference):
+    """
+    Marks a pending payment whose verification kept failing, so a later callback can retry it.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+    """
+    db.session.execute(
+            db.update(Payment)
+            .where(Payment.reference == reference, Payment.status == Payment.STATUS_PENDING)
+            .values(status=Payment.STATUS_ERROR)
+            )
+    db.session.commit()
+
+
+def finalize_payment(reference, item_id, user_id, verify):
+    """
+    Verifies a payment and hands over the item, exactly once per reference.
+
+    Payments already settled in the ledger are returned without calling `verify`.
+    If the verification call raises, the payment is marked as an error so a later
+    callback can retry it, and the exception is re-raised.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+        item_id (int): The ID of the item being bought.
+        user_id (int): The ID of the buyer.
+        verify (callable): Called with the reference; returns the Paystack verify response.
+
+    Returns:
+        Payment: The ledger entry for the reference, or None if the reference does not
+        belong to this item and user.
+    """
+    payment, claimed = start_payment(reference, item_id, user_id)
+    return finish_claimed_payment(reference, payment, claimed, verify)
+
+
+def finalize_checkout(reference, user_id, verify):
+    """
+    Verifies a checkout and hands over its items, exactly once per reference.
+    Behaves as `finalize_payment` does for purchases.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+        user_id (int): The ID of the buyer.
+        verify (callable): Called with the reference; returns the Paystack verify response.
+
+    Returns:
+        Payment: The ledger entry for the reference, or None if there is no checkout with
+        this reference for this user.
+    """
+    payment, claimed = start_checkout(reference, user_id)
+    return finish_claimed_payment(reference, payment, claimed, verify)
+
+
+def finish_claimed_payment(reference, payment, claimed, verify):
+    """
+    Verifies a payment if this caller claimed it, marking it as an error if `verify` raises.
+
+    Returns:
+        Payment: The ledger entry for the reference, as left by the verification.
+    """
+    if claimed:
+        try:
+            verify_payment(reference, verify)
+        except Exception:
+            mark_payment_error(reference)
+            raise
+        payment = db.session.get(Payment, reference)
+    return payment
+
+
+def verify_with_paystack(reference):
+    """
+    Calls the Paystack verify endpoint for a reference.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+
+    Returns:
+        dict: The Paystack verify response.
+    """
+    return gateway.verify_transaction(reference)
+
+
+def is_valid_webhook_signature(payload, signature, secret_key):
+    """
+    Checks the HMAC-SHA512 signature Paystack sends with every webhook.
+
+    Args:
+        payload (bytes): The raw request body.
+        signature (str): The value of the X-Paystack-Signature header.
+        secret_key (str): The Paystack secret key.
+
+    Returns:
+        bool: True if the signature matches the payload.
+    """
+    expected = hmac.new(secret_key.encode('utf-8'), payload, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature or '')
+
+
+def handle_webhook_event(event):
+    """
+    Applies a signed Paystack webhook event. A `charge.success` event carries the
+    verified transaction, so it settles the payment without calling Paystack back.
+
+    Args:
+        event (dict): The decoded webhook body.
+
+    Returns:
+        Payment: The ledger entry for the event, or None if the event was ignored.
+    """
+    data = event.get('data') or {}
+    if event.get('event') != 'charge.success':
+        return None
+    verify = lambda _: {'status': True, 'data': data}
+    ids = parse_reference(data.get('reference'))
+    if ids is not None:
+        return finalize_payment(data['reference'], ids[0], ids[1], verify=verify)
+    user_id = parse_checkout_reference(data.get('reference'))
+    if user_id is not None:
+        return finalize_checkout(data['reference'], user_id, verify=verify)
+    return None
+
+
+# Background verification of payments claimed by payment_callback, bound to the app by create_app
+verification_worker = VerificationWorker(
+        handler=lambda reference: verify_payment(reference, verify_with_paystack),
+        on_failure=mark_payment_error
+        )
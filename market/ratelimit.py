@@ -0,0 +1,246 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from market.metrics import RATELIMIT_DECISIONS
+
+
+class RateLimited(Exception):
+    """
+    Raised when an action is attempted more often than its limit allows.
+
+    Attributes:
+        retry_after (int): Seconds until the next attempt is allowed.
+    """
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limit exceeded; retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+def refill(tokens, updated, now, capacity, period):
+    """
+    Tops up a token bucket for the time elapsed since it was last updated.
+
+    Args:
+        tokens (float): The tokens left at the last update.
+        updated (float): The time of the last update, in seconds.
+        now (float): The current time, in seconds.
+        capacity (int): The size of the bucket, i.e. the allowed burst.
+        period (float): Seconds for an empty bucket to fill up again.
+
+    Returns:
+        float: The tokens available now.
+    """
+    return min(capacity, tokens + max(0.0, now - updated) * capacity / period)
+
+
+def take_token(tokens, capacity, period):
+    """
+    Takes one token from a refilled bucket.
+
+    Returns:
+        tuple: The tokens left and the seconds to wait if none was available, or 0.
+    """
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) * period / capacity
+
+
+class MemoryBackend:
+    """
+    Token buckets kept in the memory of each worker process, so every worker
+    enforces the limits on its own. The least recently used buckets are dropped
+    when there are more than `maxsize`.
+    """
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, period, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, wait = take_token(refill(tokens, updated, now, capacity, period), capacity, period)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBackend:
+    """
+    Token buckets in an SQLite file shared by all workers on a host. Each take runs
+    in an immediate transaction, so concurrent workers never both spend the last
+    token. Buckets that have filled up again are deleted from time to time.
+
+    Connections are opened per thread on first use and never carried across a
+    fork: SQLite connections must not be used by a child process, so a worker
+    forked from a master that already took tokens opens its own.
+    """
+    PURGE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute("CREATE TABLE IF NOT EXISTS rate_limit_bucket ("
+                               "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, "
+                               "full_at REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_bucket_full_at ON rate_limit_bucket (full_at)")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def take(self, key, capacity, period, now):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute("SELECT tokens, updated FROM rate_limit_bucket WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, wait = take_token(refill(tokens, updated, now, capacity, period), capacity, period)
+            full_at = now + (capacity - tokens) * period / capacity
+            connection.execute("INSERT INTO rate_limit_bucket (key, tokens, updated, full_at) VALUES (?, ?, ?, ?) "
+                               "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, "
+                               "updated = excluded.updated, full_at = excluded.full_at",
+                               (key, tokens, now, full_at))
+            self._takes += 1
+            if self._takes % self.PURGE_EVERY == 0:
+                # A full bucket is the same as a missing one
+                connection.execute("DELETE FROM rate_limit_bucket WHERE full_at <= ?", (now,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+    def clear(self):
+        self._connection().execute("DELETE FROM rate_limit_bucket")
+
+
+class RedisBackend:
+    """
+    Token buckets on a Redis-compatible server, shared by all workers and hosts.
+    Each take runs as one Lua script, so it is atomic on the server.
+    Requires the optional `redis` package.
+    """
+    SCRIPT = """
+        local capacity, period, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens, updated = tonumber(bucket[1]) or capacity, tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * capacity / period)
+        local wait = 0
+        if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) * period / capacity end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(period))
+        return tostring(wait)
+    """
+
+    def __init__(self, url, prefix='techieseller:ratelimit:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis rate limit backend.")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, capacity, period, now):
+        return float(self._take(keys=[self.prefix + key], args=[capacity, period, now]))
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+
+class RateLimiter:
+    """
+    Limits how often actions such as logging in are attempted, with token buckets
+    per client IP and per username. Each bucket holds a burst of attempts and
+    refills evenly over its period.
+
+    Callers check the limit before doing any work for the attempt, so a throttled
+    request costs no password hashing and no database query.
+
+    Limits are configured per action and identity as `RATELIMIT_<ACTION>_<IDENTITY>`,
+    a tuple of the burst size and the seconds it takes to refill, e.g.
+    RATELIMIT_LOGIN_IP = (20, 60). Identities without a setting are not limited.
+
+    Configuration:
+        RATELIMIT_ENABLED (bool): Enforce the limits.
+        RATELIMIT_BACKEND (str): 'memory' (per worker), 'sqlite' (per host) or 'redis' (shared).
+        RATELIMIT_SQLITE_PATH (str): The database file of the sqlite backend.
+        RATELIMIT_URL (str): The server URL of the redis backend.
+    """
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Creates the backend selected in the app configuration.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        name = app.config.setdefault('RATELIMIT_BACKEND', 'memory')
+        if name == 'memory':
+            self.backend = MemoryBackend()
+        elif name == 'sqlite':
+            self.backend = SQLiteBackend(app.config.setdefault(
+                'RATELIMIT_SQLITE_PATH', os.path.join(app.instance_path, 'ratelimit.db')))
+        elif name == 'redis':
+            self.backend = RedisBackend(app.config.setdefault('RATELIMIT_URL', 'redis://localhost:6379/0'))
+        else:
+            raise ValueError(f"Unknown rate limit backend: {name}")
+
+    def hit(self, action, **identities):
+        """
+        Spends one attempt of an action from the bucket of each identity.
+
+        Args:
+            action (str): The limited action, e.g. 'login'.
+            **identities: The identities of the attempt, e.g. ip='203.0.113.7' and
+                username='alice'. Empty values are skipped.
+
+        Raises:
+            RateLimited: If any bucket is empty, with the longest wait.
+        """
+        if not current_app.config['RATELIMIT_ENABLED']:
+            return
+        now = time.time()
+        wait = 0
+        for identity, value in identities.items():
+            limit = current_app.config.get(f'RATELIMIT_{action.upper()}_{identity.upper()}')
+            if limit is None or not value:
+                continue
+            capacity, period = limit
+            key = f'{action}:{identity}:{str(value).strip().lower()[:64]}'
+            wait = max(wait, self.backend.take(key, capacity, period, now))
+        if wait:
+            RATELIMIT_DECISIONS.inc((action, 'throttled'))
+            raise RateLimited(max(1, math.ceil(wait)))
+        RATELIMIT_DECISIONS.inc((action, 'served'))
+
+    def clear(self):
+        """
+        Refills every bucket.
+        """
+        if self.backend is not None:
+            self.backend.clear()
@@ -0,0 +1,184 @@
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from flask import current_app
+from market import db
+from market.gateway import PaystackClient
+from market.models import Payment, utcnow
+from market.payments import is_payment_reference, settle_payment
+
+
+# Paystack statuses of transactions the buyer may still complete
+OPEN_STATUSES = ('abandoned', 'ongoing', 'pending', 'processing', 'queued')
+
+
+def outstanding_references(grace, stale_after, limit=None):
+    """
+    Finds the purchase and checkout payments that no callback or webhook settled:
+    - initialized payments older than `grace`, whose buyer never came back
+    - payments whose verification ended in an error
+    - pending payments unchanged for `stale_after`, whose verifying worker died
+
+    Args:
+        grace (timedelta): How long a buyer has to come back from Paystack.
+        stale_after (timedelta): How long a verification may stay pending.
+        limit (int): The most references to return, oldest first.
+
+    Returns:
+        dict: The status of each outstanding reference, by reference.
+    """
+    now = utcnow()
+    query = (db.select(Payment.reference, Payment.status)
+             .where(((Payment.status == Payment.STATUS_INITIALIZED) & (Payment.created_at < now - grace))
+                    | (Payment.status == Payment.STATUS_ERROR)
+                    | ((Payment.status == Payment.STATUS_PENDING) & (Payment.updated_at < now - stale_after)))
+             .order_by(Payment.created_at)
+             .limit(limit))
+    return {reference: status for reference, status in db.session.execute(query)
+            if is_payment_reference(reference)}
+
+
+def claim_references(references, batch_size):
+    """
+    Moves outstanding payments to pending, so that callbacks and webhooks arriving
+    meanwhile leave them to the reconciliation. Each reference is claimed with a
+    conditional UPDATE on the status it was found with; one transaction per batch.
+
+    Args:
+        references (dict): The status of each reference, as found.
+        batch_size (int): References claimed per transaction.
+
+    Returns:
+        dict: The previous status of each reference claimed.
+    """
+    claimed = {}
+    pending = list(references.items())
+    for start in range(0, len(pending), batch_size):
+        for reference, status in pending[start:start + batch_size]:
+            result = db.session.execute(
+                    db.update(Payment)
+                    .where(Payment.reference == reference, Payment.status == status)
+                    .values(status=Payment.STATUS_PENDING, updated_at=utcnow())
+                    )
+            if result.rowcount == 1:
+                claimed[reference] = status
+        db.session.commit()
+    return claimed
+
+
+async def verify_concurrently(references, verify, concurrency):
+    """
+    Verifies references with at most `concurrency` calls in flight.
+
+    The blocking `verify` calls run on a pool of threads driven by the event loop;
+    a semaphore bounds them, so no more are queued than can be sent.
+
+    Args:
+        references (iterable): The references to verify.
+        verify (callable): Called with a reference; returns the Paystack verify response.
+        concurrency (int): The most calls in flight.
+
+    Yields:
+        tuple: Each reference and its response, or the exception its verification raised,
+        in the order they complete.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def verify_one(executor, reference):
+        async with semaphore:
+            try:
+                return reference, await loop.run_in_executor(executor, verify, reference)
+            except Exception as e:
+                return reference, e
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='reconcile') as executor:
+        tasks = [loop.create_task(verify_one(executor, reference)) for reference in references]
+        for task in asyncio.as_completed(tasks):
+            yield await task
+
+
+def apply_results(results, claimed, expire_after):
+    """
+    Applies a batch of verification results in one transaction.
+
+    - A successful payment hands over the item, or the items of a checkout, or is marked sold out.
+    - A payment still open at Paystack goes back to the status it was claimed from,
+      until it is older than `expire_after` and is marked failed.
+    - A failed verification leaves the payment as an error, to be retried.
+    - Anything else, including a reference Paystack does not know, is marked failed.
+
+    Args:
+        results (list): Tuples of a reference and its response or exception.
+        claimed (dict): The previous status of each claimed reference.
+        expire_after (timedelta): How long a payment may stay open at Paystack.
+
+    Returns:
+        Counter: The number of payments left in each status.
+    """
+    outcomes = Counter()
+    expired = utcnow() - expire_after
+    for reference, response in results:
+        payment = db.session.get(Payment, reference)
+        if payment is None or payment.status != Payment.STATUS_PENDING:
+            continue
+        if isinstance(response, Exception):
+            payment.status = Payment.STATUS_ERROR
+        elif ((response.get('data') or {}).get('status') in OPEN_STATUSES and response.get('status')
+                and payment.created_at >= expired):
+            previous = claimed[reference]
+            payment.status = previous if previous in Payment.CLAIMABLE_STATUSES else Payment.STATUS_ERROR
+        else:
+            settle_payment(payment, response)
+        outcomes[payment.status] += 1
+    db.session.commit()
+    return outcomes
+
+
+def reconcile_payments(verify=None, concurrency=20, batch_size=200, limit=None, grace=timedelta(minutes=30),
+                       stale_after=timedelta(minutes=10), expire_after=timedelta(hours=24)):
+    """
+    Verifies the outstanding purchase and checkout payments with Paystack and hands over the items
+    that were paid for.
+
+    The references are claimed first, then verified concurrently while the results
+    are applied as they arrive, `batch_size` payments per transaction. The database
+    is only used from the calling thread, inside its app context.
+
+    Args:
+        verify (callable): Called with a reference; returns the Paystack verify response.
+            By default a dedicated Paystack client with `concurrency` pooled connections.
+        concurrency (int): The most verify calls in flight.
+        batch_size (int): Payments claimed or settled per transaction.
+        limit (int): The most payments to reconcile in this run, oldest first.
+        grace (timedelta): How long a buyer has to come back from Paystack.
+        stale_after (timedelta): How long a verification may stay pending.
+        expire_after (timedelta): How long a payment may stay open at Paystack.
+
+    Returns:
+        dict: 'found', 'claimed', the number of payments left in each status, and 'seconds'.
+    """
+    started = time.perf_counter()
+    if verify is None:
+        client = PaystackClient(current_app)
+        client.pool_size = concurrency
+        verify = client.verify_transaction
+    found = outstanding_references(grace, stale_after, limit)
+    claimed = claim_references(found, batch_size)
+    outcomes = Counter()
+
+    async def run():
+        batch = []
+        async for result in verify_concurrently(list(claimed), verify, concurrency):
+            batch.append(result)
+            if len(batch) >= batch_size:
+                outcomes.update(apply_results(batch, claimed, expire_after))
+                batch = []
+        if batch:
+            outcomes.update(apply_results(batch, claimed, expire_after))
+
+    if claimed:
+        asyncio.run(run())
+    return {'found': len(found), 'claimed': len(claimed), **outcomes, 'seconds': time.perf_counter() - started}
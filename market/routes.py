@@ -1,22 +1,105 @@
-from market import app
-from flask import render_template, redirect, url_for, flash, request, session, jsonify
-from market.models import Item, User
-from market.forms import RegisterForm, LoginForm, PurchaseItemForm
-from market import db
+from flask import Blueprint, current_app, render_template, redirect, url_for, flash, request, session, jsonify, abort
+from flask import Response, stream_with_context
+from market.models import Item, User, Payment, CartItem, CatalogueVersion, user_cache
+from markupsafe import Markup
+from market.payments import record_initialized_payment, record_checkout, start_payment, start_checkout, handle_webhook_event, is_valid_webhook_signature, verification_worker
+from market.forms import RegisterForm, LoginForm, PurchaseItemForm, RemoveFromCartForm, CheckoutForm
+from market.search import search_unsold_items
+from market.hashing import HashingPoolFull
+from market.ratelimit import RateLimited
+from market import db, gateway, fragment_cache, images, limiter
+from market.gateway import GatewayError, CircuitOpenError
+from market.database import read_only
+from market.conditional import conditional
+from market.streaming import stream_page
+from market.export import FORMATS, export
+from market.catalogue import catalogue_index, parse_filters
 from flask_login import login_user, logout_user, login_required, current_user
-from paystackapi.transaction import Transaction
-from paystackapi.paystack import Paystack
-import os
+from flask_wtf.csrf import generate_csrf, validate_csrf
+from wtforms.validators import ValidationError
+import hmac
+import secrets
 
 
-# Initialize Paystack
-paystack_secret_key = os.environ.get('PAYSTACK_SECRET_KEY', 'sk_test_0c662741e291677d7fc0d2d0a3ca797295bf07ad')
-paystack_public_key = os.environ.get('PAYSTACK_PUBLIC_KEY', 'pk_test_dc9b923da300329f265acef77ffe8adcebbb76d0')
-paystack = Paystack(secret_key=paystack_secret_key)
+main = Blueprint('main', __name__)
+main.add_app_template_global(generate_csrf, 'csrf_token') # Read by scripts posting from cached markup
 
 
-@app.route('/')
-@app.route('/home')
+@main.app_errorhandler(HashingPoolFull)
+def hashing_pool_full(error):
+    """
+    Sheds load when the password hashing pool is saturated.
+
+    Returns:
+        A 503 response asking the client to retry shortly.
+    """
+    return "The server is busy. Please try again in a moment.", 503, {'Retry-After': '1'}
+
+
+@main.app_errorhandler(RateLimited)
+def rate_limited(error):
+    """
+    Turns away attempts over the login or registration limits.
+
+    Returns:
+        A 429 response telling the client when to retry.
+    """
+    return (f"Too many attempts. Please try again in {error.retry_after} seconds.", 429,
+            {'Retry-After': str(error.retry_after)})
+
+
+def bearer_token_error(setting):
+    """
+    Checks the `Authorization: Bearer <token>` header of a request to a token-protected API.
+
+    Args:
+        setting (str): The config key holding the token; the API is disabled while it is empty.
+
+    Returns:
+        A 401 response for a missing or wrong token, or None if the token matches.
+
+    Raises:
+        NotFound: If no token is configured.
+    """
+    token = current_app.config[setting]
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                               f'Bearer {token}'.encode('utf-8')):
+        return jsonify({'status': 'error', 'message': 'Invalid token'}), 401, {'WWW-Authenticate': 'Bearer'}
+    return None
+
+
+def csrf_error():
+    """
+    Checks the CSRF token of a request posted by a script, which takes it from the
+    `csrf-token` meta tag of the page and sends it as the `csrf_token` form field
+    or the `X-CSRFToken` header.
+
+    Returns:
+        str: Why the token was rejected, or None if it is valid or CSRF protection is disabled.
+    """
+    if not current_app.config.get('WTF_CSRF_ENABLED', True):
+        return None
+    try:
+        validate_csrf(request.form.get('csrf_token') or request.headers.get('X-CSRFToken'))
+    except ValidationError as e:
+        return str(e)
+    return None
+
+
+def catalogue_state(*args, **kwargs):
+    """
+    Validators of the pages showing the catalogue: its version covers every item
+    change, including which items each user owns.
+    """
+    version, updated_at = CatalogueVersion.state()
+    return (version,), updated_at
+
+
+@main.route('/')
+@main.route('/home')
+@conditional(lambda: ((), None))
 def home_page():
     """
     Route to display the home page.
@@ -27,24 +110,140 @@ def home_page():
     return render_template('home.html')
 
 
-@app.route('/market', methods=['GET', 'POST'])
+@main.route('/market', methods=['GET', 'POST'])
+@read_only
+@conditional(catalogue_state)
 def market_page():
     """
     Route to display the market page where items are listed.
     Authenticated users can see items they own.
 
+    The available items are paginated with a keyset cursor on the item id,
+    passed as the `after` query argument. Their table is served from the fragment
+    cache, keyed on the catalogue version, so only the owned items render per request.
+
+    With a price range (`min_price`, `max_price`) or an order (`sort`), the items are
+    picked and paged (`page`) from the in-memory catalogue index instead, and only
+    the items on the page are loaded.
+
     Returns:
         Rendered market.html template with available and owned items.
     """
-    items = Item.query.filter_by(owner=None)
+    after = request.args.get('after', type=int)
+    limit = current_app.config['ITEMS_PER_PAGE']
+    filters = parse_filters(request.args)
+
+    def render_available_items():
+        items, next_cursor = Item.unsold_page(after=after, limit=limit)
+        return render_template('available_items.html', items=items, after=after, next_cursor=next_cursor)
+
+    if filters:
+        page = max(1, request.args.get('page', default=1, type=int))
+        total, rows = catalogue_index.query(**filters, page=page, per_page=limit)
+        # The snapshot can lag a sale by the check interval, so sold items are left out here
+        loaded = {item.id: item for item in Item.query.filter(Item.id.in_([row[0] for row in rows]),
+                                                              Item.owner.is_(None))}
+        items = [loaded[row[0]] for row in rows if row[0] in loaded]
+        available_items_html = Markup(render_template('available_items.html', items=items, filters=filters,
+                                                      page=page, pages=-(-total // limit)))
+    else:
+        key = f'market:available:{CatalogueVersion.current()}:{limit}:{after}'
+        available_items_html = Markup(fragment_cache.get_or_render(key, render_available_items))
     owned_items = []
     if current_user.is_authenticated:
         owned_items = Item.query.filter_by(owner=current_user.id)
-    return render_template('market.html', items=items, owned_items=owned_items)
+    return render_template('market.html', available_items_html=available_items_html, owned_items=owned_items,
+            filters=filters)
 
 
-@app.route('/payment/<int:item_id>', methods=['GET'])
+@main.route('/market/all', methods=['GET'])
+@read_only
+@conditional(catalogue_state)
+def all_items_page():
+    """
+    Route listing every unsold item on one page.
+
+    The page is streamed: rows are read from the database in batches while the
+    table is sent, so the first bytes go out at once and memory use stays flat
+    however large the catalogue is.
+
+    The table is not cached here, so its cart forms carry the CSRF token. It is
+    generated before streaming, while the session can still be saved.
+
+    Returns:
+        Streamed response of the all_items.html template.
+    """
+    items = Item.iter_unsold(batch_size=current_app.config['STREAM_YIELD_PER'])
+    cart_csrf_token = generate_csrf() if current_user.is_authenticated else None
+    return stream_page('all_items.html', items=items, cart_csrf_token=cart_csrf_token)
+
+
+@main.route('/market/search', methods=['GET'])
+@read_only
+def market_search():
+    """
+    Route to search the unsold items by name, description and barcode.
+    Only the matching items are rendered, best matches first.
+
+    Returns:
+        Rendered market.html template with the matching and owned items.
+    """
+    search_term = request.args.get('q', '').strip()
+    items = search_unsold_items(search_term, limit=current_app.config['SEARCH_RESULTS_LIMIT'])
+    owned_items = []
+    if current_user.is_authenticated:
+        owned_items = Item.query.filter_by(owner=current_user.id)
+    available_items_html = Markup(render_template('available_items.html', items=items))
+    return render_template('market.html', available_items_html=available_items_html, items=items,
+            owned_items=owned_items, search_term=search_term)
+
+
+@main.route('/api/items', methods=['GET'])
+@read_only
+def api_items():
+    """
+    JSON API listing unsold items one page at a time.
+    Accepts an `after` cursor (the last id of the previous page) and a `limit`.
+
+    With a price range (`min_price`, `max_price`) or an order (`sort`: price, -price,
+    name or -name), the page (`page`) is answered from the in-memory catalogue index
+    without querying the items.
+
+    Returns:
+        JSON response with the items on the page and the cursor for the next page,
+        or, when filtered, the total number of matching items and pages.
+    """
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', default=current_app.config['ITEMS_PER_PAGE'], type=int)
+    limit = max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+    filters = parse_filters(request.args)
+    if filters:
+        page = max(1, request.args.get('page', default=1, type=int))
+        total, rows = catalogue_index.query(**filters, page=page, per_page=limit)
+        return jsonify({
+            'items': [
+                {'id': item_id, 'name': name, 'price': price, 'barcode': barcode}
+                for item_id, name, price, barcode in rows
+                ],
+            'total': total,
+            'page': page,
+            'pages': -(-total // limit)
+            })
+    rows, next_cursor = Item.unsold_page(after=after, limit=limit,
+            columns=[Item.id, Item.name, Item.price, Item.barcode])
+    return jsonify({
+        'items': [
+            {'id': row.id, 'name': row.name, 'price': row.price, 'barcode': row.barcode}
+            for row in rows
+            ],
+        'next_cursor': next_cursor
+        })
+
+
+@main.route('/payment/<int:item_id>', methods=['GET'])
+@read_only
 @login_required
+@conditional(catalogue_state)
 def payment(item_id):
     """
     Route to display the payment page for a specific item.
@@ -53,92 +252,436 @@ def payment(item_id):
         item_id (int): The ID of the item being purchased.
 
     Returns:
-        Rendered payment.html template with the item details and Paystack public key.
+        Rendered payment.html template with the item details.
     """
     item = Item.query.get_or_404(item_id)
-    return render_template('payment.html', item=item, paystack_public_key=paystack_public_key)
+    return render_template('payment.html', item=item)
+
+
+def payment_message(payment):
+    """
+    Describes the state of a payment for the buyer.
+
+    Args:
+        payment (Payment): The ledger entry of the payment.
+
+    Returns:
+        tuple: The flash category and the message.
+    """
+    if payment.is_checkout and payment.status in (Payment.STATUS_SUCCESS, Payment.STATUS_SOLD_OUT):
+        return checkout_message(payment)
+    if payment.status == Payment.STATUS_SUCCESS:
+        return 'success', f"Congratulations! You purchased {payment.item.name}"
+    if payment.status == Payment.STATUS_SOLD_OUT:
+        return 'danger', (f"Sorry, {payment.item.name} was sold before your payment completed. "
+                "Your payment will be refunded.")
+    if payment.status in (Payment.STATUS_INITIALIZED, Payment.STATUS_PENDING, Payment.STATUS_ERROR):
+        return 'info', "Your payment is still being processed."
+    return 'danger', "Payment was not successful. Please try again."
+
+
+def checkout_message(payment):
+    """
+    Describes a settled checkout for the buyer, naming the items sold to someone else first.
+
+    Args:
+        payment (Payment): The ledger entry of the checkout.
+
+    Returns:
+        tuple: The flash category and the message.
+    """
+    bought = [line.item.name for line in payment.lines if line.status == Payment.STATUS_SUCCESS]
+    sold = [line for line in payment.lines if line.status == Payment.STATUS_SOLD_OUT]
+    if not sold:
+        return 'success', f"Congratulations! You purchased {', '.join(bought)}"
+    refund = sum(line.price for line in sold)
+    sold_names = ', '.join(line.item.name for line in sold)
+    if not bought:
+        return 'danger', (f"Sorry, {sold_names} sold before your payment completed. "
+                f"Your payment of ₦{refund} will be refunded.")
+    return 'warning', (f"You purchased {', '.join(bought)}. Sorry, {sold_names} sold before your payment "
+            f"completed; ₦{refund} will be refunded.")
 
 
-@app.route('/payment-callback/<int:item_id>')
+@main.route('/payment-callback/<int:item_id>')
 @login_required
 def payment_callback(item_id):
     """
     Route to handle the payment callback from Paystack.
-    Verifies the payment status and assigns ownership of the item to the user if successful.
+    Records the payment in the ledger and queues its verification on a background worker,
+    so the buyer is not kept waiting on Paystack. Replayed or concurrent callbacks are
+    answered from the ledger.
 
     Args:
         item_id (int): The ID of the item being purchased.
 
     Returns:
-        Redirects to the market page after processing the payment.
+        Redirects to the payment status page, or to the market page if the reference is invalid.
+    """
+    reference = request.args.get('reference')
+    if reference:
+        try:
+            payment, claimed = start_payment(reference, item_id, current_user.id)
+            if payment is None:
+                flash("This payment reference does not match the item being purchased.", category='danger')
+            else:
+                if claimed:
+                    verification_worker.enqueue(reference)
+                return redirect(url_for('main.payment_status', reference=reference))
+        except Exception as e:
+            flash(f"An error occurred: {str(e)}", category='danger')
+    else:
+        flash("No reference provided. Unable to verify payment.", category='danger')
+    return redirect(url_for('main.market_page'))
+
+
+@main.route('/payment-status/<reference>')
+@login_required
+def payment_status(reference):
+    """
+    Route to display the state of a payment. The page polls the status API until the
+    payment is settled.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+
+    Returns:
+        Rendered payment_status.html template with the payment.
+    """
+    payment = db.session.get(Payment, reference)
+    if payment is None or payment.user_id != current_user.id:
+        abort(404)
+    category, message = payment_message(payment)
+    return render_template('payment_status.html', payment=payment, category=category, message=message,
+            settled=payment.status in Payment.FINAL_STATUSES)
+
+
+@main.route('/api/payment-status/<reference>')
+@login_required
+def api_payment_status(reference):
+    """
+    JSON API reporting the state of a payment, polled by the payment status page.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+
+    Returns:
+        JSON response with the payment status and a message for the buyer.
+    """
+    payment = db.session.get(Payment, reference)
+    if payment is None or payment.user_id != current_user.id:
+        return jsonify({'status': 'error', 'message': 'Unknown payment reference'}), 404
+    category, message = payment_message(payment)
+    return jsonify({
+        'status': payment.status,
+        'settled': payment.status in Payment.FINAL_STATUSES,
+        'category': category,
+        'message': message
+        })
+
+
+@main.route('/cart')
+@login_required
+def cart_page():
+    """
+    Route to display the shopping cart of the current user, with its total and a checkout button.
+    Items sold since they were added are shown as sold and left out of the total.
+
+    Returns:
+        Rendered cart.html template with the items in the cart.
+    """
+    items = CartItem.items_of(current_user.id)
+    total = sum(item.price for item in items if item.owner is None)
+    return render_template('cart.html', items=items, total=total, checkout_form=CheckoutForm(total=total),
+            remove_form=RemoveFromCartForm())
+
+
+@main.route('/cart/add/<int:item_id>', methods=['POST'])
+@login_required
+def add_to_cart(item_id):
+    """
+    Route to add an unsold item to the shopping cart of the current user.
+    The form posting here is part of the market table, which is cached for every
+    user, so market.js adds the CSRF token of the page when it is submitted.
+
+    Args:
+        item_id (int): The ID of the item.
+
+    Returns:
+        Redirects to the market page.
+    """
+    item = db.get_or_404(Item, item_id)
+    if csrf_error() is not None:
+        flash("Your request could not be verified. Please try again.", category='danger')
+    elif item.owner is not None:
+        flash(f"{item.name} has already been sold.", category='danger')
+    elif CartItem.add(current_user.id, item.id, current_app.config['CART_MAX_ITEMS']):
+        flash(f"{item.name} is in your cart.", category='success')
+    else:
+        flash(f"Your cart is full: it holds at most {current_app.config['CART_MAX_ITEMS']} items.", category='danger')
+    return redirect(url_for('main.market_page'))
+
+
+@main.route('/cart/remove/<int:item_id>', methods=['POST'])
+@login_required
+def remove_from_cart(item_id):
+    """
+    Route to remove an item from the shopping cart of the current user.
+
+    Args:
+        item_id (int): The ID of the item.
+
+    Returns:
+        Redirects to the cart page.
+    """
+    if RemoveFromCartForm().validate_on_submit():
+        CartItem.remove(current_user.id, [item_id])
+        db.session.commit()
+    return redirect(url_for('main.cart_page'))
+
+
+@main.route('/checkout', methods=['POST'])
+@login_required
+def checkout():
+    """
+    Route to pay for every item in the shopping cart with one Paystack transaction.
+
+    Items sold since they were added are dropped from the cart, and the buyer is sent
+    back to the cart if a sale or a price change made the total differ from the one
+    shown. Otherwise the checkout and the price of each item are recorded in the ledger
+    before Paystack is called, and the buyer is redirected to Paystack to pay the sum.
+
+    Returns:
+        Redirects to the Paystack payment page, or to the cart page if the checkout cannot start.
+    """
+    form = CheckoutForm()
+    if not form.validate_on_submit():
+        flash("Your checkout could not be started. Please try again.", category='danger')
+        return redirect(url_for('main.cart_page'))
+    items = CartItem.items_of(current_user.id)
+    sold = [item for item in items if item.owner is not None]
+    items = [item for item in items if item.owner is None]
+    if sold:
+        CartItem.remove(current_user.id, [item.id for item in sold])
+        db.session.commit()
+    if not items:
+        flash("Your cart is empty.", category='info')
+        return redirect(url_for('main.market_page'))
+    if sum(item.price for item in items) != form.total.data:
+        flash("Your cart has changed since you last saw it. Please check your new total.", category='info')
+        return redirect(url_for('main.cart_page'))
+    reference = f'checkout_{current_user.id}_{secrets.randbelow(10 ** 9) + 1}'
+    try:
+        # Recorded first, so `flask payments reconcile` finds it if the buyer never comes back
+        payment = record_checkout(reference, current_user.id, items)
+        response = gateway.initialize_transaction(
+                reference=reference,
+                amount=payment.amount,
+                email=current_user.email_address,
+                callback_url=url_for('main.checkout_callback', _external=True)
+                )
+        if response['status']:
+            return redirect(response['data']['authorization_url'])
+        flash("Unable to initialize payment", category='danger')
+    except GatewayError as e:
+        flash(str(e), category='danger')
+    return redirect(url_for('main.cart_page'))
+
+
+@main.route('/checkout-callback')
+@login_required
+def checkout_callback():
+    """
+    Route to handle the Paystack callback of a cart checkout.
+    Claims the checkout in the ledger and queues its verification on a background worker,
+    as `payment_callback` does for single items.
+
+    Returns:
+        Redirects to the payment status page, or to the cart page if the reference is invalid.
     """
     reference = request.args.get('reference')
     if reference:
         try:
-            response = Transaction.verify(reference=reference)
-            if response['status'] and response['data']['status'] == 'success':
-                item = Item.query.get_or_404(item_id)
-                item.owner = current_user.id
-                db.session.commit()
-                flash(f"Congratulations! You purchased {item.name}", category='success')
+            payment, claimed = start_checkout(reference, current_user.id)
+            if payment is None:
+                flash("This payment reference does not match any of your checkouts.", category='danger')
             else:
-                flash("Payment was not successful. Please try again.", category='danger')
+                if claimed:
+                    verification_worker.enqueue(reference)
+                return redirect(url_for('main.payment_status', reference=reference))
         except Exception as e:
             flash(f"An error occurred: {str(e)}", category='danger')
     else:
         flash("No reference provided. Unable to verify payment.", category='danger')
-    return redirect(url_for('market_page'))
+    return redirect(url_for('main.cart_page'))
+
+
+@main.route('/paystack/webhook', methods=['POST'])
+def paystack_webhook():
+    """
+    Route receiving Paystack webhook events.
+    Only events signed with our secret key are accepted; a successful charge settles
+    the payment straight from the event, even if the buyer never returned to the callback.
+
+    Returns:
+        An empty 200 response once the event is handled, or 401 for a bad signature.
+    """
+    payload = request.get_data()
+    if not is_valid_webhook_signature(payload, request.headers.get('X-Paystack-Signature'),
+            current_app.config['PAYSTACK_SECRET_KEY']):
+        return jsonify({'status': 'error', 'message': 'Invalid signature'}), 401
+    event = request.get_json(silent=True) or {}
+    handle_webhook_event(event)
+    return '', 200
+
+
+@main.route('/export/<any(items, sales):name>', methods=['GET'])
+@read_only
+def export_view(name):
+    """
+    Streams the item catalogue with each item's owner (`items`), or the sold items
+    with their owner and successful payment (`sales`), for reconciliation.
+
+    The `format` query argument selects CSV (default) or JSON Lines, and `gzip=1`
+    compresses the file on the fly. Rows are read in batches from a cursor and
+    written out as they arrive, so memory use is the same for any catalogue size.
+    Callers authenticate with `Authorization: Bearer <EXPORT_TOKEN>`.
+
+    Args:
+        name (str): 'items' or 'sales'.
+
+    Returns:
+        The streamed file, 401 for a missing or wrong token, 404 if exports are
+        disabled, or 400 for an unknown format.
+    """
+    error = bearer_token_error('EXPORT_TOKEN')
+    if error:
+        return error
+    file_format = request.args.get('format', 'csv')
+    if file_format not in FORMATS:
+        abort(400)
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    chunks = export(name, file_format, compress, batch_size=current_app.config['STREAM_YIELD_PER'],
+                    chunk_size=current_app.config['EXPORT_CHUNK_SIZE'])
+    filename = f"{name}.{file_format}" + ('.gz' if compress else '')
+    mimetype = 'application/gzip' if compress else ('text/csv' if file_format == 'csv' else 'application/x-ndjson')
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@main.route('/api/items/<int:item_id>/image', methods=['PUT'])
+def upload_item_image(item_id):
+    """
+    API setting the image of an item from the raw JPEG, PNG, GIF or WebP file in the body.
+
+    The original is stored and its thumbnails are made in the background; the item
+    shows the image once they are ready. Callers authenticate with
+    `Authorization: Bearer <CATALOGUE_TOKEN>`.
+
+    Args:
+        item_id (int): The ID of the item.
+
+    Returns:
+        202 with the key of the image, 400 for a file that is not an image, 413 for one
+        over IMAGES_MAX_BYTES, 401 for a missing or wrong token, or 404 for an unknown
+        item or while uploads are disabled.
+    """
+    error = bearer_token_error('CATALOGUE_TOKEN')
+    if error:
+        return error
+    db.get_or_404(Item, item_id)
+    request.max_content_length = current_app.config['IMAGES_MAX_BYTES']
+    try:
+        key = images.store(request.get_data(cache=False))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    images.submit(item_id, key)
+    return jsonify({'status': 'accepted', 'image': key}), 202
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@main.route('/register', methods=['GET', 'POST'])
 def register_page():
     """
     Route to handle user registration.
     Creates a new user and logs them in if the form is valid.
 
     Returns:
-        Rendered register.html template with the registration form.
+        Rendered register.html template with the registration form, or 429 when
+        the client registers too often.
     """
+    if request.method == 'POST':
+        # Throttled attempts are turned away before any database query or password hashing
+        limiter.hit('register', ip=request.remote_addr)
     form = RegisterForm()
     if form.validate_on_submit():
         user_to_create = User(username=form.username.data,
                 email_address=form.email_address.data,
                 password=form.password1.data)
-        db.session.add(user_to_create)
-        db.session.commit()
+        try:
+            user_to_create.save()
+        except ValueError:
+            # Someone registered the same username or email address since the form was validated
+            flash('Username or email address already exists! Please try again.', category='danger')
+            return render_template('register.html', form=form)
         login_user(user_to_create)
         flash(f"Account created successfully! You are now logged in as {user_to_create.username}", category='success')
-        return redirect(url_for('market_page'))
+        return redirect(url_for('main.market_page'))
     if form.errors != {}:
         for err_msg in form.errors.values():
             flash(f'There was an error with creating a user: {err_msg}', category='danger')
     return render_template('register.html', form=form)
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/api/check-username', methods=['GET'])
+@read_only
+def api_check_username():
+    """
+    JSON endpoint telling the registration form whether a username is free, for
+    availability hints while the user types. Registration itself checks again.
+
+    Query args:
+        username (str): The username to check.
+
+    Returns:
+        JSON with the username, whether it is available and a message to show.
+    """
+    username = request.args.get('username', '').strip()
+    if not 2 <= len(username) <= 30 or not username.isalpha():
+        return jsonify({'username': username, 'available': False,
+                        'message': 'Username must be 2 to 30 letters.'})
+    available = User.is_username_available(username)
+    return jsonify({'username': username, 'available': available,
+                    'message': 'Username is available.' if available else 'Username already exists!'})
+
+
+@main.route('/login', methods=['GET', 'POST'])
 def login_page():
     """
     Route to handle user login.
     Authenticates the user and redirects to the market page upon successful login.
 
     Returns:
-        Rendered login.html template with the login form.
+        Rendered login.html template with the login form, or 429 when the client
+        or the username has too many recent attempts.
     """
+    if request.method == 'POST':
+        # Throttled attempts are turned away before any database query or password hashing
+        limiter.hit('login', ip=request.remote_addr, username=request.form.get('username'))
     form = LoginForm()
     if form.validate_on_submit():
         attempted_user = User.query.filter_by(username=form.username.data).first()
         if attempted_user and attempted_user.check_password_correction(
                 attempted_password=form.password.data
-                );
+                ):
             login_user(attempted_user)
             flash(f'Success! You are logged in as: {attempted_user.username}', category='success')
-            return redirect(url_for('market_page'))
+            return redirect(url_for('main.market_page'))
         else:
             flash('Username and password do not match! Please try again', category='danger')
     return render_template('login.html', form=form)
 
 
-@app.route('/logout')
+@main.route('/logout')
 def logout_page():
     """
     Route to log the user out and redirect to the home page.
@@ -146,16 +689,20 @@ def logout_page():
     Returns:
         Redirects to the home page after logout.
     """
+    if current_user.is_authenticated:
+        user_cache.delete(current_user.id)
     logout_user()
     flash("You have been logged out!", category='info')
-    return redirect(url_for("home_page"))
+    return redirect(url_for("main.home_page"))
 
 
-@app.route('/initialize-payment/<int:item_id>', methods=['POST'])
+@main.route('/initialize-payment/<int:item_id>', methods=['POST'])
 @login_required
 def initialize_payment(item_id):
     """
-    Route to initialize a payment with Paystack.
+    Route to initialize a payment with Paystack, posted by initiate_payment.js with
+    the CSRF token of the payment page.
+    The reference is recorded in the ledger before Paystack is called.
     Returns an authorization URL for the user to complete the payment.
 
     Args:
@@ -165,12 +712,21 @@ def initialize_payment(item_id):
         JSON response with the authorization URL if successful, or an error message.
     """
     item = Item.query.get_or_404(item_id)
+    error = csrf_error()
+    if error is not None:
+        return jsonify({
+            'status': 'error',
+            'message': error
+            }), 400
+    reference = f'purchase_{item.id}_{current_user.id}_{secrets.randbelow(10 ** 9) + 1}'
     try:
-        response = paystack.transaction.initialize(
-                reference=f'purchase_{item.id}_{current_user.id}',
+        # Recorded first, so `flask payments reconcile` finds it if the buyer never comes back
+        record_initialized_payment(reference, item, current_user.id)
+        response = gateway.initialize_transaction(
+                reference=reference,
                 amount=item.price * 100,  # Paystack uses kobo (100 kobo = 1 Naira)
                 email=current_user.email_address,
-                callback_url=url_for('payment_callback', item_id=item.id, _external=True)
+                callback_url=url_for('main.payment_callback', item_id=item.id, _external=True)
                 )
 
         if response['status']:
@@ -183,6 +739,16 @@ def initialize_payment(item_id):
                 'status': 'error',
                 'message': 'Unable to initialize payment'
                 }), 400
+    except CircuitOpenError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+            }), 503
+    except GatewayError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+            }), 502
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -0,0 +1,168 @@
+import re
+from sqlalchemy import DDL, event, select, text, or_
+from market import db
+from market.models import Item
+
+
+# Full-text index over the searchable item columns. The rowid of each entry is the item id.
+SEARCH_TABLE = 'item_search'
+SEARCHABLE_FIELDS = ('name', 'description', 'barcode')
+
+create_search_table = DDL(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        "USING fts5(name, description, barcode, tokenize='unicode61')"
+        )
+drop_search_table = DDL(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+# The index is created and dropped together with the item table on SQLite.
+event.listen(Item.__table__, 'after_create', create_search_table.execute_if(dialect='sqlite'))
+event.listen(Item.__table__, 'before_drop', drop_search_table.execute_if(dialect='sqlite'))
+
+
+def is_supported(connection):
+    """
+    Checks whether the full-text index is available on the given connection.
+
+    Args:
+        connection: A SQLAlchemy connection.
+
+    Returns:
+        bool: True if the database is SQLite (and therefore has the FTS5 index).
+    """
+    return connection.dialect.name == 'sqlite'
+
+
+def index_rows(connection, rows):
+    """
+    Adds or replaces entries in the full-text index.
+
+    Args:
+        connection: A SQLAlchemy connection inside the transaction that wrote the items.
+        rows (list): Dictionaries with the id, name, description and barcode of each item.
+    """
+    if not rows or not is_supported(connection):
+        return
+    connection.execute(
+            text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"),
+            [{'id': row['id']} for row in rows]
+            )
+    connection.execute(
+            text(f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, barcode) "
+                 "VALUES (:id, :name, :description, :barcode)"),
+            rows
+            )
+
+
+def index_items(connection, condition):
+    """
+    Adds the items matching a condition to the full-text index with a single
+    INSERT ... SELECT, e.g. after a bulk insert. The items must not be indexed yet.
+
+    Args:
+        connection: A SQLAlchemy connection inside the transaction that wrote the items.
+        condition: A SQLAlchemy expression selecting the items to index.
+    """
+    if not is_supported(connection):
+        return
+    columns = select(Item.id, Item.name, Item.description, Item.barcode).where(condition)
+    connection.execute(
+            db.table(SEARCH_TABLE, db.column('rowid'), db.column('name'), db.column('description'),
+                     db.column('barcode')).insert().from_select(['rowid', 'name', 'description', 'barcode'], columns)
+            )
+
+
+def rebuild_index(connection):
+    """
+    Rebuilds the full-text index from the item table.
+
+    Args:
+        connection: A SQLAlchemy connection.
+    """
+    if not is_supported(connection):
+        return
+    connection.execute(create_search_table)
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    connection.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, barcode) "
+        "SELECT id, name, description, barcode FROM item"
+        ))
+
+
+@event.listens_for(Item, 'after_insert')
+@event.listens_for(Item, 'after_update')
+def _index_item(mapper, connection, target):
+    """
+    Keeps the index in sync whenever an item is flushed, e.g. by `Item.save()` or `add_item`.
+    Updates that leave the searchable fields alone (such as a change of owner) are skipped.
+    """
+    state = db.inspect(target)
+    if state.persistent and not any(state.attrs[field].history.has_changes() for field in SEARCHABLE_FIELDS):
+        return
+    index_rows(connection, [{
+        'id': target.id,
+        'name': target.name,
+        'description': target.description,
+        'barcode': target.barcode
+        }])
+
+
+@event.listens_for(Item, 'after_delete')
+def _unindex_item(mapper, connection, target):
+    """
+    Removes a deleted item from the index.
+    """
+    if is_supported(connection):
+        connection.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {'id': target.id})
+
+
+def build_match_query(search_term):
+    """
+    Turns free text typed by a user into an FTS5 query.
+
+    Every word is quoted, so FTS5 operators in the input are treated as plain text,
+    and the last word is matched as a prefix so results show up while typing.
+
+    Args:
+        search_term (str): The text to search for.
+
+    Returns:
+        str: The FTS5 MATCH expression, or an empty string if there is nothing to search for.
+    """
+    words = re.findall(r'\w+', search_term or '')
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_unsold_items(search_term, limit=50):
+    """
+    Searches the unsold items by name, description and barcode, best matches first.
+
+    Args:
+        search_term (str): The text to search for.
+        limit (int): The maximum number of items to return.
+
+    Returns:
+        list: The matching Item objects.
+    """
+    match_query = build_match_query(search_term)
+    if not match_query:
+        return []
+    if not is_supported(db.session.connection()):
+        pattern = f'%{search_term.strip()}%'
+        return Item.query.filter(
+                Item.owner.is_(None),
+                or_(Item.name.ilike(pattern), Item.description.ilike(pattern), Item.barcode.ilike(pattern))
+                ).order_by(Item.id).limit(limit).all()
+    statement = text(
+            f"SELECT item.* FROM {SEARCH_TABLE} "
+            f"JOIN item ON item.id = {SEARCH_TABLE}.rowid "
+            f"WHERE {SEARCH_TABLE} MATCH :query AND item.owner IS NULL "
+            f"ORDER BY {SEARCH_TABLE}.rank LIMIT :limit"
+            )
+    return db.session.execute(
+            select(Item).from_statement(statement),
+            {'query': match_query, 'limit': limit}
+            ).scalars().all()
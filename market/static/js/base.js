@@ -22,7 +22,7 @@ document.addEventListener('DOMContentLoaded', function() {
 			event.target.closest('.flash-message').style.display = 'none';
 		}
 	});
-}):
+});
 
 // Modal functionality
 document.addEventListener('click', function(event) {
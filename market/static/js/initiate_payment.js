@@ -1,26 +1,25 @@
 /**
  * Initiates a payment process using Paystack.
  *
- * This function sets up and starts the payment process by calling the `payWithPaystack` function.
- * It generates a unique reference for the payment and provides necessary details like
- * the public key, email, amount, item ID, user ID, and callback URL.
+ * The server records the payment and starts the Paystack transaction, so a payment the
+ * buyer abandons is still found by the reconciliation. The buyer is then sent to the
+ * Paystack checkout page, which returns to the payment callback. The request carries
+ * the CSRF token of the page.
  *
- * @param {string} publicKey - Your Paystack public key.
- * @param {string} email - The email address of the user making the payment.
- * @param {number} amount - The amount to be charged, in kobo (1 kobo = 0.01 NGN)
- * @param {string} itemId - The ID of the item being purchased.
- * @param {string} userId - The ID of the user making the payment.
- * @param {string} callbackUrl - The URL to redirect to after the payment process is complete.
+ * @param {string} initializeUrl - The URL of the route initializing the payment.
  */
 
 
-function initiatePayment(publicKey, email, amount, itemId, userId, callbackUrl) {
-	payWithPaystack(
-		publicKey,
-		email,
-		amount,
-		'purchase_' + itemId + '_' + userId + '_' + Math.floor((Math.random() * 1000000000) + 1),
-		callbackUrl
-	);
+function initiatePayment(initializeUrl) {
+	const csrfToken = document.querySelector('meta[name="csrf-token"]').content;
+	fetch(initializeUrl, {method: 'POST', headers: {'Accept': 'application/json', 'X-CSRFToken': csrfToken}})
+		.then(response => response.json())
+		.then(data => {
+			if (data.status === 'success') {
+				window.location.href = data.authorization_url;
+			} else {
+				alert(data.message);
+			}
+		})
+		.catch(() => alert('Unable to start the payment. Please try again.'));
 }
-
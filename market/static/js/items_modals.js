@@ -4,6 +4,7 @@ document.addEventListener('DOMContentLoaded', function() {
 	const modalContent = document.querySelector('.modal-content');  // Reference to modal content
 	const modalItemName = document.getElementById('modalItemName');
 	const modalItemDescription = document.getElementById('modalItemDescription');
+	const modalItemImage = document.getElementById('modalItemImage');
 	const closeBtn = document.getElementsByClassName('close')[0];
 	const cancelBtn = document.getElementById('modalCancelButton');
 
@@ -12,10 +13,19 @@ document.addEventListener('DOMContentLoaded', function() {
 	 *
 	 * @param {string} name - The name of the item to display in the modal.
 	 * @param {string} description - The description of the item to display in the modal.
+	 * @param {string} image - The URL of the item's largest thumbnail, or an empty string.
 	 */
-	function openModal(name, description) {
+	function openModal(name, description, image) {
 		modalItemName.textContent = name;
 		modalItemDescription.textContent = description;
+		if (modalItemImage) {
+			modalItemImage.hidden = !image;
+			if (image) {
+				modalItemImage.src = image;
+			} else {
+				modalItemImage.removeAttribute('src');
+			}
+		}
 		modal.style.display = 'block';
 	}
 
@@ -32,7 +42,7 @@ document.addEventListener('DOMContentLoaded', function() {
 		button.addEventListener('click', function() {
 			const itemName = this.getAttribute('data-item-name');
 		        const itemDescription = this.getAttribute('data-item-description');
-		        openModal(itemName, itemDescription);
+		        openModal(itemName, itemDescription, this.getAttribute('data-item-image'));
 		});
 	});
 
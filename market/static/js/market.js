@@ -3,9 +3,25 @@ document.addEventListener('DOMContentLoaded', function() {
 	const searchInput = document.getElementById('searchInput');
 	const itemsTableBody = document.getElementById('itemsTableBody');
 	const noMatchMessage = document.getElementById('noMatchMessage');
+	const csrfToken = document.querySelector('meta[name="csrf-token"]');
 
 	/**
-	* Filters table rows based on the search input value.
+	* Adds the CSRF token of the page to the cart forms, which are part of the
+	* item table cached for every user.
+	*/
+	if (csrfToken) {
+		document.querySelectorAll('.cart-form').forEach(form => {
+			const input = document.createElement('input');
+			input.type = 'hidden';
+			input.name = 'csrf_token';
+			input.value = csrfToken.content;
+			form.appendChild(input);
+		});
+	}
+
+	/**
+	* Filters the rows already on the page based on the search input value.
+	* Submitting the search form runs the full server-side search.
 	*/
 	searchInput.addEventListener('input', function() {
 		const searchTerm = this.value.toLowerCase();
@@ -13,20 +29,19 @@ document.addEventListener('DOMContentLoaded', function() {
 		let matchFound = false;
 
 		for (let row of rows) {
-			const name = row.cells[0].textContent.toLowerCase();
-			const price = row.cells[1].textContent.toLowerCase();
-			const barcode = row.cells[2].textContent.toLowerCase();
+			// Read from the row's data attributes, which do not depend on the column layout
+			const name = row.dataset.name.toLowerCase();
+			const price = row.dataset.price.toLowerCase();
+			const barcode = row.dataset.barcode.toLowerCase();
 
 			if (name.includes(searchTerm) || price.includes(searchTerm) || barcode.includes(searchTerm)) {
-				row.style.display = '';if (name.includes(searchTerm) || price.includes(searchTerm) || barcode.includes(searchTerm)) {
-					row.style.display = '';
-					matchFound = true;
-				} else {
-					row.style.display = 'none';
-				}
+				row.style.display = '';
+				matchFound = true;
+			} else {
+				row.style.display = 'none';
 			}
+		}
 
-			noMatchMessage.style.display = matchFound ? 'none' : 'block';
-		});
+		noMatchMessage.style.display = matchFound ? 'none' : 'block';
 	});
-
+});
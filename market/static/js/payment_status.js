@@ -0,0 +1,28 @@
+document.addEventListener('DOMContentLoaded', function() {
+	// Get references to the status card and message elements
+	const statusCard = document.getElementById('paymentStatus');
+	const paymentMessage = document.getElementById('paymentMessage');
+	let delay = 1000;
+
+	/**
+	 * Polls the payment status API until the payment is settled.
+	 * The delay between polls doubles up to 10 seconds.
+	 */
+	function pollStatus() {
+		fetch(statusCard.dataset.statusUrl, { credentials: 'same-origin' })
+			.then(response => response.json())
+			.then(data => {
+				paymentMessage.textContent = data.message;
+				paymentMessage.className = 'payment-message ' + data.category;
+				if (!data.settled) {
+					delay = Math.min(delay * 2, 10000);
+					setTimeout(pollStatus, delay);
+				}
+			})
+			.catch(() => setTimeout(pollStatus, delay));
+	}
+
+	if (statusCard.dataset.settled !== 'true') {
+		setTimeout(pollStatus, delay);
+	}
+});
@@ -0,0 +1,36 @@
+document.addEventListener('DOMContentLoaded', function() {
+	// Get references to the username input and the availability hint
+	const usernameInput = document.getElementById('username');
+	const usernameStatus = document.getElementById('usernameStatus');
+	let timer = null;
+	let latest = '';
+
+	/**
+	 * Asks the server whether the typed username is free and shows the answer.
+	 * Answers for a value the user has since changed are ignored.
+	 */
+	function checkUsername() {
+		const username = usernameInput.value.trim();
+		latest = username;
+		if (!username) {
+			usernameStatus.textContent = '';
+			return;
+		}
+		fetch(usernameStatus.dataset.checkUrl + '?username=' + encodeURIComponent(username))
+			.then(response => response.json())
+			.then(data => {
+				if (data.username !== latest) {
+					return;
+				}
+				usernameStatus.textContent = data.message;
+				usernameStatus.className = 'form-hint ' + (data.available ? 'available' : 'taken');
+			})
+			.catch(() => { usernameStatus.textContent = ''; });
+	}
+
+	// Wait until the user pauses typing before checking
+	usernameInput.addEventListener('input', function() {
+		clearTimeout(timer);
+		timer = setTimeout(checkUsername, 300);
+	});
+});
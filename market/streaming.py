@@ -0,0 +1,45 @@
+from flask import Response, current_app, stream_template
+
+
+def buffered(chunks, size):
+    """
+    Joins small chunks of text into chunks of at least `size` characters, so a
+    streamed response is not sent as thousands of tiny writes.
+
+    Args:
+        chunks (iterable): The chunks of text.
+        size (int): The minimum size of the joined chunks, except the last one.
+
+    Yields:
+        str: The joined chunks.
+    """
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(template_name, **context):
+    """
+    Renders a template as a streamed response. The template is generated piece by
+    piece while the response is sent, so iterables in the context (such as a query
+    fetched with `yield_per`) are consumed as the page goes out and never held in
+    memory as a whole. The request context stays available until the last chunk.
+
+    Configuration:
+        STREAM_CHUNK_SIZE (int): Characters buffered before a chunk is sent.
+
+    Args:
+        template_name (str): The template to render.
+        **context: The template variables.
+
+    Returns:
+        Response: The streamed HTML response.
+    """
+    chunks = stream_template(template_name, **context)
+    return Response(buffered(chunks, current_app.config.get('STREAM_CHUNK_SIZE', 16384)), mimetype='text/html')
@@ -0,0 +1,162 @@
+import heapq
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class VerificationWorker:
+    """
+    Verifies pending payments on background threads, off the request thread.
+
+    References are queued by `enqueue` and handed to `handler` (called inside an
+    app context) by a small pool of threads. A job that raises is retried with
+    exponential backoff; after the last attempt `on_failure` is called so the
+    payment can be marked for a later retry.
+
+    Configuration:
+        VERIFICATION_ASYNC (bool): Run jobs on background threads (False runs them inline).
+        VERIFICATION_WORKERS (int): The number of worker threads.
+        VERIFICATION_MAX_ATTEMPTS (int): Attempts per reference before giving up.
+        VERIFICATION_BACKOFF (float): Seconds before the first retry, doubled on every retry.
+        VERIFICATION_BACKOFF_MAX (float): Upper bound for the delay between retries.
+    """
+    def __init__(self, app=None, handler=None, on_failure=None):
+        self.app = None
+        self.handler = handler
+        self.on_failure = on_failure
+        self.run_async = True
+        self.workers = 2
+        self.max_attempts = 5
+        self.backoff = 1.0
+        self.backoff_max = 30.0
+        self._jobs = []
+        self._queued = set()
+        self._active = 0
+        self._condition = threading.Condition()
+        self._threads_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the worker settings from the app configuration.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        self.app = app
+        self.run_async = app.config.setdefault('VERIFICATION_ASYNC', True)
+        self.workers = app.config.setdefault('VERIFICATION_WORKERS', 2)
+        self.max_attempts = app.config.setdefault('VERIFICATION_MAX_ATTEMPTS', 5)
+        self.backoff = app.config.setdefault('VERIFICATION_BACKOFF', 1.0)
+        self.backoff_max = app.config.setdefault('VERIFICATION_BACKOFF_MAX', 30.0)
+
+    def _start_threads(self):
+        """
+        Starts the worker threads on first use in every process, so pre-forked
+        workers each get their own threads.
+        """
+        if self._threads_pid == os.getpid():
+            return
+        with self._condition:
+            if self._threads_pid == os.getpid():
+                return
+            self._jobs, self._queued, self._active = [], set(), 0
+            for number in range(self.workers):
+                threading.Thread(target=self._run, name=f'payment-verification-{number}', daemon=True).start()
+            self._threads_pid = os.getpid()
+
+    def enqueue(self, reference):
+        """
+        Schedules the verification of a payment. A reference that is already queued is ignored.
+
+        Args:
+            reference (str): The Paystack transaction reference.
+        """
+        if not self.run_async:
+            self._process(reference, 0)
+            return
+        self._start_threads()
+        self._schedule(reference, 0, 0)
+
+    def _schedule(self, reference, attempt, delay, retry=False):
+        """
+        Adds a job to the queue. References stay in `_queued` until their last
+        attempt finishes, so a payment is never verified by two threads at once.
+        """
+        with self._condition:
+            if reference in self._queued and not retry:
+                return
+            self._queued.add(reference)
+            heapq.heappush(self._jobs, (time.monotonic() + delay, attempt, reference))
+            self._condition.notify()
+
+    def _next_job(self):
+        """
+        Blocks until a job is due and returns its attempt number and reference.
+        """
+        with self._condition:
+            while True:
+                if self._jobs:
+                    due, attempt, reference = self._jobs[0]
+                    delay = due - time.monotonic()
+                    if delay <= 0:
+                        heapq.heappop(self._jobs)
+                        self._active += 1
+                        return attempt, reference
+                    self._condition.wait(delay)
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            attempt, reference = self._next_job()
+            retrying = False
+            try:
+                retrying = self._process(reference, attempt)
+            finally:
+                with self._condition:
+                    if not retrying:
+                        self._queued.discard(reference)
+                    self._active -= 1
+                    self._condition.notify_all()
+
+    def _process(self, reference, attempt):
+        """
+        Runs one attempt of a job and schedules a retry if it fails.
+
+        Returns:
+            bool: True if a retry was scheduled.
+        """
+        with self.app.app_context():
+            try:
+                self.handler(reference)
+                return False
+            except Exception as e:
+                logger.warning("Verification of %s failed (attempt %d): %s", reference, attempt + 1, e)
+            if self.run_async and attempt + 1 < self.max_attempts:
+                self._schedule(reference, attempt + 1, min(self.backoff * 2 ** attempt, self.backoff_max), retry=True)
+                return True
+            if self.on_failure is not None:
+                try:
+                    self.on_failure(reference)
+                except Exception:
+                    logger.exception("Could not record the failed verification of %s", reference)
+            return False
+
+    def wait_idle(self, timeout=None):
+        """
+        Waits until no jobs are queued or running.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait.
+
+        Returns:
+            bool: True if the worker became idle, False on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._jobs and not self._active, timeout)
@@ -0,0 +1,36 @@
+"""Add full-text search index for items.
+
+Revision ID: 1673f0d01515
+Revises: 79e58a010037
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1673f0d01515'
+down_revision = '79e58a010037'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The FTS5 index only exists on SQLite; other databases fall back to LIKE searches.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS item_search "
+        "USING fts5(name, description, barcode, tokenize='unicode61')"
+    )
+    op.execute(
+        "INSERT INTO item_search (rowid, name, description, barcode) "
+        "SELECT id, name, description, barcode FROM item"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS item_search")
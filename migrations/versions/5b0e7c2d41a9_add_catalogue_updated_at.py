@@ -0,0 +1,26 @@
+"""Record when the catalogue last changed.
+
+Revision ID: 5b0e7c2d41a9
+Revises: 9360df110ae5
+Create Date: 2026-10-18 14:20:12.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0e7c2d41a9'
+down_revision = '9360df110ae5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('catalogue_version', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('catalogue_version', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
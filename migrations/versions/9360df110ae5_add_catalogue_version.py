@@ -0,0 +1,29 @@
+"""Add catalogue version counter.
+
+Revision ID: 9360df110ae5
+Revises: e16b3c3030a8
+Create Date: 2026-10-18 12:05:41.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9360df110ae5'
+down_revision = 'e16b3c3030a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('catalogue_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO catalogue_version (id, version) VALUES (1, 0)")
+
+
+def downgrade():
+    op.drop_table('catalogue_version')
@@ -0,0 +1,26 @@
+"""Add the image key of items.
+
+Revision ID: a83f1d9c6e20
+Revises: 5b0e7c2d41a9
+Create Date: 2026-10-18 16:05:41.217853
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83f1d9c6e20'
+down_revision = '5b0e7c2d41a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.drop_column('image')
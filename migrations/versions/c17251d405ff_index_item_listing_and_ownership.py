@@ -0,0 +1,59 @@
+"""Index item listing and ownership queries, hash descriptions.
+
+Revision ID: c17251d405ff
+Revises: 1673f0d01515
+Create Date: 2026-10-18 10:03:27.551390
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c17251d405ff'
+down_revision = '1673f0d01515'
+branch_labels = None
+depends_on = None
+
+# Gives the unnamed unique constraint on item.description a name that batch mode can drop.
+naming_convention = {
+    "uq": "uq_%(table_name)s_%(column_0_name)s",
+}
+
+
+def upgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('description_hash', sa.String(length=64), nullable=True))
+
+    item = sa.table('item', sa.column('id', sa.Integer), sa.column('description', sa.String),
+                    sa.column('description_hash', sa.String))
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(item.c.id, item.c.description)).fetchall()
+    if rows:
+        connection.execute(
+            item.update().where(item.c.id == sa.bindparam('item_id')).values(description_hash=sa.bindparam('hash')),
+            [{'item_id': row.id, 'hash': hashlib.sha256(row.description.encode('utf-8')).hexdigest()}
+             for row in rows]
+        )
+
+    with op.batch_alter_table('item', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('uq_item_description', type_='unique')
+        batch_op.alter_column('description_hash', existing_type=sa.String(length=64), nullable=False)
+        batch_op.create_unique_constraint('uq_item_description_hash', ['description_hash'])
+        batch_op.create_index('ix_item_owner', ['owner'], unique=False)
+
+    op.create_index('ix_item_unsold', 'item', ['id'], unique=False,
+                    sqlite_where=sa.text('owner IS NULL'),
+                    postgresql_where=sa.text('owner IS NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_item_unsold', table_name='item')
+
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.drop_index('ix_item_owner')
+        batch_op.drop_constraint('uq_item_description_hash', type_='unique')
+        batch_op.create_unique_constraint('uq_item_description', ['description'])
+        batch_op.drop_column('description_hash')
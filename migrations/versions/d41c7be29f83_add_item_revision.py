@@ -0,0 +1,28 @@
+"""Stamp items with the catalogue version that last changed them.
+
+Revision ID: d41c7be29f83
+Revises: a83f1d9c6e20
+Create Date: 2026-10-18 17:42:09.381264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41c7be29f83'
+down_revision = 'a83f1d9c6e20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_item_revision'), ['revision'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_item_revision'))
+        batch_op.drop_column('revision')
@@ -0,0 +1,40 @@
+"""Add payment ledger.
+
+Revision ID: e16b3c3030a8
+Revises: c17251d405ff
+Create Date: 2026-10-18 11:20:05.342871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e16b3c3030a8'
+down_revision = 'c17251d405ff'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('payment',
+        sa.Column('reference', sa.String(length=100), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['item_id'], ['item.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('reference')
+    )
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_payment_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_payment_status'))
+
+    op.drop_table('payment')
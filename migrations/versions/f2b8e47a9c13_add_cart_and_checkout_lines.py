@@ -0,0 +1,47 @@
+"""Add shopping carts and the items of checkout payments.
+
+Revision ID: f2b8e47a9c13
+Revises: d41c7be29f83
+Create Date: 2026-10-18 11:52:41.702318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8e47a9c13'
+down_revision = 'd41c7be29f83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cart_item',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('added_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['item_id'], ['item.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'item_id')
+    )
+    op.create_table('payment_item',
+        sa.Column('reference', sa.String(length=100), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('price', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.ForeignKeyConstraint(['item_id'], ['item.id'], ),
+        sa.ForeignKeyConstraint(['reference'], ['payment.reference'], ),
+        sa.PrimaryKeyConstraint('reference', 'item_id')
+    )
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.alter_column('item_id', existing_type=sa.Integer(), nullable=True)
+
+
+def downgrade():
+    op.drop_table('payment_item')
+    op.drop_table('cart_item')
+    # Checkout payments have no single item to keep
+    op.execute("DELETE FROM payment WHERE item_id IS NULL")
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.alter_column('item_id', existing_type=sa.Integer(), nullable=False)
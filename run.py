@@ -1,4 +1,7 @@
-from market import app
+from market import create_app
+
+
+app = create_app()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def run_python(code):
+    """
+    Runs code in a fresh interpreter from the repository root and returns its output.
+    """
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise AssertionError(result.stderr)
+    return result.stdout.strip()
+
+
+class TestCreateApp(unittest.TestCase):
+    """
+    Test case class for the application factory.
+    Each test runs in a fresh interpreter, since the extensions are process-wide.
+    """
+    def test_import_is_lazy(self):
+        """
+        Test that importing the package creates no app and skips Alembic and requests.
+        """
+        output = run_python(
+            "import sys, market\n"
+            "print('app' in vars(market), 'flask_migrate' in sys.modules, 'requests' in sys.modules)")
+        self.assertEqual(output, "False False False")
+
+    def test_config_overrides(self):
+        """
+        Test that settings passed to create_app override the defaults and reach the extensions.
+        """
+        output = run_python(
+            "from market import create_app, hashing_pool\n"
+            "app = create_app({'ITEMS_PER_PAGE': 7, 'SQLALCHEMY_DATABASE_URI': 'sqlite://',\n"
+            "                  'HASHING_POOL_WORKERS': 3})\n"
+            "print(app.config['ITEMS_PER_PAGE'], app.config['SQLALCHEMY_DATABASE_URI'], hashing_pool.workers,\n"
+            "      'main.market_page' in app.view_functions)")
+        self.assertEqual(output, "7 sqlite:// 3 True")
+
+    def test_default_app(self):
+        """
+        Test that `market.app` is created on first access and reused afterwards.
+        """
+        output = run_python(
+            "import market\n"
+            "from market import app\n"
+            "print(market.app is app, app.config['ITEMS_PER_PAGE'])")
+        self.assertEqual(output, "True 50")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from flask import url_for
+from market import app, assets
+from market.assets import BUNDLES, build_assets, minify_css, minify_js
+
+
+class TestAssets(unittest.TestCase):
+    """
+    Test case class for the static asset build and the static view.
+    The build runs on a copy of the static folder, which the app serves during the test.
+    """
+    def setUp(self):
+        """
+        Build the assets of a copy of the static folder and point the app at it.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.static_folder = os.path.join(self.directory.name, 'static')
+        shutil.copytree(app.static_folder, self.static_folder, ignore=shutil.ignore_patterns('dist'))
+        self.original_folder = app.static_folder
+        app.static_folder = self.static_folder
+        self.manifest = build_assets(self.static_folder)
+        assets.load_manifest(app)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """
+        Restore the static folder of the app and its manifest.
+        """
+        app.static_folder = self.original_folder
+        assets.load_manifest(app)
+        self.directory.cleanup()
+
+    def test_minify(self):
+        """
+        Test that comments and insignificant whitespace are removed.
+        """
+        self.assertEqual(minify_css("/* header */\n.a > .b {\n\tcolor: red;\n\tmargin: 0 auto;\n}\n"),
+                         ".a>.b{color:red;margin:0 auto}")
+        self.assertEqual(minify_js("// setup\nfunction f() {\n\treturn 'http://x'; // done\n}\n"),
+                         "function f() {\nreturn 'http://x';\n}")
+
+    def test_minify_keeps_literals(self):
+        """
+        Test that comment markers and colons inside strings and regular expressions are kept.
+        """
+        self.assertEqual(minify_css('a::after {\n\tcontent: "/* a: b */";\n\tbackground: url(\'http://x/y.png\');\n}'),
+                         'a::after{content:"/* a: b */";background:url(\'http://x/y.png\')}')
+        self.assertEqual(minify_js("f(a, '//x', \"/* y */\");\nvar r = /\\/*[/]/g, t = `//${ {a: 1}.a }/*`;\nx = a / b; // z"),
+                         "f(a, '//x', \"/* y */\");\nvar r = /\\/*[/]/g, t = `//${ {a: 1}.a }/*`;\nx = a / b;")
+        self.assertEqual(minify_js("fetch(url, // the endpoint\n\t'http://host/a');\n/* multi\nline */\ndone()"),
+                         "fetch(url,\n'http://host/a');\ndone()")
+
+    def test_build_writes_fingerprinted_files(self):
+        """
+        Test that every bundle is written minified under a content hash, with a gzip variant.
+        """
+        for name, sources in BUNDLES.items():
+            built = os.path.join(self.static_folder, self.manifest[name])
+            self.assertRegex(self.manifest[name], r'^dist/\w+\.[0-9a-f]{12}\.(css|js)$')
+            with open(built, 'rb') as file:
+                content = file.read()
+            with gzip.open(built + '.gz') as file:
+                self.assertEqual(file.read(), content)
+            original = sum(os.path.getsize(os.path.join(self.static_folder, source)) for source in sources)
+            self.assertLess(len(content), original)
+        self.assertNotIn('css/.home.css.swo', self.manifest)
+
+    def test_url_for_links_built_file(self):
+        """
+        Test that url_for('static', ...) links to the built file and pages use the bundles.
+        """
+        with app.test_request_context():
+            self.assertEqual(url_for('static', filename='bundles/site.css'),
+                             '/static/' + self.manifest['bundles/site.css'])
+            self.assertEqual(url_for('static', filename='images/market.PNG'),
+                             '/static/' + self.manifest['images/market.PNG'])
+        response = self.client.get('/')
+        self.assertIn(self.manifest['bundles/site.css'].encode(), response.data)
+        self.assertIn(self.manifest['bundles/base.js'].encode(), response.data)
+        self.assertNotIn(b'css/base.css', response.data)
+
+    def test_built_file_served_precompressed_and_immutable(self):
+        """
+        Test that built files are sent gzipped to clients accepting gzip and cached for a year.
+        """
+        path = '/static/' + self.manifest['bundles/site.css']
+        response = self.client.get(path, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        plain = self.client.get(path)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+
+    def test_bundle_served_without_build(self):
+        """
+        Test that without a build the bundles are concatenated from the sources on request.
+        """
+        shutil.rmtree(os.path.join(self.static_folder, 'dist'))
+        assets.load_manifest(app)
+        response = self.client.get('/static/bundles/market.js')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'closeModal', response.data)
+        self.assertNotIn('immutable', response.headers.get('Cache-Control', ''))
+        self.assertIn(b'/static/bundles/site.css', self.client.get('/').data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from market import create_app, db, gateway
+from market.export import export_rows
+from market.models import CartItem, Item, Payment, User, user_cache
+from market.payments import verification_worker
+
+
+class TestCartCheckout(unittest.TestCase):
+    """
+    Test case class for the shopping cart and its single-transaction checkout.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with a logged-in buyer and three unsold items.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.buyer = User(username="buyer", email_address="buyer@example.com", password_hash="hashedpassword")
+        self.buyer.save()
+        self.items = []
+        for i, (name, price) in enumerate([("Laptop", 1000), ("Mouse", 20), ("Cable", 5)], 1):
+            item = Item(name=name, price=price, barcode=f"{i:012d}", description=f"A {name.lower()}")
+            item.save()
+            self.items.append(item.id)
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.buyer.id)
+        self.worker_settings = (verification_worker.max_attempts, verification_worker.backoff)
+        verification_worker.max_attempts, verification_worker.backoff = 2, 0.01
+
+    def tearDown(self):
+        """
+        Tear down the test environment by clearing the session and dropping all tables.
+        """
+        verification_worker.wait_idle(5)
+        verification_worker.max_attempts, verification_worker.backoff = self.worker_settings
+        db.session.remove()
+        db.drop_all()
+        user_cache.clear()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def fill_cart(self):
+        for item_id in self.items:
+            self.client.post(f'/cart/add/{item_id}')
+
+    def start_checkout(self, total=1025):
+        """
+        Posts the checkout with a stubbed Paystack initialization and returns the response and reference.
+        """
+        started = {'status': True, 'data': {'authorization_url': 'https://checkout.paystack.com/x'}}
+        with mock.patch.object(gateway, 'initialize_transaction', return_value=started) as initialize:
+            response = self.client.post('/checkout', data={'total': total})
+        reference = initialize.call_args.kwargs['reference'] if initialize.called else None
+        return response, reference, initialize
+
+    def callback(self, reference, amount=102500):
+        """
+        Calls the checkout callback and waits for the background verification.
+        """
+        verified = {'status': True, 'data': {'status': 'success', 'amount': amount}}
+        with mock.patch.object(gateway, 'verify_transaction', return_value=verified) as verify:
+            response = self.client.get(f'/checkout-callback?reference={reference}')
+            self.assertTrue(verification_worker.wait_idle(5))
+        db.session.expire_all()
+        return response, verify
+
+    def test_cart_page(self):
+        """
+        Test that items are added once, shown with their total, and removed.
+        """
+        self.fill_cart()
+        self.client.post(f'/cart/add/{self.items[1]}')
+        page = self.client.get('/cart').get_data(as_text=True)
+        self.assertIn("Total: ₦1025", page)
+        self.assertEqual(CartItem.query.filter_by(user_id=self.buyer.id).count(), 3)
+        self.client.post(f'/cart/remove/{self.items[0]}')
+        self.assertIn("Total: ₦25", self.client.get('/cart').get_data(as_text=True))
+        self.assertEqual(self.client.post('/cart/add/999').status_code, 404)
+
+    def test_add_requires_csrf_token(self):
+        """
+        Test that items are only added with the CSRF token from the meta tag of the market page,
+        which stays outside the item table cached for every user.
+        """
+        self.app.config['WTF_CSRF_ENABLED'] = True
+        try:
+            page = self.client.post(f'/cart/add/{self.items[0]}', follow_redirects=True).get_data(as_text=True)
+            self.assertIn("Your request could not be verified", page)
+            self.assertEqual(CartItem.items_of(self.buyer.id), [])
+            response = self.client.post(f'/initialize-payment/{self.items[0]}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(Payment.query.count(), 0)
+
+            token = re.search(r'<meta name="csrf-token" content="([^"]+)">', page).group(1)
+            self.client.post(f'/cart/add/{self.items[0]}', data={'csrf_token': token})
+            self.assertEqual([item.name for item in CartItem.items_of(self.buyer.id)], ["Laptop"])
+        finally:
+            self.app.config['WTF_CSRF_ENABLED'] = False
+
+    def test_sold_and_full(self):
+        """
+        Test that sold items cannot be added and that a cart holds at most CART_MAX_ITEMS.
+        """
+        other = User(username="other", email_address="other@example.com", password_hash="hashedpassword")
+        other.save()
+        Item.transfer_ownership(self.items[0], other.id)
+        db.session.commit()
+        page = self.client.post(f'/cart/add/{self.items[0]}', follow_redirects=True).get_data(as_text=True)
+        self.assertIn("Laptop has already been sold.", page)
+        self.app.config['CART_MAX_ITEMS'], max_items = 1, self.app.config['CART_MAX_ITEMS']
+        try:
+            self.client.post(f'/cart/add/{self.items[1]}')
+            page = self.client.post(f'/cart/add/{self.items[2]}', follow_redirects=True).get_data(as_text=True)
+        finally:
+            self.app.config['CART_MAX_ITEMS'] = max_items
+        self.assertIn("Your cart is full", page)
+        self.assertEqual([item.name for item in CartItem.items_of(self.buyer.id)], ["Mouse"])
+
+    def test_checkout_in_one_transaction(self):
+        """
+        Test that the cart is charged once for its total and that one UPDATE hands over every item.
+        """
+        self.fill_cart()
+        response, reference, initialize = self.start_checkout()
+        self.assertEqual(response.headers['Location'], 'https://checkout.paystack.com/x')
+        initialize.assert_called_once()
+        self.assertEqual(initialize.call_args.kwargs['amount'], 102500)
+        payment = db.session.get(Payment, reference)
+        self.assertEqual(payment.status, Payment.STATUS_INITIALIZED)
+        self.assertEqual(sorted(line.item_id for line in payment.lines), sorted(self.items))
+
+        statements = []
+
+        def record(connection, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(Engine, 'before_cursor_execute', record)
+        try:
+            response, verify = self.callback(reference)
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record)
+        self.assertIn(f'/payment-status/{reference}', response.headers['Location'])
+        verify.assert_called_once_with(reference)
+        self.assertEqual(len([statement for statement in statements if statement.startswith('UPDATE item SET owner')]), 1)
+        self.assertEqual(db.session.get(Payment, reference).status, Payment.STATUS_SUCCESS)
+        self.assertEqual({db.session.get(Item, item_id).owner for item_id in self.items}, {self.buyer.id})
+        self.assertEqual(CartItem.items_of(self.buyer.id), [])
+        self.assertIn("Congratulations! You purchased Laptop, Mouse, Cable",
+                      self.client.get(f'/payment-status/{reference}').get_data(as_text=True))
+        _, rows = export_rows('sales')
+        sales = {row.item_id: (row.reference, row.amount) for row in rows}
+        self.assertEqual(sales[self.items[1]], (reference, 2000))
+
+        _, verify = self.callback(reference)
+        verify.assert_not_called()
+
+    def test_items_sold_meanwhile_reported(self):
+        """
+        Test that items sold between checkout and verification are reported and only the others transferred.
+        """
+        self.fill_cart()
+        response, reference, _ = self.start_checkout()
+        other = User(username="other", email_address="other@example.com", password_hash="hashedpassword")
+        other.save()
+        Item.transfer_ownership(self.items[1], other.id)
+        db.session.commit()
+        self.callback(reference)
+        payment = db.session.get(Payment, reference)
+        self.assertEqual(payment.status, Payment.STATUS_SUCCESS)
+        self.assertEqual({line.item_id: line.status for line in payment.lines}, {
+            self.items[0]: Payment.STATUS_SUCCESS, self.items[1]: Payment.STATUS_SOLD_OUT,
+            self.items[2]: Payment.STATUS_SUCCESS})
+        self.assertEqual(db.session.get(Item, self.items[1]).owner, other.id)
+        data = self.client.get(f'/api/payment-status/{reference}').get_json()
+        self.assertEqual(data['category'], 'warning')
+        self.assertIn("Sorry, Mouse sold before your payment completed; ₦20 will be refunded.", data['message'])
+
+    def test_checkout_with_changed_cart(self):
+        """
+        Test that a cart whose total changed since it was shown is shown again instead of charged,
+        and that sold items leave the cart.
+        """
+        self.fill_cart()
+        other = User(username="other", email_address="other@example.com", password_hash="hashedpassword")
+        other.save()
+        Item.transfer_ownership(self.items[2], other.id)
+        db.session.commit()
+        response, reference, initialize = self.start_checkout(total=1025)
+        initialize.assert_not_called()
+        self.assertIn('/cart', response.headers['Location'])
+        self.assertEqual([item.name for item in CartItem.items_of(self.buyer.id)], ["Laptop", "Mouse"])
+        response, reference, initialize = self.start_checkout(total=1020)
+        self.assertEqual(initialize.call_args.kwargs['amount'], 102000)
+
+    def test_foreign_and_unknown_references_rejected(self):
+        """
+        Test that the callback only accepts checkouts recorded for the current user.
+        """
+        self.fill_cart()
+        _, reference, _ = self.start_checkout()
+        other = User(username="other", email_address="other@example.com", password_hash="hashedpassword")
+        other.save()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(other.id)
+        g.pop('_login_user', None)
+        response, verify = self.callback(reference)
+        verify.assert_not_called()
+        self.assertIn('/cart', response.headers['Location'])
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.buyer.id)
+        g.pop('_login_user', None)
+        response, verify = self.callback(f'checkout_{self.buyer.id}_1')
+        verify.assert_not_called()
+        self.assertEqual(db.session.get(Payment, reference).status, Payment.STATUS_INITIALIZED)
+
+    def test_signed_webhook_settles_checkout(self):
+        """
+        Test that a signed charge.success webhook for a checkout transfers its items.
+        """
+        self.fill_cart()
+        _, reference, _ = self.start_checkout()
+        body = json.dumps({'event': 'charge.success',
+                           'data': {'reference': reference, 'status': 'success', 'amount': 102500}}).encode('utf-8')
+        signature = hmac.new(self.app.config['PAYSTACK_SECRET_KEY'].encode('utf-8'), body, hashlib.sha512).hexdigest()
+        response = self.client.post('/paystack/webhook', data=body, content_type='application/json',
+                                 headers={'X-Paystack-Signature': signature})
+        self.assertEqual(response.status_code, 200)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Payment, reference).status, Payment.STATUS_SUCCESS)
+        self.assertEqual({db.session.get(Item, item_id).owner for item_id in self.items}, {self.buyer.id})
+
+
+if __name__ == "__main__":
+    unittest.main()
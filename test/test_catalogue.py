@@ -0,0 +1,165 @@
+import os
+import tempfile
+import unittest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from market import create_app, db
+from market.catalogue import CatalogueSnapshot
+from market.models import Item, User
+
+
+class TestCatalogueSnapshot(unittest.TestCase):
+    """
+    Test case class for the array-backed snapshot of the unsold items.
+    """
+    def setUp(self):
+        """
+        Build a snapshot of five items.
+        """
+        self.snapshot = CatalogueSnapshot.build([
+            (1, "Mouse", 20, "000000000001"),
+            (2, "laptop", 1000, "000000000002"),
+            (3, "Cable", 5, "000000000003"),
+            (4, "Keyboard", 20, "000000000004"),
+            (5, "Écran", 300, "000000000005"),
+            ], version=7)
+
+    def ids(self, **query):
+        total, rows = self.snapshot.query(**query)
+        return total, [row[0] for row in rows]
+
+    def test_price_range_and_orders(self):
+        """
+        Test that a price range is paged in each order, ties broken by id.
+        """
+        self.assertEqual(self.ids(sort='price'), (5, [3, 1, 4, 5, 2]))
+        self.assertEqual(self.ids(sort='-price'), (5, [2, 5, 4, 1, 3]))
+        self.assertEqual(self.ids(sort='name'), (5, [3, 4, 2, 1, 5]))
+        self.assertEqual(self.ids(min_price=10, max_price=300, sort='name'), (3, [4, 1, 5]))
+        self.assertEqual(self.ids(min_price=10, max_price=300, sort='-name', offset=1, limit=1), (3, [1]))
+        self.assertEqual(self.ids(min_price=20, max_price=20, sort='-price'), (2, [4, 1]))
+        self.assertEqual(self.ids(min_price=2000), (0, []))
+        self.assertEqual(self.snapshot.query(max_price=5)[1], [(3, "Cable", 5, "000000000003")])
+
+    def test_incremental_changes(self):
+        """
+        Test that sold items are removed and new or changed ones are slotted into every order.
+        """
+        self.snapshot.apply([
+            (1, "Mouse", 20, "000000000001", 9),           # Sold
+            (2, "Laptop Pro", 15, "000000000002", None),   # Repriced and renamed
+            (6, "Adapter", 8, "000000000006", None),       # New
+            ], version=8)
+        self.assertEqual(self.snapshot.version, 8)
+        self.assertIsNone(self.snapshot.find(1))
+        self.assertEqual(self.ids(sort='price'), (5, [3, 6, 2, 4, 5]))
+        self.assertEqual(self.ids(sort='name'), (5, [6, 3, 4, 2, 5]))
+        compacted = self.snapshot.compacted()
+        self.assertEqual(self.snapshot.dead, 2)
+        self.assertEqual(compacted.dead, 0)
+        self.assertEqual(compacted.query(sort='name'), self.snapshot.query(sort='name'))
+        self.assertLess(compacted.nbytes(), self.snapshot.nbytes())
+
+
+class TestCatalogueIndex(unittest.TestCase):
+    """
+    Test case class for the filtered market pages served from the catalogue index.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with unsold items and an index checked on every query.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            'CATALOGUE_INDEX_CHECK_INTERVAL': 0,
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        for i, (name, price) in enumerate([("Mouse", 20), ("Laptop", 1000), ("Cable", 5), ("Keyboard", 45)], 1):
+            Item(name=name, price=price, barcode=f"{i:012d}", description=f"A {name.lower()}").save()
+
+    def tearDown(self):
+        """
+        Tear down the test environment.
+        """
+        db.session.remove()
+        db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def names(self, query):
+        return [item['name'] for item in self.client.get(f'/api/items?{query}').get_json()['items']]
+
+    def test_api_filtered_without_item_queries(self):
+        """
+        Test that filtered API pages read no items once the index is built.
+        """
+        self.assertEqual(self.names('min_price=10&max_price=100&sort=-price'), ["Keyboard", "Mouse"])
+        statements = []
+
+        def record(connection, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(Engine, 'before_cursor_execute', record)
+        try:
+            data = self.client.get('/api/items?sort=name&limit=2&page=2').get_json()
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record)
+        self.assertEqual([item['name'] for item in data['items']], ["Laptop", "Mouse"])
+        self.assertEqual((data['total'], data['pages']), (4, 2))
+        self.assertEqual([statement for statement in statements if 'FROM item' in statement], [])
+
+    def test_index_follows_saves_and_sales(self):
+        """
+        Test that new, changed and sold items reach the index without a rebuild.
+        """
+        self.assertEqual(self.names('sort=price'), ["Cable", "Mouse", "Keyboard", "Laptop"])
+        built = self.app.extensions['catalogue_index']['built']
+        Item(name="Adapter", price=8, barcode="000000000005", description="An adapter").save()
+        laptop = Item.query.filter_by(name="Laptop").one()
+        laptop.price = 1
+        laptop.save()
+        buyer = User(username="buyer", email_address="buyer@example.com", password_hash="hashedpassword")
+        buyer.save()
+        self.assertTrue(Item.transfer_ownership(Item.query.filter_by(name="Cable").one().id, buyer.id))
+        db.session.commit()
+        self.assertEqual(self.names('sort=price'), ["Laptop", "Adapter", "Mouse", "Keyboard"])
+        self.assertEqual(self.app.extensions['catalogue_index']['built'], built)
+
+    def test_market_page_filtered(self):
+        """
+        Test that the market page shows a filtered, sorted page with links to the next one.
+        """
+        self.app.config['ITEMS_PER_PAGE'], per_page = 1, self.app.config['ITEMS_PER_PAGE']
+        try:
+            page = self.client.get('/market?min_price=10&sort=name').get_data(as_text=True)
+        finally:
+            self.app.config['ITEMS_PER_PAGE'] = per_page
+        self.assertIn("Keyboard", page)
+        self.assertNotIn("Mouse", page)
+        self.assertIn('page=2', page)
+        self.assertIn('<option value="name" selected>', page)
+
+    def test_market_page_hides_items_sold_since_snapshot(self):
+        """
+        Test that an item sold before the index notices is not offered on the filtered market page.
+        """
+        self.app.config['CATALOGUE_INDEX_CHECK_INTERVAL'] = 3600
+        self.assertIn("Keyboard", self.client.get('/market?sort=name').get_data(as_text=True))
+        buyer = User(username="buyer", email_address="buyer@example.com", password_hash="hashedpassword")
+        buyer.save()
+        self.assertTrue(Item.transfer_ownership(Item.query.filter_by(name="Keyboard").one().id, buyer.id))
+        db.session.commit()
+        page = self.client.get('/market?sort=name').get_data(as_text=True)
+        self.assertNotIn("Keyboard", page)
+        self.assertIn("Mouse", page)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from market import create_app, db
+from market.models import Item
+from market.search import search_unsold_items
+
+
+class TestImportItems(unittest.TestCase):
+    """
+    Test case class for the `flask items import` command.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with one existing item.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            })
+        self.runner = self.app.test_cli_runner()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Item(name="Existing", price=10, barcode="000000000001", description="Already here").save()
+
+    def tearDown(self):
+        """
+        Tear down the test environment by clearing the session and dropping all tables.
+        """
+        db.session.remove()
+        db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def write(self, filename, content):
+        """
+        Writes an import file and returns its path.
+        """
+        path = os.path.join(self.directory.name, filename)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_import_csv_reports_duplicates(self):
+        """
+        Test that valid rows are imported in batches while duplicates and invalid rows are reported.
+        """
+        path = self.write('items.csv', "name,price,barcode,description\n"
+                "Keyboard,50,000000000002,Mechanical keyboard\n"
+                "Existing,20,000000000003,Clashes with the existing name\n"
+                "Monitor,200,000000000002,Clashes with the keyboard barcode\n"
+                "Webcam,abc,000000000004,Bad price\n"
+                "Speaker,70,000000000005,Bluetooth speaker\n")
+        result = self.runner.invoke(args=['items', 'import', path, '--batch-size', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Done: 2 imported, 3 skipped", result.output)
+        self.assertIn("line 3: skipped, duplicate name 'Existing'", result.output)
+        self.assertIn("line 4: skipped, duplicate barcode '000000000002'", result.output)
+        self.assertIn("line 5: skipped, invalid price 'abc'", result.output)
+        self.assertEqual(Item.query.count(), 3)
+        self.assertEqual([item.name for item in search_unsold_items("bluetooth")], ["Speaker"])
+
+    def test_import_jsonl(self):
+        """
+        Test that JSON Lines files are imported and malformed lines are reported.
+        """
+        path = self.write('items.jsonl', '{"name": "Mouse", "price": 15, "barcode": "000000000006", '
+                '"description": "Optical mouse"}\nnot json\n')
+        result = self.runner.invoke(args=['items', 'import', path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Done: 1 imported, 1 skipped", result.output)
+        self.assertEqual(Item.query.filter_by(name="Mouse").first().description_hash,
+                Item.hash_description("Optical mouse"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+from flask import g
+from sqlalchemy import create_engine, text
+from market import app as default_app, create_app, db, fragment_cache, gateway, hashing_pool
+from market.database import engine_options
+from market.models import Item, User, user_cache
+from market.payments import verification_worker
+
+
+class TestReadReplicaRouting(unittest.TestCase):
+    """
+    Test case class for the primary and replica session routing.
+    Two SQLite files stand in for the primary and the replica; they hold different
+    items, so each test can tell which database served a query.
+    """
+    def setUp(self):
+        """
+        Set up an app whose replica is a second SQLite file, with the same user in
+        both databases and a different item in each.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        primary_url = f"sqlite:///{os.path.join(self.directory.name, 'primary.db')}"
+        replica_url = f"sqlite:///{os.path.join(self.directory.name, 'replica.db')}"
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'BCRYPT_LOG_ROUNDS': 4,
+            'FRAGMENT_CACHE_BACKEND': 'none',
+            'SQLALCHEMY_DATABASE_URI': primary_url,
+            'DATABASE_REPLICA_URL': replica_url,
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(User(id=1, username="buyer", email_address="buyer@example.com", password_hash="hashedpassword"))
+        db.session.add(Item(id=1, name="PrimaryItem", price=10, barcode="111111111111", description="On the primary"))
+        db.session.commit()
+        db.session.remove()
+
+        # The replica connections of the app are query-only, so it is seeded separately
+        self.replica = create_engine(replica_url)
+        db.metadata.create_all(self.replica)
+        with self.replica.begin() as connection:
+            connection.execute(User.__table__.insert(), {'id': 1, 'username': "buyer",
+                    'email_address': "buyer@example.com", 'password_hash': "hashedpassword"})
+            connection.execute(Item.__table__.insert(), {'id': 1, 'name': "ReplicaItem", 'price': 10,
+                    'barcode': "111111111111", 'description': "On the replica",
+                    'description_hash': Item.hash_description("On the replica")})
+
+    def tearDown(self):
+        """
+        Tear down the test environment and rebind the process-wide extensions to the default app.
+        """
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.replica.dispose()
+        self.app_context.pop()
+        for extension in (hashing_pool, gateway, fragment_cache, verification_worker):
+            extension.init_app(default_app)
+        user_cache.clear()
+        self.directory.cleanup()
+
+    def login(self):
+        """
+        Logs the test client in as the buyer.
+        """
+        with self.client.session_transaction() as session:
+            session['_user_id'] = '1'
+
+    def test_market_page_reads_replica(self):
+        """
+        Test that the market page is served from the replica.
+        """
+        response = self.client.get('/market')
+        self.assertIn(b"ReplicaItem", response.data)
+        self.assertNotIn(b"PrimaryItem", response.data)
+
+    def test_payment_page_reads_replica(self):
+        """
+        Test that the payment page loads the item from the replica.
+        """
+        self.login()
+        response = self.client.get('/payment/1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"ReplicaItem", response.data)
+
+    def test_register_writes_primary(self):
+        """
+        Test that registration checks and stores users on the primary.
+        """
+        response = self.client.post('/register', data={
+            'username': "newbuyer",
+            'email_address': "newbuyer@example.com",
+            'password1': "password123",
+            'password2': "password123"
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNotNone(User.query.filter_by(username="newbuyer").first())
+        with self.replica.connect() as connection:
+            self.assertIsNone(connection.execute(text("SELECT id FROM user WHERE username = 'newbuyer'")).first())
+
+    def test_session_reads_own_writes(self):
+        """
+        Test that a read-only request switches to the primary once it has written.
+        """
+        with self.app.test_request_context():
+            g.read_only = True
+            self.assertEqual(db.session.get(Item, 1).name, "ReplicaItem")
+            User(username="writer", email_address="writer@example.com", password_hash="hashedpassword").save()
+            db.session.expire_all()
+            self.assertEqual(db.session.get(Item, 1).name, "PrimaryItem")
+            self.assertEqual(User.query.filter_by(username="writer").count(), 1)
+
+    def test_engine_options(self):
+        """
+        Test that server databases get a pre-pinged, recycled pool and in-memory SQLite gets no pool options.
+        """
+        self.app.config['DATABASE_POOL_SIZE'] = 25
+        options = engine_options(self.app, 'postgresql://market@db.internal/market')
+        self.assertEqual(options['pool_size'], 25)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['pool_recycle'], 1800)
+        self.assertEqual(engine_options(self.app, 'sqlite://'), {})
+        self.assertNotIn('pool_pre_ping', engine_options(self.app, 'sqlite:////tmp/market.db'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+from market import create_app, db
+from market.export import export
+from market.models import Item, Payment, User
+
+
+class TestExport(unittest.TestCase):
+    """
+    Test case class for the catalogue and sales exports.
+    Two items are sold, one of them through a recorded Paystack payment, and one is unsold.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with an owner, sold and unsold items and a payment.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            'EXPORT_TOKEN': 'export-token',
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        owner = User(username="owner", email_address="owner@example.com", password_hash="hashedpassword")
+        db.session.add(owner)
+        db.session.commit()
+        db.session.add(Item(id=1, name="Laptop", price=1000, barcode="000000000001", description="A laptop", owner=owner.id))
+        db.session.add(Item(id=2, name="Mouse", price=20, barcode="000000000002", description="A mouse"))
+        db.session.add(Item(id=3, name="Cable", price=5, barcode="000000000003", description="A cable", owner=owner.id))
+        db.session.add(Payment(reference="purchase_1_1_7", item_id=1, user_id=owner.id, amount=100000,
+                               status=Payment.STATUS_SUCCESS))
+        db.session.commit()
+        db.session.remove()
+        self.headers = {'Authorization': 'Bearer export-token'}
+
+    def tearDown(self):
+        """
+        Tear down the test environment by clearing the session and dropping all tables.
+        """
+        db.session.remove()
+        db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def test_items_csv(self):
+        """
+        Test that the items export lists every item with its owner.
+        """
+        response = self.client.get('/export/items', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertIn('items.csv', response.headers['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([row['name'] for row in rows], ["Laptop", "Mouse", "Cable"])
+        self.assertEqual(rows[0]['owner_username'], "owner")
+        self.assertEqual(rows[1]['owner_id'], "")
+
+    def test_sales_jsonl_gzip(self):
+        """
+        Test that the sales export is gzipped on request and carries the payment of each sale.
+        """
+        response = self.client.get('/export/sales?format=jsonl&gzip=1', headers=self.headers)
+        self.assertEqual(response.mimetype, 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(response.data).decode('utf-8').splitlines()]
+        self.assertEqual([row['item_id'] for row in rows], [1, 3])
+        self.assertEqual(rows[0]['reference'], "purchase_1_1_7")
+        self.assertEqual(rows[0]['amount'], 100000)
+        self.assertIsNotNone(rows[0]['paid_at'])
+        self.assertIsNone(rows[1]['reference'])
+
+    def test_export_requires_token(self):
+        """
+        Test that exports need the bearer token and are disabled without one.
+        """
+        self.assertEqual(self.client.get('/export/items').status_code, 401)
+        self.assertEqual(self.client.get('/export/items', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        self.assertEqual(self.client.get('/export/items?format=xml', headers=self.headers).status_code, 400)
+        self.app.config['EXPORT_TOKEN'] = None
+        self.assertEqual(self.client.get('/export/items', headers=self.headers).status_code, 404)
+
+    def test_export_bypasses_identity_map(self):
+        """
+        Test that exporting builds no ORM objects and yields chunks of the requested size.
+        """
+        chunks = list(export('items', 'jsonl', chunk_size=100))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(len(db.session.identity_map), 0)
+
+    def test_cli_export(self):
+        """
+        Test that the CLI writes the same export to a gzipped file.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sales.csv.gz')
+            result = self.app.test_cli_runner().invoke(args=['export', 'sales', '--output', path])
+            self.assertEqual(result.exit_code, 0, result.output)
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                rows = list(csv.DictReader(file))
+        self.assertEqual([row['name'] for row in rows], ["Laptop", "Cable"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,12 @@
+import os
+import tempfile
 import unittest
-from market import app, db
+from market import create_app, db
 from market.models import User
 from market.forms import RegisterForm, LoginForm
 from flask import request
 from email_validator import EmailNotValidError
+from sqlalchemy import event
 
 
 class TestForms(unittest.TestCase):
@@ -15,11 +18,14 @@ class TestForms(unittest.TestCase):
         Sets up the testing environment by creating a new application instance, disabling CSRF protection,
         configuring a temporary SQLite database, and pushing the application context.
         """
-        app.config['TESTING'] = True
-        app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-        self.app = app.test_client()
-        self.app_context = app.app_context()
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
         self.app_context.push()
         db.create_all()
 
@@ -30,7 +36,10 @@ class TestForms(unittest.TestCase):
         """
         db.session.remove()
         db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
         self.app_context.pop()
+        self.directory.cleanup()
 
     def test_register_form_valid_data(self):
         """
@@ -51,6 +60,7 @@ class TestForms(unittest.TestCase):
         """
         Tests if the RegisterForm fails to validate when the username already exists in the database.
         """
+        user = User(username='JohnDoe', email_address='johndoe@example.com', password_hash='hashedpassword')
         db.session.add(user)
         db.session.commit()
                         
@@ -78,6 +88,28 @@ class TestForms(unittest.TestCase):
         self.assertFalse(form.validate())
         self.assertIn('Invalid email address:', form.email_address.errors[0])
 
+    def test_register_form_single_lookup(self):
+        """
+        Tests that the username and email address are checked against the users in one query.
+        """
+        user = User(username='JohnDoe', email_address='johndoe@example.com', password_hash='hashedpassword')
+        db.session.add(user)
+        db.session.commit()
+        statements = []
+
+        def record(connection, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            form = RegisterForm(username='JohnDoe', email_address='johndoe@Example.com',
+                                password1='password123', password2='password123')
+            self.assertFalse(form.validate())
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(len([statement for statement in statements if 'FROM user' in statement]), 1)
+        self.assertIn('Username already exists! Please try a different username.', form.username.errors)
+        self.assertIn('Email Address already exists! Please try a different email address.', form.email_address.errors)
+
     def test_login_form_valid_data(self):
         """
         Tests if the LoginForm validates successfully with valid data.
@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from market.gateway import PaystackClient, CircuitBreaker, CircuitOpenError, GatewayError
+from market.metrics import PAYSTACK_SECONDS
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from fake_paystack import FakePaystack  # noqa: E402
+
+
+class TestPaystackClient(unittest.TestCase):
+    """
+    Test case class for the pooled Paystack client.
+    Runs the client against the local fake Paystack server.
+    """
+    def setUp(self):
+        """
+        Start a fake Paystack server and point a client at it.
+        """
+        self.fake = FakePaystack(seed=1).start()
+        self.client = PaystackClient()
+        self.client.base_url = self.fake.url
+        self.client.timeout = (1, 1)
+        self.client.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    def tearDown(self):
+        """
+        Stop the fake Paystack server.
+        """
+        self.fake.stop()
+
+    def test_initialize_and_verify(self):
+        """
+        Test that an initialized transaction can be verified over the shared session.
+        """
+        verified = PAYSTACK_SECONDS.count(('verify', 'ok'))
+        response = self.client.initialize_transaction('purchase_1_1_1', 5000, 'a@example.com', 'http://cb')
+        self.assertTrue(response['status'])
+        response = self.client.verify_transaction('purchase_1_1_1')
+        self.assertEqual(response['data']['status'], 'success')
+        self.assertEqual(response['data']['amount'], 5000)
+        self.assertFalse(self.client.verify_transaction('unknown')['status'])
+        self.assertEqual(PAYSTACK_SECONDS.count(('verify', 'ok')), verified + 2)
+
+    def test_retries_then_opens_breaker(self):
+        """
+        Test that failing GET requests are retried and that repeated failures open the breaker.
+        """
+        self.fake.failure_rate = 1.0
+        with self.assertRaises(GatewayError):
+            self.client.verify_transaction('purchase_1_1_1')
+        self.assertEqual(self.fake.verify_calls, self.client.retries + 1)
+        with self.assertRaises(GatewayError):
+            self.client.verify_transaction('purchase_1_1_1')
+        calls = self.fake.verify_calls
+        with self.assertRaises(CircuitOpenError):
+            self.client.verify_transaction('purchase_1_1_1')
+        self.assertEqual(self.fake.verify_calls, calls)
+
+    def test_full_pool_does_not_queue(self):
+        """
+        Test that calls beyond the pool size run at once instead of waiting for a pooled connection.
+        """
+        self.client.pool_size = 1
+        self.fake.latency = 0.3
+        self.client.initialize_transaction('purchase_1_1_1', 5000, 'a@example.com', 'http://cb')
+        started = time.monotonic()
+        with ThreadPoolExecutor(4) as executor:
+            responses = list(executor.map(self.client.verify_transaction, ['purchase_1_1_1'] * 4))
+        self.assertTrue(all(response['status'] for response in responses))
+        self.assertLess(time.monotonic() - started, 2 * 0.3)
+
+    def test_unexpected_error_ends_trial_call(self):
+        """
+        Test that a trial call failing with an error other than a gateway error reopens the breaker.
+        """
+        self.client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        self.client.breaker.record_failure()
+        with mock.patch.object(self.client.session, 'request', side_effect=TypeError("unexpected")):
+            with self.assertRaises(TypeError):
+                self.client.verify_transaction('purchase_1_1_1')
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.client.verify_transaction('unknown')['status'])
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """
+    Test case class for the circuit breaker states.
+    """
+    def test_half_open_trial(self):
+        """
+        Test that an open breaker lets one trial call through after the reset timeout.
+        """
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import importlib.util
+import io
+import os
+import tempfile
+import unittest
+from market import create_app, db, images
+from market.images import is_image
+from market.models import Item
+
+HAS_PILLOW = importlib.util.find_spec('PIL') is not None
+
+
+def png(width=400, height=300):
+    """
+    Encodes a solid-colour PNG of the given size.
+    """
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class TestImagePipeline(unittest.TestCase):
+    """
+    Test case class for item images and their thumbnails.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with one item and an empty image folder.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            'CATALOGUE_TOKEN': 'catalogue-token',
+            'IMAGES_FOLDER': self.directory.name,
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.item = Item(name="Laptop", price=1000, barcode="123456789012", description="A laptop")
+        self.item.save()
+        self.headers = {'Authorization': 'Bearer catalogue-token', 'Content-Type': 'image/png'}
+
+    def tearDown(self):
+        """
+        Tear down the test environment and wait for the thumbnails being made.
+        """
+        images.wait_idle(30)
+        db.session.remove()
+        db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def test_signatures(self):
+        """
+        Test that uploads are recognised by their leading bytes without decoding them.
+        """
+        self.assertTrue(is_image(b'\xff\xd8\xff\xe0rest'))
+        self.assertTrue(is_image(b'RIFF\x00\x00\x00\x00WEBPVP8 '))
+        self.assertFalse(is_image(b'<svg xmlns="http://www.w3.org/2000/svg"/>'))
+
+    def test_upload_rejected(self):
+        """
+        Test that uploads need the token, an existing item and an image file.
+        """
+        url = f'/api/items/{self.item.id}/image'
+        self.assertEqual(self.client.put(url, data=b'\x89PNG\r\n\x1a\n').status_code, 401)
+        self.assertEqual(self.client.put('/api/items/999/image', data=b'', headers=self.headers).status_code, 404)
+        self.assertEqual(self.client.put(url, data=b'not an image', headers=self.headers).status_code, 400)
+        images.max_bytes, max_bytes = 16, images.max_bytes
+        self.app.config['IMAGES_MAX_BYTES'], config_max_bytes = 16, self.app.config['IMAGES_MAX_BYTES']
+        try:
+            self.assertEqual(self.client.put(url, data=b'\x89PNG\r\n\x1a\n' + b'0' * 64, headers=self.headers).status_code, 413)
+        finally:
+            images.max_bytes, self.app.config['IMAGES_MAX_BYTES'] = max_bytes, config_max_bytes
+        self.app.config['CATALOGUE_TOKEN'] = None
+        self.assertEqual(self.client.put(url, data=b'', headers=self.headers).status_code, 404)
+
+    @unittest.skipUnless(HAS_PILLOW, "Pillow is not installed")
+    def test_upload_makes_thumbnails(self):
+        """
+        Test that an upload is thumbnailed in the background, then shown and served as immutable.
+        """
+        response = self.client.put(f'/api/items/{self.item.id}/image', data=png(), headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+        key = response.get_json()['image']
+        self.assertTrue(images.wait_idle(60))
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Item, self.item.id).image, key)
+
+        response = self.client.get(f'/images/{key}-128.webp')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/webp')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        from PIL import Image
+        self.assertEqual(Image.open(io.BytesIO(response.data)).size, (128, 128))
+        response.close()
+        self.assertEqual(self.client.get(f'/images/{key}-64.jpg').mimetype, 'image/jpeg')
+        self.assertEqual(self.client.get(f'/images/{key}-100.jpg').status_code, 404)
+
+        page = self.client.get('/market').get_data(as_text=True)
+        self.assertIn(f'/images/{key}-64.webp 1x, /images/{key}-128.webp 2x', page)
+        self.assertIn('loading="lazy"', page)
+
+    @unittest.skipUnless(HAS_PILLOW, "Pillow is not installed")
+    def test_import_with_images(self):
+        """
+        Test that imported rows may name an image file next to the catalogue.
+        """
+        with open(os.path.join(self.directory.name, 'mouse.png'), 'wb') as file:
+            file.write(png(50, 80))
+        path = os.path.join(self.directory.name, 'catalogue.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write("name,price,barcode,description,image\n"
+                       "Mouse,20,000000000002,A mouse,mouse.png\n"
+                       "Cable,5,000000000003,A cable,\n"
+                       "Screen,90,000000000004,A screen,missing.png\n")
+        result = self.app.test_cli_runner().invoke(args=['items', 'import', path])
+        self.assertIn("Done: 2 imported, 1 skipped", result.output)
+        self.assertIn("line 4: skipped, cannot read image", result.output)
+        db.session.expire_all()
+        mouse = Item.query.filter_by(name="Mouse").one()
+        self.assertIsNotNone(mouse.image)
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, mouse.image[:2], f'{mouse.image}-320.jpg')))
+        self.assertIsNone(Item.query.filter_by(name="Cable").one().image)
+
+
+if __name__ == "__main__":
+    unittest.main()
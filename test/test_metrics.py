@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from market import create_app, db, hashing_pool
+from market.metrics import BCRYPT_SECONDS, Histogram, REQUESTS, SQL_QUERIES
+from market.models import Item
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Test case class for the request, SQL and bcrypt instrumentation.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with one item.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Item(name="Laptop", price=1000, barcode="123456789012", description="A laptop").save()
+
+    def tearDown(self):
+        """
+        Tear down the test environment by clearing the session and dropping all tables.
+        """
+        db.session.remove()
+        db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def test_metrics_endpoint(self):
+        """
+        Test that requests and their SQL statements are counted per endpoint and exposed on /metrics.
+        """
+        queries = SQL_QUERIES.value(('main.api_items',))
+        self.assertEqual(self.client.get('/api/items').status_code, 200)
+        self.assertGreater(SQL_QUERIES.value(('main.api_items',)), queries)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+        self.assertIn('# TYPE techieseller_request_duration_seconds histogram', body)
+        self.assertIn('techieseller_request_duration_seconds_bucket{endpoint="main.api_items",method="GET",le="+Inf"}',
+                      body)
+        self.assertIn('techieseller_requests_total{endpoint="main.api_items",method="GET",status="200"}', body)
+        self.assertIn('techieseller_sql_queries_total{endpoint="main.api_items"}', body)
+
+    def test_metrics_access(self):
+        """
+        Test that /metrics needs the token when one is set, and is otherwise served to local clients only.
+        """
+        self.assertEqual(self.client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'}).status_code, 403)
+        self.app.config['METRICS_TOKEN'] = 'metrics-token'
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer metrics-token'},
+                                environ_base={'REMOTE_ADDR': '203.0.113.7'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_methods_counted_as_other(self):
+        """
+        Test that request methods outside the known set share the 'other' label.
+        """
+        other = REQUESTS.value(('<unmatched>', 'other', '405'))
+        for method in ('FOO', 'BAR'):
+            self.assertEqual(self.client.open('/api/items', method=method).status_code, 405)
+        self.assertEqual(REQUESTS.value(('<unmatched>', 'other', '405')), other + 2)
+        self.assertNotIn('method="FOO"', self.client.get('/metrics').get_data(as_text=True))
+
+    def test_failed_statements_not_timed(self):
+        """
+        Test that a failing statement leaves no start time behind on its pooled connection.
+        """
+        for _ in range(3):
+            with self.assertRaises(OperationalError):
+                db.session.execute(text("SELECT * FROM no_such_table"))
+            db.session.rollback()
+        self.assertNotIn('metrics_started', db.session.connection().info)
+
+    def test_slow_request_log(self):
+        """
+        Test that requests over the threshold are logged with their SQL statements.
+        """
+        self.app.config['SLOW_REQUEST_SECONDS'] = 0
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            self.client.get('/api/items')
+        self.assertIn('Slow request: GET /api/items (main.api_items) 200', logs.output[0])
+        self.assertIn('FROM item', logs.output[0])
+
+    def test_bcrypt_timed(self):
+        """
+        Test that password hashing is recorded in the bcrypt histogram.
+        """
+        hashes = BCRYPT_SECONDS.count(('hash',))
+        hashing_pool.generate_password_hash('password123')
+        self.assertEqual(BCRYPT_SECONDS.count(('hash',)), hashes + 1)
+
+    def test_histogram_buckets(self):
+        """
+        Test that histogram buckets are cumulative and end with the total count.
+        """
+        histogram = Histogram('test_seconds', 'Test.', ('name',), buckets=(0.1, 1.0))
+        histogram.observe(('a',), 0.05)
+        histogram.observe(('a',), 0.5)
+        self.assertEqual(list(histogram.samples()), [
+            'test_seconds_bucket{name="a",le="0.1"} 1',
+            'test_seconds_bucket{name="a",le="1.0"} 2',
+            'test_seconds_bucket{name="a",le="+Inf"} 2',
+            'test_seconds_sum{name="a"} 0.55',
+            'test_seconds_count{name="a"} 2',
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
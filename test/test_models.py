@@ -1,8 +1,18 @@
+import hashlib
+import importlib.util
+import os
+import tempfile
+import threading
 import unittest
-from market import app, db
-from market.models import User, Item
+from market import create_app, db, hashing_pool
+from market.cache import FileSystemBackend
+from market.hashing import HashingPoolFull
+from market.models import User, Item, load_user, user_cache
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.exc import IntegrityError
 
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations', 'versions')
+
 class TestUserModel(unittest.TestCase):
     """
     Test case class for the User model.
@@ -13,9 +23,15 @@ class TestUserModel(unittest.TestCase):
         Set up a temporary test environment.
         This method is executed before each test method to create a new SQLite database for testing purposes.
         """
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db'
-        self.app = app.test_client()
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
         db.create_all()
 
     def tearDown(self):
@@ -25,6 +41,10 @@ class TestUserModel(unittest.TestCase):
         """
         db.session.remove()
         db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
 
     def test_create_user(self):
         """
@@ -71,7 +91,68 @@ class TestUserModel(unittest.TestCase):
         with self.assertRaises(ValueError):
             user = User(username="testuser", email_address="test@example.com", password="short")
 
-    
+    def test_rehash_on_login(self):
+        """
+        Test that a password hashed with an outdated cost factor is rehashed on a successful check.
+        """
+        user = User(username="testuser", email_address="test@example.com", password="password")
+        user.save()
+        old_rounds = hashing_pool.log_rounds
+        hashing_pool.log_rounds = 5
+        try:
+            self.assertFalse(user.check_password_correction("wrongpassword"))
+            self.assertTrue(user.password_hash.startswith("$2b$12$"))
+            self.assertTrue(user.check_password_correction("password"))
+            db.session.expire_all()
+            self.assertTrue(User.query.filter_by(username="testuser").first().password_hash.startswith("$2b$05$"))
+        finally:
+            hashing_pool.log_rounds = old_rounds
+
+    def test_hashing_pool_sheds_load(self):
+        """
+        Test that hashing jobs are rejected once all workers are busy and the queue is full.
+        """
+        release = threading.Event()
+        blockers = [threading.Thread(target=hashing_pool.run, args=(release.wait,))
+                    for _ in range(hashing_pool.workers + hashing_pool.max_queue)]
+        for blocker in blockers:
+            blocker.start()
+        try:
+            while hashing_pool._slots._value:
+                release.wait(0.01)
+            with self.assertRaises(HashingPoolFull):
+                User(username="testuser", email_address="test@example.com", password="password")
+        finally:
+            release.set()
+            for blocker in blockers:
+                blocker.join()
+
+    def test_load_user_cached(self):
+        """
+        Test that the session user loader only queries the database on a cache miss
+        and that saving the user drops the cached copy.
+        """
+        user = User(username="testuser", email_address="test@example.com", password_hash="hashedpassword")
+        user.save()
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.assertEqual(load_user(str(user.id)).username, "testuser")
+            self.assertEqual(load_user(str(user.id)).email_address, "test@example.com")
+            self.assertEqual(len(statements), 1)
+
+            user.username = "renamed"
+            user.save()
+            statements.clear()
+            self.assertEqual(load_user(str(user.id)).username, "renamed")
+            self.assertEqual(len(statements), 1)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+            user_cache.clear()
+        self.assertIsNone(load_user("not-a-number"))
+
+
 class TestItemModel(unittest.TestCase):
     """
     Test case class for the Item model.
@@ -82,9 +163,15 @@ class TestItemModel(unittest.TestCase):
         Set up a temporary test environment.
         This method is executed before each test method to create a new SQLite database for testing purposes.
         """
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db'
-        self.app = app.test_client()
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
         db.create_all()
 
     def tearDown(self):
@@ -94,6 +181,10 @@ class TestItemModel(unittest.TestCase):
         """
         db.session.remove()
         db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
 
     def test_create_item(self):
         """
@@ -123,6 +214,82 @@ class TestItemModel(unittest.TestCase):
         item = Item(name="TestItem", price=100, barcode="123456789012", description="Test description")
         self.assertEqual(str(item), "Item TestItem")
 
+    def test_description_hash(self):
+        """
+        Test that the description hash is set on insert and recomputed when the description changes.
+        """
+        item = Item(name="TestItem", price=100, barcode="123456789012", description="Test description")
+        item.save()
+        stored = db.session.scalar(text("SELECT description_hash FROM item WHERE id = :id"), {'id': item.id})
+        self.assertEqual(stored, hashlib.sha256(b"Test description").hexdigest())
+        item.description = "New description"
+        item.save()
+        stored = db.session.scalar(text("SELECT description_hash FROM item WHERE id = :id"), {'id': item.id})
+        self.assertEqual(stored, hashlib.sha256(b"New description").hexdigest())
+
+    def test_duplicate_description(self):
+        """
+        Test that two items with the same description hit the unique constraint on its hash.
+        """
+        Item(name="TestItem", price=100, barcode="123456789012", description="Test description").save()
+        with self.assertRaises(ValueError):
+            Item(name="OtherItem", price=100, barcode="123456789013", description="Test description").save()
+        db.session.add(Item(name="OtherItem", price=100, barcode="123456789013", description="Test description"))
+        with self.assertRaises(IntegrityError) as raised:
+            db.session.commit()
+        db.session.rollback()
+        self.assertIn("description_hash", str(raised.exception))
+
+    def test_description_hash_migration_backfills(self):
+        """
+        Test that the migration adding the description hash fills it in for existing items.
+        """
+        from alembic.migration import MigrationContext
+        from alembic.operations import Operations
+        spec = importlib.util.spec_from_file_location(
+                'index_item_listing', os.path.join(MIGRATIONS, 'c17251d405ff_index_item_listing_and_ownership.py'))
+        migration = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(migration)
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'old.db')}")
+            try:
+                with engine.begin() as connection:
+                    connection.execute(text(
+                        "CREATE TABLE item (id INTEGER NOT NULL, name VARCHAR(30) NOT NULL, "
+                        "price INTEGER NOT NULL, barcode VARCHAR(12) NOT NULL, description VARCHAR(1024) NOT NULL, "
+                        "owner INTEGER, PRIMARY KEY (id), UNIQUE (name), UNIQUE (barcode), UNIQUE (description))"))
+                    connection.execute(text("INSERT INTO item (name, price, barcode, description) VALUES "
+                                            "('Mouse', 20, '000000000001', 'A mouse'), "
+                                            "('Cable', 5, '000000000002', 'A cable')"))
+                    with Operations.context(MigrationContext.configure(connection)):
+                        migration.upgrade()
+                with engine.connect() as connection:
+                    hashes = dict(connection.execute(text("SELECT description, description_hash FROM item")).all())
+            finally:
+                engine.dispose()
+        self.assertEqual(hashes, {description: hashlib.sha256(description.encode('utf-8')).hexdigest()
+                                  for description in ("A mouse", "A cable")})
+
+
+
+class TestFragmentCache(unittest.TestCase):
+    """
+    Test case class for the fragment cache backends.
+    """
+    def test_filesystem_backend(self):
+        """
+        Test that the filesystem backend stores, expires and clears fragments.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            backend = FileSystemBackend(directory, ttl=60)
+            self.assertIsNone(backend.get("market:1"))
+            backend.set("market:1", "<table>₦100</table>")
+            self.assertEqual(backend.get("market:1"), "<table>₦100</table>")
+            backend.ttl = -1
+            self.assertIsNone(backend.get("market:1"))
+            backend.clear()
+            self.assertEqual(os.listdir(directory), [])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,160 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from market import create_app, db, hashing_pool, limiter
+from market.metrics import RATELIMIT_DECISIONS
+from market.models import User, user_cache
+from market.ratelimit import MemoryBackend, SQLiteBackend
+
+
+class TestTokenBuckets(unittest.TestCase):
+    """
+    Test case class for the token bucket backends.
+    """
+    def check_backend(self, backend):
+        """
+        Checks that a bucket allows its burst, then one attempt per refill interval.
+        """
+        self.assertEqual(backend.take('login:ip:a', 2, 10, now=100.0), 0)
+        self.assertEqual(backend.take('login:ip:a', 2, 10, now=100.0), 0)
+        self.assertAlmostEqual(backend.take('login:ip:a', 2, 10, now=100.0), 5.0)
+        self.assertEqual(backend.take('login:ip:b', 2, 10, now=100.0), 0)
+        self.assertAlmostEqual(backend.take('login:ip:a', 2, 10, now=104.0), 1.0)
+        self.assertEqual(backend.take('login:ip:a', 2, 10, now=105.0), 0)
+
+    def test_memory_backend(self):
+        """
+        Test the token buckets of the in-process backend.
+        """
+        self.check_backend(MemoryBackend())
+
+    def test_sqlite_backend_shared(self):
+        """
+        Test that the SQLite backend enforces one bucket across backends sharing the file, as workers do.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ratelimit.db')
+            self.check_backend(SQLiteBackend(path))
+            first, second = SQLiteBackend(path), SQLiteBackend(path)
+            first.clear()
+            self.assertEqual(first.take('register:ip:a', 1, 60, now=100.0), 0)
+            self.assertGreater(second.take('register:ip:a', 1, 60, now=100.0), 0)
+
+
+    def test_sqlite_backend_connects_per_process(self):
+        """
+        Test that the SQLite backend opens nothing until used and opens a new connection after a fork.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ratelimit.db')
+            backend = SQLiteBackend(path)
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(backend.take('login:ip:a', 1, 60, now=100.0), 0)
+            parent = backend._connection()
+            with mock.patch('market.ratelimit.os.getpid', return_value=os.getpid() + 1):
+                child = backend._connection()
+                self.assertIsNot(child, parent)
+                self.assertGreater(backend.take('login:ip:a', 1, 60, now=100.0), 0)
+            parent.close()
+            child.close()
+
+
+class TestLoginThrottling(unittest.TestCase):
+    """
+    Test case class for the login and registration limits.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with one registered user and tight limits.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            'RATELIMIT_LOGIN_USERNAME': (2, 60),
+            'RATELIMIT_REGISTER_IP': (1, 60),
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        User(username="victim", email_address="victim@example.com", password_hash="hashedpassword").save()
+        limiter.clear()
+
+    def tearDown(self):
+        """
+        Tear down the test environment and refill the buckets.
+        """
+        limiter.clear()
+        db.session.remove()
+        db.drop_all()
+        user_cache.clear()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def login(self, username):
+        """
+        Posts a login attempt with a wrong password.
+        """
+        return self.client.post('/login', data={'username': username, 'password': "guess"})
+
+    def test_login_throttled_per_username(self):
+        """
+        Test that attempts over the username limit get 429 without a query or password check.
+        """
+        throttled = RATELIMIT_DECISIONS.value(('login', 'throttled'))
+        with mock.patch.object(hashing_pool, 'check_password_hash', return_value=False):
+            self.assertEqual(self.login("victim").status_code, 200)
+            self.assertEqual(self.login("Victim").status_code, 200)
+
+        statements = []
+
+        def record(connection, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(Engine, 'before_cursor_execute', record)
+        try:
+            with mock.patch.object(hashing_pool, 'check_password_hash') as check:
+                response = self.login("victim")
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response.headers['Retry-After']), 0)
+        check.assert_not_called()
+        self.assertEqual(statements, [])
+        self.assertEqual(RATELIMIT_DECISIONS.value(('login', 'throttled')), throttled + 1)
+
+        # Other usernames still have attempts left
+        self.assertEqual(self.login("someoneelse").status_code, 200)
+
+    def test_register_throttled_per_ip(self):
+        """
+        Test that a client registering too often is turned away.
+        """
+        data = {'username': "newuser", 'email_address': "newuser@example.com",
+                'password1': "password123", 'password2': "password123"}
+        self.assertEqual(self.client.post('/register', data=data).status_code, 302)
+        data.update(username="otheruser", email_address="otheruser@example.com")
+        self.assertEqual(self.client.post('/register', data=data).status_code, 429)
+        self.assertIsNone(User.query.filter_by(username="otheruser").first())
+
+    def test_disabled(self):
+        """
+        Test that no attempt is throttled when rate limiting is disabled.
+        """
+        self.app.config['RATELIMIT_ENABLED'] = False
+        try:
+            with mock.patch.object(hashing_pool, 'check_password_hash', return_value=False):
+                for _ in range(4):
+                    self.assertEqual(self.login("victim").status_code, 200)
+        finally:
+            self.app.config['RATELIMIT_ENABLED'] = True
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
+from flask import g
+from market import create_app, db, gateway
+from market.gateway import CircuitBreaker, PaystackClient
+from market.models import Item, Payment, PaymentItem, User, utcnow
+from market.reconcile import reconcile_payments
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from fake_paystack import FakePaystack  # noqa: E402
+
+
+class TestReconcilePayments(unittest.TestCase):
+    """
+    Test case class for the reconciliation of unsettled payments.
+    Runs the reconciliation against the local fake Paystack server.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with a buyer, unsold items and a fake Paystack server.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            })
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.buyer = User(username="buyer", email_address="buyer@example.com", password_hash="hashedpassword")
+        self.buyer.save()
+        for i in range(1, 7):
+            db.session.add(Item(id=i, name=f"Item {i}", price=10 * i, barcode=f"{i:012d}", description=f"Item {i}"))
+        db.session.commit()
+        self.fake = FakePaystack(seed=1).start()
+        self.client = PaystackClient()
+        self.client.base_url = self.fake.url
+        self.client.timeout = (1, 1)
+        self.client.retries = 0
+        self.client.breaker = CircuitBreaker(failure_threshold=1000)
+
+    def tearDown(self):
+        """
+        Stop the fake Paystack server and drop all tables.
+        """
+        self.fake.stop()
+        db.session.remove()
+        db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def payment(self, item_id, status, age=timedelta(hours=1), paystack_status='success'):
+        """
+        Records a payment for an item and, unless `paystack_status` is None, its transaction at Paystack.
+        """
+        reference = f"purchase_{item_id}_{self.buyer.id}_{item_id}"
+        created_at = utcnow() - age
+        db.session.add(Payment(reference=reference, item_id=item_id, user_id=self.buyer.id, amount=1000 * item_id,
+                               status=status, created_at=created_at, updated_at=created_at))
+        db.session.commit()
+        if paystack_status is not None:
+            self.fake.add_transaction(reference, 1000 * item_id, paystack_status)
+        return reference
+
+    def reconcile(self, **kwargs):
+        """
+        Runs the reconciliation against the fake server and expires the session.
+        """
+        stats = reconcile_payments(verify=self.client.verify_transaction, concurrency=4, batch_size=2, **kwargs)
+        db.session.expire_all()
+        return stats
+
+    def status(self, reference):
+        return db.session.get(Payment, reference).status
+
+    def test_outcomes(self):
+        """
+        Test that each kind of outstanding payment is settled, failed or put back as Paystack reports.
+        """
+        paid = self.payment(1, Payment.STATUS_INITIALIZED)
+        errored = self.payment(2, Payment.STATUS_ERROR)
+        declined = self.payment(3, Payment.STATUS_INITIALIZED, paystack_status='failed')
+        abandoned = self.payment(4, Payment.STATUS_INITIALIZED, paystack_status='abandoned')
+        expired = self.payment(5, Payment.STATUS_INITIALIZED, age=timedelta(days=2), paystack_status='abandoned')
+        unknown = self.payment(6, Payment.STATUS_INITIALIZED, paystack_status=None)
+
+        stats = self.reconcile()
+        self.assertEqual(stats['claimed'], 6)
+        self.assertEqual(self.status(paid), Payment.STATUS_SUCCESS)
+        self.assertEqual(self.status(errored), Payment.STATUS_SUCCESS)
+        self.assertEqual(db.session.get(Item, 2).owner, self.buyer.id)
+        self.assertEqual(self.status(declined), Payment.STATUS_FAILED)
+        self.assertEqual(self.status(abandoned), Payment.STATUS_INITIALIZED)
+        self.assertEqual(self.status(expired), Payment.STATUS_FAILED)
+        self.assertEqual(self.status(unknown), Payment.STATUS_FAILED)
+        self.assertIsNone(db.session.get(Item, 3).owner)
+
+    def test_skips_recent_and_settled_payments(self):
+        """
+        Test that payments within the grace period, fresh pending ones and settled ones are left alone.
+        """
+        self.payment(1, Payment.STATUS_INITIALIZED, age=timedelta(minutes=1))
+        self.payment(2, Payment.STATUS_PENDING, age=timedelta(minutes=1))
+        self.payment(3, Payment.STATUS_SUCCESS)
+        stale = self.payment(4, Payment.STATUS_PENDING)
+        stats = self.reconcile()
+        self.assertEqual((stats['found'], stats['claimed']), (1, 1))
+        self.assertEqual(self.status(stale), Payment.STATUS_SUCCESS)
+        self.assertEqual(self.fake.verify_calls, 1)
+
+    def test_gateway_failures_left_as_errors(self):
+        """
+        Test that payments whose verification fails are left to be retried by the next run.
+        """
+        references = [self.payment(i, Payment.STATUS_INITIALIZED) for i in range(1, 5)]
+        self.fake.failure_rate = 1.0
+        stats = self.reconcile()
+        self.assertEqual(stats[Payment.STATUS_ERROR], 4)
+        self.fake.failure_rate = 0.0
+        stats = self.reconcile()
+        self.assertEqual(stats[Payment.STATUS_SUCCESS], 4)
+        self.assertEqual({self.status(reference) for reference in references}, {Payment.STATUS_SUCCESS})
+
+    def test_checkout_settled(self):
+        """
+        Test that an unsettled cart checkout is reconciled and hands over its items in one go.
+        """
+        created_at = utcnow() - timedelta(hours=1)
+        reference = f"checkout_{self.buyer.id}_7"
+        db.session.add(Payment(reference=reference, item_id=None, user_id=self.buyer.id, amount=3000,
+                               status=Payment.STATUS_INITIALIZED, created_at=created_at, updated_at=created_at,
+                               lines=[PaymentItem(item_id=1, price=10), PaymentItem(item_id=2, price=20)]))
+        db.session.commit()
+        self.fake.add_transaction(reference, 3000, 'success')
+        stats = self.reconcile()
+        self.assertEqual(stats[Payment.STATUS_SUCCESS], 1)
+        self.assertEqual({db.session.get(Item, 1).owner, db.session.get(Item, 2).owner}, {self.buyer.id})
+
+    def test_abandoned_payment_page_settled(self):
+        """
+        Test that a purchase started with the Pay Now button and never returned from is recorded and settled.
+        """
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(self.buyer.id)
+        g.pop('_login_user', None)
+        page = client.get('/payment/3').get_data(as_text=True)
+        self.assertIn("initiatePayment('/initialize-payment/3')", page)
+        with mock.patch.object(gateway, 'base_url', self.fake.url):
+            response = client.post('/initialize-payment/3')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['authorization_url'].startswith(self.fake.url))
+        payment = Payment.query.filter_by(item_id=3, user_id=self.buyer.id).one()
+        self.assertEqual(payment.status, Payment.STATUS_INITIALIZED)
+        payment.created_at = utcnow() - timedelta(hours=1)
+        db.session.commit()
+        stats = self.reconcile()
+        self.assertEqual(stats[Payment.STATUS_SUCCESS], 1)
+        self.assertEqual(self.status(payment.reference), Payment.STATUS_SUCCESS)
+        self.assertEqual(db.session.get(Item, 3).owner, self.buyer.id)
+
+    def test_verifies_concurrently(self):
+        """
+        Test that slow verifications overlap instead of running one after another.
+        """
+        for i in range(1, 7):
+            self.payment(i, Payment.STATUS_INITIALIZED)
+        self.fake.latency = 0.2
+        stats = self.reconcile()
+        self.assertEqual(stats[Payment.STATUS_SUCCESS], 6)
+        self.assertLess(stats['seconds'], 6 * 0.2)
+
+    def test_cli(self):
+        """
+        Test that the CLI reports what it reconciled.
+        """
+        api_url, self.app.config['PAYSTACK_API_URL'] = self.app.config['PAYSTACK_API_URL'], self.fake.url
+        try:
+            self.payment(1, Payment.STATUS_ERROR)
+            result = self.app.test_cli_runner().invoke(args=['payments', 'reconcile', '--concurrency', '2'])
+        finally:
+            self.app.config['PAYSTACK_API_URL'] = api_url
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("1 claimed, 1 success", result.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,545 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import time
+import unittest
+from unittest import mock
+from flask import g
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from market import create_app, db, gateway, fragment_cache
+from market.models import User, Item, Payment, CartItem, CatalogueVersion, user_cache, username_cache
+from market.search import search_unsold_items
+from market.payments import verification_worker
+
+
+class TestMarketRoutes(unittest.TestCase):
+    """
+    Test case class for the market listing routes.
+    Contains tests for the keyset-paginated market page and the JSON catalogue API.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with a handful of unsold items and one sold item.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        owner = User(username="owner", email_address="owner@example.com", password_hash="hashedpassword")
+        db.session.add(owner)
+        db.session.commit()
+        for i in range(5):
+            db.session.add(Item(name=f"Item{i}", price=100 + i, barcode=f"00000000000{i}", description=f"Description {i}"))
+        db.session.add(Item(name="SoldItem", price=50, barcode="999999999999", description="Sold", owner=owner.id))
+        db.session.commit()
+
+    def tearDown(self):
+        """
+        Tear down the test environment by clearing the session and dropping all tables.
+        """
+        db.session.remove()
+        db.drop_all()
+        fragment_cache.clear()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def test_unsold_page_cursor(self):
+        """
+        Test that pages follow each other through the cursor and never include sold items.
+        """
+        first, cursor = Item.unsold_page(limit=3)
+        self.assertEqual([item.name for item in first], ["Item0", "Item1", "Item2"])
+        second, cursor = Item.unsold_page(after=cursor, limit=3)
+        self.assertEqual([item.name for item in second], ["Item3", "Item4"])
+        self.assertIsNone(cursor)
+
+    def test_api_items(self):
+        """
+        Test that the JSON API returns a page of items and a cursor for the next page.
+        """
+        response = self.client.get('/api/items?limit=2')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual([item['name'] for item in data['items']], ["Item0", "Item1"])
+        self.assertEqual(set(data['items'][0]), {'id', 'name', 'price', 'barcode'})
+
+        response = self.client.get(f"/api/items?limit=10&after={data['next_cursor']}")
+        data = response.get_json()
+        self.assertEqual([item['name'] for item in data['items']], ["Item2", "Item3", "Item4"])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_market_page_paginated(self):
+        """
+        Test that the market page only renders the requested page of items.
+        """
+        self.app.config['ITEMS_PER_PAGE'] = 2
+        try:
+            response = self.client.get('/market')
+        finally:
+            self.app.config['ITEMS_PER_PAGE'] = 50
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Item1", response.data)
+        self.assertNotIn(b"Item2", response.data)
+        self.assertIn(b"Next page", response.data)
+        # The live filter of market.js reads these instead of the table cells
+        self.assertIn('<tr data-name="Item1" data-price="₦101" data-barcode="000000000001">'.encode(), response.data)
+
+    def test_market_page_uses_read_connections(self):
+        """
+        Test that the market page queries the read pool, whose connections cannot write.
+        """
+        statements = []
+
+        def record(connection, cursor, statement, *args):
+            statements.append(statement)
+        read_engine = db.engines['replica']
+        db.session.remove()  # Start like a fresh request, not a session that has written the items
+        event.listen(read_engine, 'before_cursor_execute', record)
+        try:
+            self.assertEqual(self.client.get('/market').status_code, 200)
+        finally:
+            event.remove(read_engine, 'before_cursor_execute', record)
+        self.assertTrue(any('FROM item' in statement for statement in statements))
+
+        self.assertEqual(db.session.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+        with read_engine.connect() as connection:
+            with self.assertRaises(OperationalError):
+                connection.execute(text("DELETE FROM item"))
+
+    def test_market_page_fragment_cached(self):
+        """
+        Test that a repeated market page request reuses the rendered table of available items.
+        """
+        self.client.get('/market')
+        with mock.patch.object(Item, 'unsold_page') as unsold_page:
+            response = self.client.get('/market')
+        unsold_page.assert_not_called()
+        self.assertIn(b"Item4", response.data)
+
+    def test_market_page_fragment_invalidated(self):
+        """
+        Test that new and sold items show up on the next market page request.
+        """
+        version = CatalogueVersion.current()
+        self.client.get('/market')
+        Item(name="NewItem", price=10, barcode="123123123123", description="Brand new").save()
+        self.assertGreater(CatalogueVersion.current(), version)
+        self.assertIn(b"NewItem", self.client.get('/market').data)
+
+        item = Item.query.filter_by(name="Item0").first()
+        buyer = User.query.filter_by(username="owner").first()
+        self.assertTrue(Item.transfer_ownership(item.id, buyer.id))
+        db.session.commit()
+        response = self.client.get('/market')
+        self.assertNotIn(b"Item0", response.data)
+
+    def test_all_items_streamed(self):
+        """
+        Test that the full item list is streamed in chunks and lists every unsold item.
+        """
+        self.app.config['STREAM_CHUNK_SIZE'] = 512
+        try:
+            response = self.client.get('/market/all', buffered=False)
+            self.assertTrue(response.is_streamed)
+            chunks = list(response.response)
+            response.close()
+        finally:
+            self.app.config['STREAM_CHUNK_SIZE'] = 16384
+        self.assertGreater(len(chunks), 2)
+        self.assertTrue(all(len(chunk) >= 512 for chunk in chunks[:-1]))
+        page = ''.join(chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in chunks)
+        for i in range(5):
+            self.assertIn(f"Item{i}", page)
+        self.assertNotIn("SoldItem", page)
+
+    def test_all_items_cart_form_carries_csrf_token(self):
+        """
+        Test that the cart forms of the all items page, which loads no market.js, post with their CSRF token.
+        """
+        owner = User.query.filter_by(username="owner").first()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(owner.id)
+        g.pop('_login_user', None)
+        self.app.config['WTF_CSRF_ENABLED'] = True
+        try:
+            page = self.client.get('/market/all').get_data(as_text=True)
+            form = re.search(r'<form method="POST" action="(/cart/add/\d+)" class="cart-form">\s*'
+                             r'<input type="hidden" name="csrf_token" value="([^"]+)">', page)
+            response = self.client.post(form.group(1), data={'csrf_token': form.group(2)}, follow_redirects=True)
+        finally:
+            self.app.config['WTF_CSRF_ENABLED'] = False
+        self.assertNotIn(b"Your request could not be verified", response.data)
+        self.assertEqual(CartItem.query.filter_by(user_id=owner.id).count(), 1)
+
+    def test_market_page_revalidated(self):
+        """
+        Test that an unchanged market page is answered with 304 until the catalogue changes.
+        """
+        response = self.client.get('/market')
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+        self.assertTrue(etag.startswith('W/'))
+        self.assertIn('Cookie', response.headers['Vary'])
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        with mock.patch.object(Item, 'unsold_page') as unsold_page:
+            response = self.client.get('/market', headers={'If-None-Match': etag})
+        unsold_page.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.client.get('/market', headers={'If-Modified-Since': last_modified}).status_code, 304)
+
+        Item(name="NewItem", price=10, barcode="123123123123", description="Brand new").save()
+        response = self.client.get('/market', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertIn(b"NewItem", response.data)
+
+    def test_revalidation_per_user(self):
+        """
+        Test that signing in changes the ETag and makes the page private.
+        """
+        etag = self.client.get('/home').headers['ETag']
+        self.assertNotIn('private', self.client.get('/home').headers['Cache-Control'])
+        owner = User.query.filter_by(username="owner").first()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(owner.id)
+        g.pop('_login_user', None) # The requests share the app context of the test
+        response = self.client.get('/home', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response.headers['Cache-Control'])
+        response = self.client.get('/payment/1', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'<meta name="csrf-token"', response.data)
+        self.assertEqual(self.client.get('/payment/1', headers={'If-None-Match': response.headers['ETag']}).status_code, 304)
+        # The CSRF token of a cached page is renewed before it expires
+        with mock.patch('market.conditional.time.time', return_value=time.time() + 3600):
+            self.assertEqual(self.client.get('/payment/1', headers={'If-None-Match': response.headers['ETag']}).status_code, 200)
+
+    def test_flash_messages_not_revalidated(self):
+        """
+        Test that a page with a pending flash message is rendered even if the client has it cached.
+        """
+        etag = self.client.get('/market').headers['ETag']
+        with self.client.session_transaction() as session:
+            session['_flashes'] = [('info', "Pending message")]
+        response = self.client.get('/market', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Pending message", response.data)
+
+
+class TestCheckUsername(unittest.TestCase):
+    """
+    Test case class for the username availability API.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with one registered user.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        User(username="taken", email_address="taken@example.com", password_hash="hashedpassword").save()
+
+    def tearDown(self):
+        """
+        Tear down the test environment by clearing the session, the caches and all tables.
+        """
+        db.session.remove()
+        db.drop_all()
+        username_cache.clear()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def test_check_username(self):
+        """
+        Test that taken, free and malformed usernames are reported.
+        """
+        self.assertFalse(self.client.get('/api/check-username?username=taken').get_json()['available'])
+        self.assertTrue(self.client.get('/api/check-username?username=free').get_json()['available'])
+        self.assertFalse(self.client.get('/api/check-username?username=no1').get_json()['available'])
+
+    def test_free_usernames_cached_until_registered(self):
+        """
+        Test that a free username is answered from the cache and dropped from it on registration.
+        """
+        self.assertTrue(User.is_username_available("newcomer"))
+        with mock.patch.object(db.session, 'scalar') as scalar:
+            self.assertTrue(User.is_username_available("newcomer"))
+        scalar.assert_not_called()
+        User(username="newcomer", email_address="newcomer@example.com", password_hash="hashedpassword").save()
+        self.assertFalse(User.is_username_available("newcomer"))
+
+
+class TestMarketSearch(unittest.TestCase):
+    """
+    Test case class for the full-text item search.
+    Contains tests for prefix and ranked matching and for keeping the index in sync with the items.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with a few searchable items.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Item(name="Wireless Earbuds", price=150, barcode="345678901234",
+                description="High-quality wireless earbuds with noise cancellation").save()
+        Item(name="Gaming Mouse", price=80, barcode="123456789012",
+                description="Wireless mouse with adjustable DPI").save()
+        Item(name="USB Cable", price=10, barcode="111111111111", description="Braided USB-C cable").save()
+
+    def tearDown(self):
+        """
+        Tear down the test environment by clearing the session and dropping all tables.
+        """
+        db.session.remove()
+        db.drop_all()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def test_prefix_and_ranked_match(self):
+        """
+        Test that partial words match and that items matching in more fields rank first.
+        """
+        results = search_unsold_items("wirel")
+        self.assertEqual([item.name for item in results], ["Wireless Earbuds", "Gaming Mouse"])
+        self.assertEqual([item.name for item in search_unsold_items("5678901")], [])
+        self.assertEqual([item.name for item in search_unsold_items("34567")], ["Wireless Earbuds"])
+
+    def test_operators_are_plain_text(self):
+        """
+        Test that FTS5 syntax typed by a user does not cause a query error.
+        """
+        self.assertEqual([item.name for item in search_unsold_items('"usb" (cable* -')], ["USB Cable"])
+        self.assertEqual(search_unsold_items("  "), [])
+
+    def test_index_follows_item_changes(self):
+        """
+        Test that renamed and sold items are reflected in search results.
+        """
+        cable = Item.query.filter_by(name="USB Cable").first()
+        cable.name = "Lightning Cable"
+        cable.save()
+        self.assertEqual(search_unsold_items("usb")[0].name, "Lightning Cable")
+        self.assertEqual(search_unsold_items("lightning")[0].name, "Lightning Cable")
+
+        user = User(username="buyer", email_address="buyer@example.com", password_hash="hashedpassword")
+        user.save()
+        cable.owner = user.id
+        cable.save()
+        self.assertEqual(search_unsold_items("lightning"), [])
+
+    def test_search_route(self):
+        """
+        Test that the search page only renders the matching items.
+        """
+        response = self.client.get('/market/search?q=mouse')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Gaming Mouse", response.data)
+        self.assertNotIn(b"USB Cable", response.data)
+
+
+class TestPaymentCallback(unittest.TestCase):
+    """
+    Test case class for the Paystack payment callback.
+    Contains tests ensuring each payment reference is verified and applied exactly once.
+    """
+    def setUp(self):
+        """
+        Set up a temporary test environment with a logged-in buyer and one unsold item.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.directory.name, 'market.db')}",
+            })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.buyer = User(username="buyer", email_address="buyer@example.com", password_hash="hashedpassword")
+        self.buyer.save()
+        self.item = Item(name="Laptop", price=1000, barcode="123456789012", description="A laptop")
+        self.item.save()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(self.buyer.id)
+        self.reference = f"purchase_{self.item.id}_{self.buyer.id}_42"
+        self.worker_settings = (verification_worker.max_attempts, verification_worker.backoff)
+        verification_worker.max_attempts, verification_worker.backoff = 2, 0.01
+
+    def tearDown(self):
+        """
+        Tear down the test environment by clearing the session and dropping all tables.
+        """
+        verification_worker.wait_idle(5)
+        verification_worker.max_attempts, verification_worker.backoff = self.worker_settings
+        db.session.remove()
+        db.drop_all()
+        user_cache.clear()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def verify_response(self, amount=100000, status='success'):
+        """
+        Builds a Paystack verify response.
+        """
+        return {'status': True, 'data': {'status': status, 'amount': amount}}
+
+    def callback(self, reference):
+        """
+        Calls the payment callback for the test item and waits for the background verification.
+        """
+        response = self.client.get(f'/payment-callback/{self.item.id}?reference={reference}')
+        self.assertTrue(verification_worker.wait_idle(5))
+        db.session.expire_all()
+        return response
+
+    def webhook(self, data, secret=None):
+        """
+        Posts a charge.success webhook signed with the given secret.
+        """
+        body = json.dumps({'event': 'charge.success', 'data': data}).encode('utf-8')
+        signature = hmac.new((secret or self.app.config['PAYSTACK_SECRET_KEY']).encode('utf-8'), body, hashlib.sha512).hexdigest()
+        return self.client.post('/paystack/webhook', data=body, content_type='application/json',
+                headers={'X-Paystack-Signature': signature})
+
+    def test_success_applied_once(self):
+        """
+        Test that a successful payment transfers the item and that replays do not call Paystack again.
+        """
+        with mock.patch.object(gateway, 'verify_transaction', return_value=self.verify_response()) as verify:
+            response = self.callback(self.reference)
+            self.assertEqual(response.status_code, 302)
+            self.assertIn(f'/payment-status/{self.reference}', response.headers['Location'])
+            self.callback(self.reference)
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual(db.session.get(Item, self.item.id).owner, self.buyer.id)
+        self.assertEqual(db.session.get(Payment, self.reference).status, Payment.STATUS_SUCCESS)
+
+    def test_reference_for_other_item_rejected(self):
+        """
+        Test that a reference issued for another item or user is rejected without calling Paystack.
+        """
+        with mock.patch.object(gateway, 'verify_transaction') as verify:
+            self.callback(f"purchase_{self.item.id + 1}_{self.buyer.id}_42")
+            self.callback("made_up_reference")
+        verify.assert_not_called()
+        self.assertIsNone(db.session.get(Item, self.item.id).owner)
+
+    def test_item_already_sold(self):
+        """
+        Test that a payment for an item sold in the meantime does not reassign it.
+        """
+        other = User(username="other", email_address="other@example.com", password_hash="hashedpassword")
+        other.save()
+        self.item.owner = other.id
+        self.item.save()
+        with mock.patch.object(gateway, 'verify_transaction', return_value=self.verify_response()):
+            self.callback(self.reference)
+        self.assertEqual(db.session.get(Item, self.item.id).owner, other.id)
+        self.assertEqual(db.session.get(Payment, self.reference).status, Payment.STATUS_SOLD_OUT)
+
+    def test_wrong_amount_fails(self):
+        """
+        Test that a payment for less than the item price does not transfer the item.
+        """
+        with mock.patch.object(gateway, 'verify_transaction', return_value=self.verify_response(amount=100)):
+            self.callback(self.reference)
+        self.assertIsNone(db.session.get(Item, self.item.id).owner)
+        self.assertEqual(db.session.get(Payment, self.reference).status, Payment.STATUS_FAILED)
+
+    def test_verify_error_is_retried(self):
+        """
+        Test that a failed verification call can be retried by a later callback.
+        """
+        with mock.patch.object(gateway, 'verify_transaction', side_effect=ConnectionError("timeout")) as verify:
+            self.callback(self.reference)
+        self.assertEqual(verify.call_count, 2)
+        self.assertEqual(db.session.get(Payment, self.reference).status, Payment.STATUS_ERROR)
+        with mock.patch.object(gateway, 'verify_transaction', return_value=self.verify_response()) as verify:
+            self.callback(self.reference)
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual(db.session.get(Item, self.item.id).owner, self.buyer.id)
+
+    def test_initialized_payment_claimed_by_callback(self):
+        """
+        Test that initializing records the reference first and that the callback then settles it.
+        """
+        started = {'status': True, 'data': {'authorization_url': 'https://checkout.paystack.com/x'}}
+        with mock.patch.object(gateway, 'initialize_transaction', return_value=started) as initialize:
+            response = self.client.post(f'/initialize-payment/{self.item.id}')
+        self.assertEqual(response.get_json()['status'], 'success')
+        reference = initialize.call_args.kwargs['reference']
+        self.assertEqual(db.session.get(Payment, reference).status, Payment.STATUS_INITIALIZED)
+        with mock.patch.object(gateway, 'verify_transaction', return_value=self.verify_response()):
+            self.callback(reference)
+        self.assertEqual(db.session.get(Payment, reference).status, Payment.STATUS_SUCCESS)
+        self.assertEqual(db.session.get(Item, self.item.id).owner, self.buyer.id)
+
+    def test_status_api(self):
+        """
+        Test that the status API reports a settled payment to its buyer only.
+        """
+        with mock.patch.object(gateway, 'verify_transaction', return_value=self.verify_response()):
+            self.callback(self.reference)
+        data = self.client.get(f'/api/payment-status/{self.reference}').get_json()
+        self.assertEqual(data['status'], Payment.STATUS_SUCCESS)
+        self.assertTrue(data['settled'])
+        self.assertEqual(self.client.get('/api/payment-status/purchase_1_99_1').status_code, 404)
+
+    def test_signed_webhook_settles_payment(self):
+        """
+        Test that a signed charge.success webhook transfers the item without calling Paystack.
+        """
+        data = {'reference': self.reference, 'status': 'success', 'amount': 100000}
+        with mock.patch.object(gateway, 'verify_transaction') as verify:
+            self.assertEqual(self.webhook(data).status_code, 200)
+        verify.assert_not_called()
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Item, self.item.id).owner, self.buyer.id)
+
+    def test_webhook_with_bad_signature_rejected(self):
+        """
+        Test that webhooks not signed with our secret key are ignored.
+        """
+        data = {'reference': self.reference, 'status': 'success', 'amount': 100000}
+        self.assertEqual(self.webhook(data, secret='wrong').status_code, 401)
+        self.assertIsNone(db.session.get(Payment, self.reference))
+
+
+if __name__ == "__main__":
+    unittest.main()